@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark the full message pipeline by replaying a recording offline.
+
+Reports messages/sec, end-to-end latency percentiles, per-stage timings and
+peak RSS, and saves the results as JSON so runs can be compared between
+versions:
+
+    python benchmark.py --generate 300 --ocr-stub
+    python benchmark.py --recording recordings/group.jsonl --baseline bench_results/previous.json
+"""
+import argparse
+import asyncio
+import functools
+import json
+import math
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from log_setup import configure_logging, shutdown_logging
+from metrics import REGISTRY
+from replay import StubTemuServer, build_replay_monitor, generate_recording, load_recording
+
+RESULTS_DIR = Path("bench_results")
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(durations):
+    """Summarize durations in seconds as count/total and millisecond percentiles."""
+    return {
+        'count': len(durations),
+        'total_s': round(sum(durations), 4),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3) if durations else 0.0,
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def current_rss_mb():
+    """Current resident set size of this process in megabytes (peak RSS where unavailable)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+class StageTimer:
+    """Wraps methods on live objects to record how long each call takes."""
+
+    def __init__(self):
+        self.durations = {}
+
+    def record(self, stage, seconds):
+        self.durations.setdefault(stage, []).append(seconds)
+
+    def wrap(self, obj, attr, stage):
+        """Replace ``obj.attr`` with a timed version (sync or async)."""
+        original = getattr(obj, attr)
+
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - started)
+        else:
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - started)
+
+        setattr(obj, attr, timed)
+
+    def report(self):
+        return {stage: summarize(durations) for stage, durations in sorted(self.durations.items())}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+async def run_benchmark(records, ocr_stub=False, latency=0.0):
+    """
+    Replay ``records`` through TelegramGroupMonitor and measure it.
+
+    Returns:
+        Dictionary of benchmark results
+    """
+    timer = StageTimer()
+    latencies = []
+
+    with tempfile.TemporaryDirectory(prefix="replay_images_") as images_dir, StubTemuServer() as server:
+        monitor, client, titles = build_replay_monitor(
+            records, images_dir, server.url, ocr_stub=ocr_stub, latency=latency
+        )
+        server.titles.update(titles)
+
+        # Load the OCR engine before the clock starts; model load is reported separately
+        started = time.perf_counter()
+        processor = monitor.get_image_processor()
+        ocr_init_s = time.perf_counter() - started
+
+        timer.wrap(client, 'get_messages', 'get_messages')
+        timer.wrap(client, 'download_media', 'download_media')
+        timer.wrap(client, 'send_file', 'send_file')
+        timer.wrap(processor, 'process_image', 'process_image')
+        timer.wrap(monitor.keyword_extractor, 'extract_first_keyword', 'extract_first_keyword')
+
+        # End-to-end latency runs from the start of the fetch that returned a message
+        # until the pipeline has finished with it
+        process_message = monitor.process_message
+
+        async def timed_process_message(message, send=True):
+            await process_message(message, send=send)
+            latencies.append(time.perf_counter() - client.last_fetch_started)
+
+        monitor.process_message = timed_process_message
+
+        started = time.perf_counter()
+        while not client.exhausted:
+            await monitor.fetch_recent_messages()
+        elapsed = time.perf_counter() - started
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'ocr_stub': ocr_stub, 'latency_s': latency},
+        'messages': len(latencies),
+        'images_sent': sum(len(file) if isinstance(file, list) else 1 for _, file in client.sent),
+        'elapsed_s': round(elapsed, 4),
+        'messages_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency': summarize(latencies),
+        'stages': timer.report(),
+        'metrics': REGISTRY.snapshot(),
+        'ocr_init_s': round(ocr_init_s, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results against a baseline run.
+
+    Returns:
+        List of regression descriptions (empty when within tolerance)
+    """
+    regressions = []
+    if results['messages_per_sec'] < baseline['messages_per_sec'] * (1 - tolerance):
+        regressions.append(
+            f"throughput {results['messages_per_sec']} msg/s < baseline {baseline['messages_per_sec']} msg/s"
+        )
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        current, previous = results['latency'][key], baseline['latency'][key]
+        if previous and current > previous * (1 + tolerance):
+            regressions.append(f"latency {key} {current} > baseline {previous}")
+    if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {results['peak_rss_mb']} MB > baseline {baseline['peak_rss_mb']} MB")
+    return regressions
+
+
+def print_report(results):
+    print(f"Messages:        {results['messages']} ({results['images_sent']} images sent)")
+    print(f"Elapsed:         {results['elapsed_s']}s")
+    print(f"Throughput:      {results['messages_per_sec']} msg/s")
+    latency = results['latency']
+    print(f"Latency:         p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms")
+    print(f"OCR init:        {results['ocr_init_s']}s")
+    print(f"Peak RSS:        {results['peak_rss_mb']} MB")
+    print("Stages:")
+    for stage, stats in results['stages'].items():
+        print(f"  {stage:<24} n={stats['count']:<6} mean {stats['mean_ms']}ms  "
+              f"p95 {stats['p95_ms']}ms  total {stats['total_s']}s")
+
+
+def find_images(images_dir):
+    images_dir = Path(images_dir)
+    return sorted(p for p in images_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay benchmark for the message pipeline')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--recording', help='JSON Lines recording to replay')
+    source.add_argument('--generate', type=int, metavar='N',
+                        help='Generate a synthetic recording of N messages from --images-dir')
+    parser.add_argument('--images-dir', default='group_images',
+                        help='Screenshots used for generated recordings (default: group_images)')
+    parser.add_argument('--ocr-stub', action='store_true',
+                        help='Use recorded store names instead of running EasyOCR')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Simulated Telegram round trip in seconds (default: 0)')
+    parser.add_argument('--output', help='Where to save the JSON results (default: bench_results/<timestamp>.json)')
+    parser.add_argument('--baseline', help='Previous results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Allowed regression against the baseline as a fraction (default: 0.10)')
+    parser.add_argument('--verbose', action='store_true', help='Show the pipeline output while replaying')
+    args = parser.parse_args()
+
+    if args.recording:
+        records = load_recording(args.recording)
+    else:
+        # Corpora from synthetic_screenshots.py carry the true store names
+        labels_file = Path(args.images_dir) / 'labels.json'
+        store_names = None
+        if labels_file.exists():
+            with labels_file.open('r') as f:
+                store_names = {str(Path(args.images_dir) / name): label
+                               for name, label in json.load(f).items()}
+        records = generate_recording(find_images(args.images_dir), args.generate, store_names=store_names)
+
+    # Pipeline logging goes through the same non-blocking handler as in production
+    configure_logging(level='DEBUG' if args.verbose else 'WARNING')
+    results = asyncio.run(run_benchmark(records, ocr_stub=args.ocr_stub, latency=args.latency))
+    shutdown_logging()
+    print_report(results)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open('w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
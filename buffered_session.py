@@ -0,0 +1,238 @@
+"""
+Telethon session kept in memory and written to its SQLite file in batches.
+
+Telethon's SQLiteSession writes entities, update states and sent-file hashes
+to the session database while messages are handled. The session lives in the
+bind-mounted project directory, where fsync-heavy SQLite commits are slow.
+``BufferedSession`` loads the same ``<name>.session`` file into memory and
+writes only the rows that changed. The writes happen at most every
+``flush_interval`` seconds, in a background thread, and once more when the
+client disconnects. Login changes (auth key, data center) are written right
+away. The file format is unchanged, so sessions can be switched back to
+plain SQLite at any time.
+
+Every read and write of the file holds an exclusive ``flock`` on
+``<name>.session.lock``, so the bot, select_group.py and setup_session.py
+can use one session at the same time. Writes are row upserts of this
+process's own changes, so one process never overwrites rows it did not
+change, such as another process's login.
+
+``open_session`` picks the storage from ``$SESSION_STORAGE``: ``buffered``
+(default) or ``sqlite`` for Telethon's own session.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from telethon import types
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.sessions.memory import _SentFileType
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; SQLite's own locking still applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORAGE_ENV = "SESSION_STORAGE"
+SESSION_FLUSH_INTERVAL_ENV = "SESSION_FLUSH_INTERVAL"
+
+# Seconds between batched writes of entities and update states
+DEFAULT_FLUSH_INTERVAL = 60.0
+
+EXTENSION = '.session'
+
+
+def open_session(session_name='session_name'):
+    """
+    The session to pass to TelegramClient for ``session_name``.
+
+    Returns:
+        A BufferedSession, or the name itself (Telethon's SQLiteSession) when
+        $SESSION_STORAGE is ``sqlite``
+    """
+    if os.getenv(SESSION_STORAGE_ENV, 'buffered').lower() == 'sqlite':
+        return session_name
+    interval = float(os.getenv(SESSION_FLUSH_INTERVAL_ENV, DEFAULT_FLUSH_INTERVAL))
+    return BufferedSession(session_name, flush_interval=interval)
+
+
+class BufferedSession(MemorySession):
+    """MemorySession loaded from and flushed to a Telethon SQLite session file."""
+
+    def __init__(self, session_id, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """
+        Args:
+            session_id: Session name or path, with or without the .session extension
+            flush_interval: Seconds between batched writes of changed rows
+        """
+        super().__init__()
+        self.filename = session_id if session_id.endswith(EXTENSION) else session_id + EXTENSION
+        self.flush_interval = flush_interval
+        self.flushes = 0
+
+        # Rows changed since the last flush; swapped out under _dirty_lock when flushing
+        self._dirty_lock = threading.Lock()
+        self._dirty_entities = {}
+        self._dirty_files = {}
+        self._dirty_states = {}
+        self._session_dirty = False
+
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.filename + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._file_lock():
+            # SQLiteSession creates (or upgrades) the file and reads the login
+            disk = SQLiteSession(self.filename)
+            try:
+                self._dc_id, self._server_address, self._port = disk.dc_id, disk.server_address, disk.port
+                self._auth_key, self._takeout_id = disk.auth_key, disk.takeout_id
+                c = disk._cursor()
+                try:
+                    c.execute('select id, hash, username, phone, name from entities')
+                    self._entities = set(c.fetchall())
+                    c.execute('select md5_digest, file_size, type, id, hash from sent_files')
+                    for md5_digest, file_size, kind, file_id, file_hash in c.fetchall():
+                        self._files[(md5_digest, file_size, _SentFileType(kind))] = (file_id, file_hash)
+                    c.execute('select id, pts, qts, date, seq from update_state')
+                    for entity_id, pts, qts, date, seq in c.fetchall():
+                        date = datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc)
+                        self._update_states[entity_id] = types.updates.State(pts, qts, date, seq, unread_count=0)
+                finally:
+                    c.close()
+            finally:
+                disk.close()
+
+    # Login details are written through immediately
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._mark_session_dirty()
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self._mark_session_dirty()
+
+    @MemorySession.takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self._mark_session_dirty()
+
+    def _mark_session_dirty(self):
+        with self._dirty_lock:
+            self._session_dirty = True
+
+    # Entities, update states and file hashes are buffered
+
+    def process_entities(self, tlo):
+        rows = set(self._entities_to_rows(tlo)) - self._entities
+        if not rows:
+            return
+        self._entities |= rows
+        with self._dirty_lock:
+            for row in rows:
+                self._dirty_entities[row[0]] = row
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        with self._dirty_lock:
+            self._dirty_states[entity_id] = state
+
+    def cache_file(self, md5_digest, file_size, instance):
+        super().cache_file(md5_digest, file_size, instance)
+        key = (md5_digest, file_size, _SentFileType.from_type(type(instance)))
+        with self._dirty_lock:
+            self._dirty_files[key] = self._files[key]
+
+    def save(self):
+        """
+        Called by Telethon after logins and about once a minute.
+
+        Login changes are written right away. Other changes are written in a
+        background thread once ``flush_interval`` has passed since the last write.
+        """
+        if self._session_dirty:
+            self.flush()
+        elif (self._dirty_entities or self._dirty_states or self._dirty_files) and \
+                time.monotonic() - self._last_flush >= self.flush_interval and not self._flush_lock.locked():
+            threading.Thread(target=self.flush, name="session-flush", daemon=True).start()
+
+    def close(self):
+        self.flush()
+
+    def delete(self):
+        for path in (self.filename, self.filename + '.lock'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return True
+
+    def flush(self):
+        """Write every change since the last flush to the session file in one transaction."""
+        with self._flush_lock:
+            with self._dirty_lock:
+                entities, files, states = self._dirty_entities, self._dirty_files, self._dirty_states
+                session_dirty = self._session_dirty
+                self._dirty_entities, self._dirty_files, self._dirty_states = {}, {}, {}
+                self._session_dirty = False
+            self._last_flush = time.monotonic()
+            if not (entities or files or states or session_dirty):
+                return
+            try:
+                self._write(entities, files, states, session_dirty)
+                self.flushes += 1
+            except Exception as e:
+                logger.error("Error writing session %s: %s", self.filename, e)
+                # Keep the rows for the next flush unless newer ones replaced them
+                with self._dirty_lock:
+                    self._dirty_entities = {**entities, **self._dirty_entities}
+                    self._dirty_files = {**files, **self._dirty_files}
+                    self._dirty_states = {**states, **self._dirty_states}
+                    self._session_dirty = self._session_dirty or session_dirty
+
+    def _write(self, entities, files, states, session_dirty):
+        with self._file_lock():
+            disk = SQLiteSession(self.filename)
+            try:
+                c = disk._cursor()
+                try:
+                    if session_dirty:
+                        disk._dc_id, disk._server_address, disk._port = self._dc_id, self._server_address, self._port
+                        disk._auth_key, disk._takeout_id = self._auth_key, self._takeout_id
+                        disk._update_session_table()
+                    now = int(time.time())
+                    c.executemany('insert or replace into entities values (?,?,?,?,?,?)',
+                                  [row + (now,) for row in entities.values()])
+                    c.executemany('insert or replace into sent_files values (?,?,?,?,?)',
+                                  [(md5_digest, file_size, kind.value, file_id, file_hash)
+                                   for (md5_digest, file_size, kind), (file_id, file_hash) in files.items()])
+                    c.executemany('insert or replace into update_state values (?,?,?,?,?)',
+                                  [(entity_id, state.pts, state.qts, state.date.timestamp(), state.seq)
+                                   for entity_id, state in states.items()])
+                finally:
+                    c.close()
+                disk.save()
+            finally:
+                disk.close()
+        logger.debug("Wrote %s entities, %s files and %s update states to %s",
+                     len(entities), len(files), len(states), self.filename)
@@ -0,0 +1,218 @@
+"""
+Shared state for monitor workers running in separate processes.
+
+Sharded workers (see sharding.py) coordinate through one SQLite database in
+WAL mode, so any number of local processes can read while one writes and
+every claim is a single atomic statement:
+
+- ``workers``: heartbeats; a worker is live while its heartbeat is recent
+- ``leases``: which worker monitors each chat, until the lease expires
+- ``messages``: messages already handled, so a chat taken over after a
+  failure is not processed twice
+- ``keywords``: every worker's keywords, so a share link seen in one chat
+  matches screenshots in the others
+- ``sent_keywords``: keywords already forwarded; claiming one before sending
+  guarantees no store is forwarded twice
+
+Like a single monitor's state, ``messages`` and ``keywords`` are bounded:
+every heartbeat prunes keywords older than the deferred OCR window and all
+but each chat's newest message IDs.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from deferred_ocr import DEFAULT_WINDOW
+
+logger = logging.getLogger(__name__)
+
+COORDINATION_DB_FILE = "coordination.db"
+
+# Handled message IDs kept per chat, and shared keywords matched at most
+# (telegram_client's MAX_SAVED_MESSAGE_IDS and MAX_PENDING_KEYWORDS)
+MAX_MESSAGES_PER_CHAT = 10000
+MAX_SHARED_KEYWORDS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, heartbeat REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (chat_id TEXT PRIMARY KEY, worker_id TEXT NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS messages (chat_id TEXT NOT NULL, message_id INTEGER NOT NULL, worker_id TEXT NOT NULL,
+                                     PRIMARY KEY (chat_id, message_id));
+CREATE TABLE IF NOT EXISTS keywords (keyword TEXT PRIMARY KEY, added REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS sent_keywords (keyword TEXT PRIMARY KEY, image TEXT, worker_id TEXT NOT NULL,
+                                          sent REAL NOT NULL);
+"""
+
+
+class CoordinationStore:
+    """SQLite database shared by the workers on one machine."""
+
+    def __init__(self, path=COORDINATION_DB_FILE, timeout: float = 10.0):
+        """
+        Args:
+            path: Database file, created on first use
+            timeout: Seconds a statement waits for another process's write lock
+        """
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    # Workers and chat leases
+
+    def heartbeat(self, worker_id: str):
+        self._execute("INSERT INTO workers VALUES (?, ?) ON CONFLICT(worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                      (worker_id, time.time()))
+
+    def remove_worker(self, worker_id: str):
+        """Drop a stopping worker and its leases so others take over immediately."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+                self._db.execute("DELETE FROM leases WHERE worker_id = ?", (worker_id,))
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def live_workers(self, ttl: float) -> List[str]:
+        """Workers with a heartbeat in the last ``ttl`` seconds."""
+        rows = self._execute("SELECT worker_id FROM workers WHERE heartbeat > ? ORDER BY worker_id",
+                             (time.time() - ttl,)).fetchall()
+        return [row[0] for row in rows]
+
+    def acquire_lease(self, chat_id, worker_id: str, ttl: float) -> bool:
+        """
+        Take or renew the lease on a chat.
+
+        Returns:
+            True if ``worker_id`` holds the lease for the next ``ttl`` seconds,
+            False while another worker's lease is unexpired
+        """
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(chat_id) DO UPDATE "
+            "SET worker_id = excluded.worker_id, expires = excluded.expires "
+            "WHERE leases.worker_id = excluded.worker_id OR leases.expires < ?",
+            (str(chat_id), worker_id, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def release_lease(self, chat_id, worker_id: str):
+        self._execute("DELETE FROM leases WHERE chat_id = ? AND worker_id = ?", (str(chat_id), worker_id))
+
+    def lease_holder(self, chat_id) -> Optional[str]:
+        """Worker holding an unexpired lease on a chat, or None."""
+        row = self._execute("SELECT worker_id FROM leases WHERE chat_id = ? AND expires >= ?",
+                            (str(chat_id), time.time())).fetchone()
+        return row[0] if row else None
+
+    # Deduplication
+
+    def claim_message(self, chat_id, message_id: int, worker_id: str) -> bool:
+        """Whether the caller is the first to handle this message."""
+        cursor = self._execute("INSERT OR IGNORE INTO messages VALUES (?, ?, ?)",
+                               (str(chat_id), int(message_id), worker_id))
+        return cursor.rowcount == 1
+
+    def register_keyword(self, keyword: str):
+        self._execute("INSERT INTO keywords VALUES (?, ?) ON CONFLICT(keyword) DO UPDATE SET added = excluded.added",
+                      (keyword, time.time()))
+
+    def keywords(self, max_age: Optional[float] = None, limit: Optional[int] = None) -> List[str]:
+        """Every worker's keywords of the last ``max_age`` seconds (the newest ``limit`` of them), oldest first."""
+        rows = self._execute("SELECT keyword FROM keywords WHERE added > ? ORDER BY added DESC LIMIT ?",
+                             (time.time() - max_age if max_age else 0, limit or -1)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def prune(self, keyword_max_age: float, messages_per_chat: int = MAX_MESSAGES_PER_CHAT):
+        """Forget keywords older than ``keyword_max_age`` seconds and all but each chat's newest messages."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM keywords WHERE added <= ?", (time.time() - keyword_max_age,))
+                self._db.execute(
+                    "DELETE FROM messages WHERE message_id <= (SELECT newer.message_id FROM messages AS newer "
+                    "WHERE newer.chat_id = messages.chat_id ORDER BY newer.message_id DESC LIMIT 1 OFFSET ?)",
+                    (messages_per_chat,))
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def claim_keyword(self, keyword: str, image: str, worker_id: str) -> bool:
+        """Claim a keyword for sending; False if any worker already sent (or is sending) it."""
+        cursor = self._execute("INSERT OR IGNORE INTO sent_keywords VALUES (?, ?, ?, ?)",
+                               (keyword, image, worker_id, time.time()))
+        return cursor.rowcount == 1
+
+    def release_keyword(self, keyword: str, worker_id: str):
+        """Give a claimed keyword back after its delivery failed."""
+        self._execute("DELETE FROM sent_keywords WHERE keyword = ? AND worker_id = ?", (keyword, worker_id))
+
+    def sent_keywords(self) -> dict:
+        """Keyword -> (image, worker) of every forwarded keyword."""
+        rows = self._execute("SELECT keyword, image, worker_id FROM sent_keywords").fetchall()
+        return {keyword: (image, worker_id) for keyword, image, worker_id in rows}
+
+
+class ShardCoordinator:
+    """
+    A worker's view of the CoordinationStore, as used by TelegramGroupMonitor.
+
+    Statements run in a thread: one waiting for another process's write lock
+    must not stall the event loop (and Telegram's keepalives with it).
+    """
+
+    def __init__(self, store: CoordinationStore, worker_id: str, keyword_refresh: float = 1.0,
+                 keyword_ttl: float = DEFAULT_WINDOW):
+        """
+        Args:
+            store: Shared database
+            worker_id: This worker's ID
+            keyword_refresh: Seconds the shared keyword list is cached between reads
+            keyword_ttl: Seconds a shared keyword is matched after it was registered
+                (the deferred OCR window)
+        """
+        self.store = store
+        self.worker_id = worker_id
+        self.keyword_refresh = keyword_refresh
+        self.keyword_ttl = keyword_ttl
+        self._keywords = []
+        self._keywords_read = 0.0
+
+    async def claim_message(self, chat_id, message_id) -> bool:
+        return await asyncio.to_thread(self.store.claim_message, chat_id, message_id, self.worker_id)
+
+    async def register_keyword(self, keyword):
+        await asyncio.to_thread(self.store.register_keyword, keyword)
+        self._keywords_read = 0.0
+
+    async def refresh_keywords(self):
+        """Read the shared keywords again if the cached list is older than keyword_refresh."""
+        if time.monotonic() - self._keywords_read > self.keyword_refresh:
+            self._keywords = await asyncio.to_thread(self.store.keywords, self.keyword_ttl, MAX_SHARED_KEYWORDS)
+            self._keywords_read = time.monotonic()
+
+    def keywords(self) -> List[str]:
+        """The shared keywords as of the last refresh_keywords()."""
+        return self._keywords
+
+    async def claim_keyword(self, keyword, image) -> bool:
+        return await asyncio.to_thread(self.store.claim_keyword, keyword, image, self.worker_id)
+
+    async def release_keyword(self, keyword):
+        await asyncio.to_thread(self.store.release_keyword, keyword, self.worker_id)
@@ -0,0 +1,106 @@
+"""
+Bounded, expiring queue of images whose OCR has been put off.
+
+A screenshot can only be forwarded when its store name matches a keyword, so
+while no keyword is waiting for a match the monitor downloads images but parks
+them here instead of running OCR. When a keyword arrives the parked images are
+OCR'd and matched oldest first; when the CPU is idle they are OCR'd ahead of
+time and keep their store name, so a later keyword matches them without any
+OCR. Images are dropped after ``window`` seconds, and the oldest are evicted
+beyond ``max_items``.
+"""
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ITEMS = 500
+DEFAULT_WINDOW = 30 * 60
+
+
+class DeferredImage:
+    """A parked image and, once OCR has run, its store name."""
+
+    __slots__ = ('filename', 'send', 'added', 'ocr_done', 'store_name')
+
+    def __init__(self, filename, send, added):
+        self.filename = filename
+        self.send = send
+        self.added = added
+        self.ocr_done = False
+        self.store_name = None
+
+
+class DeferredImages:
+    """Images waiting for a keyword, oldest first."""
+
+    def __init__(self, max_items=DEFAULT_MAX_ITEMS, window=DEFAULT_WINDOW):
+        """
+        Args:
+            max_items: Images kept at most; the oldest are evicted first
+            window: Seconds an image is kept waiting for a matching keyword
+        """
+        self.max_items = max_items
+        self.window = window
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, filename):
+        return filename in self._items
+
+    def put(self, filename, send=True):
+        """
+        Park an image.
+
+        Returns:
+            List of images evicted to stay within ``max_items``
+        """
+        self._items[filename] = DeferredImage(filename, send, time.monotonic())
+        evicted = []
+        while len(self._items) > self.max_items:
+            evicted.append(self._items.popitem(last=False)[1])
+        return evicted
+
+    def expire(self):
+        """Remove and return the images older than ``window``."""
+        cutoff = time.monotonic() - self.window
+        expired = []
+        while self._items:
+            oldest = next(iter(self._items.values()))
+            if oldest.added > cutoff:
+                break
+            expired.append(self._items.popitem(last=False)[1])
+        return expired
+
+    def items(self):
+        """Snapshot of the parked images, oldest first."""
+        return list(self._items.values())
+
+    def next_without_ocr(self):
+        """The oldest image OCR has not run on yet, or None."""
+        for item in self._items.values():
+            if not item.ocr_done:
+                return item
+        return None
+
+    def remove(self, filename):
+        self._items.pop(filename, None)
+
+    def snapshot(self):
+        """The parked images as JSON-serialisable dictionaries, with wall-clock times."""
+        offset = time.time() - time.monotonic()
+        return [{'filename': item.filename, 'send': item.send, 'added': item.added + offset,
+                 'ocr_done': item.ocr_done, 'store_name': item.store_name}
+                for item in self._items.values()]
+
+    def restore(self, entries):
+        """Park images saved by ``snapshot`` in an earlier process, keeping their age."""
+        offset = time.time() - time.monotonic()
+        for entry in sorted(entries, key=lambda entry: entry['added']):
+            item = DeferredImage(entry['filename'], entry.get('send', True), entry['added'] - offset)
+            item.ocr_done = entry.get('ocr_done', False)
+            item.store_name = entry.get('store_name')
+            self._items[item.filename] = item
+        self.expire()
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
@@ -0,0 +1,216 @@
+"""
+Delivery of matched screenshots to one or more Telegram targets.
+
+``DeliveryConfig`` decides who receives an image: routing rules map keyword
+patterns to targets, and keywords no rule matches go to the default targets.
+It is read from ``delivery_targets.json``, for example::
+
+    {
+      "default_targets": ["@imelda87541"],
+      "rules": [
+        {"keywords": ["crystal*", "lumi*"], "targets": ["@alice", "@bob"]}
+      ]
+    }
+
+``$DELIVERY_TARGETS`` (comma-separated) overrides the default targets.
+
+``DeliveryDispatcher`` sends to several targets at once with a bounded number
+of uploads in flight. Images for the same target that arrive within
+``coalesce_window`` seconds of each other are sent as one album (up to
+Telegram's 10 files), so a burst of matches costs one ``send_file`` call per
+target instead of one per image.
+"""
+import asyncio
+import fnmatch
+import logging
+import os
+from typing import Dict, List, Sequence
+
+from telethon.errors import AuthKeyError, TypeNotFoundError
+
+from metrics import STAGE_SECONDS, QUEUE_DEPTH
+from runtime_config import ResizableSemaphore
+from state_store import load_json
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_CONFIG_FILE = "delivery_targets.json"
+DELIVERY_TARGETS_ENV = "DELIVERY_TARGETS"
+DEFAULT_TARGETS = ('@imelda87541',)
+
+# Telegram albums hold at most 10 files
+MAX_ALBUM_SIZE = 10
+
+
+class DeliveryRule:
+    """Sends keywords matching any of ``keywords`` (case-insensitive globs) to ``targets``."""
+
+    def __init__(self, keywords: Sequence[str], targets: Sequence[str]):
+        self.keywords = [pattern.lower() for pattern in keywords]
+        self.targets = list(targets)
+
+    def matches(self, keyword: str) -> bool:
+        keyword = keyword.lower()
+        return any(fnmatch.fnmatchcase(keyword, pattern) for pattern in self.keywords)
+
+
+class DeliveryConfig:
+    """Delivery targets and per-keyword routing rules."""
+
+    def __init__(self, default_targets: Sequence[str] = DEFAULT_TARGETS,
+                 rules: Sequence[DeliveryRule] = ()):
+        """
+        Args:
+            default_targets: Usernames or chat IDs receiving keywords no rule matches
+            rules: Routing rules; a keyword goes to the targets of every rule it matches
+        """
+        self.default_targets = list(default_targets)
+        self.rules = list(rules)
+
+    @classmethod
+    def load(cls, path=DELIVERY_CONFIG_FILE):
+        """Load the configuration from ``path`` (if it exists) and $DELIVERY_TARGETS."""
+        return cls.from_dict((load_json(path, default={}) if path else None) or {})
+
+    @classmethod
+    def from_dict(cls, data):
+        """The configuration in ``data`` (the delivery_targets.json format); $DELIVERY_TARGETS still applies."""
+        default_targets = data.get('default_targets') or list(DEFAULT_TARGETS)
+        if os.getenv(DELIVERY_TARGETS_ENV):
+            default_targets = [target.strip() for target in os.getenv(DELIVERY_TARGETS_ENV).split(',')
+                               if target.strip()]
+        rules = [DeliveryRule(rule.get('keywords', []), [parse_target(target) for target in rule.get('targets', [])])
+                 for rule in data.get('rules', [])]
+        return cls([parse_target(target) for target in default_targets], rules)
+
+    def to_dict(self):
+        return {'default_targets': self.default_targets,
+                'rules': [{'keywords': rule.keywords, 'targets': rule.targets} for rule in self.rules]}
+
+    def targets_for(self, keyword: str) -> List:
+        """Targets an image matching ``keyword`` is delivered to, without duplicates."""
+        targets = []
+        for rule in self.rules:
+            if rule.matches(keyword):
+                targets.extend(target for target in rule.targets if target not in targets)
+        return targets or list(self.default_targets)
+
+
+def parse_target(target):
+    """Numeric chat IDs as ints (as Telethon expects), usernames unchanged."""
+    try:
+        return int(target)
+    except (TypeError, ValueError):
+        return target
+
+
+class DeliveryDispatcher:
+    """Concurrent, album-coalescing sender of images to Telegram targets."""
+
+    def __init__(self, client, reconnect=None, max_in_flight: int = 4,
+                 coalesce_window: float = 1.0, max_album: int = MAX_ALBUM_SIZE):
+        """
+        Args:
+            client: Telethon client (or the replay harness's fake)
+            reconnect: Coroutine function called once on connection errors before retrying
+            max_in_flight: Most ``send_file`` calls running at the same time
+            coalesce_window: Seconds a target's first image waits for more to join its album
+            max_album: Files per album; a full album is sent right away
+        """
+        self.client = client
+        self.reconnect = reconnect
+        self.coalesce_window = coalesce_window
+        self.max_album = max_album
+        self._semaphore = ResizableSemaphore(max_in_flight)
+        self._entities: Dict = {}
+        # target -> [(image path, future)] waiting to be sent as an album, and its window timer
+        self._pending: Dict = {}
+        self._timers: Dict = {}
+        self._sends = set()
+
+    def resize(self, max_in_flight: int):
+        """Change how many uploads run at once; uploads in flight finish undisturbed."""
+        self._semaphore.resize(max_in_flight)
+
+    async def deliver(self, target, image_path) -> bool:
+        """
+        Send ``image_path`` to ``target``, possibly as part of an album.
+
+        Returns:
+            Whether the image was delivered
+        """
+        return await self.submit(target, image_path)
+
+    def submit(self, target, image_path) -> asyncio.Future:
+        """Queue ``image_path`` for ``target``; the future resolves to whether it was delivered."""
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(target, [])
+        batch.append((image_path, future))
+        QUEUE_DEPTH.labels('delivery').inc()
+        if len(batch) >= self.max_album:
+            self._send_batch(target)
+        elif target not in self._timers:
+            self._timers[target] = asyncio.get_running_loop().call_later(
+                self.coalesce_window, self._send_batch, target)
+        return future
+
+    async def flush(self):
+        """Send every waiting batch now and wait until all sends have finished."""
+        for target in list(self._pending):
+            self._send_batch(target)
+        while True:
+            sending = [task for task in self._sends if not task.done()]
+            if not sending:
+                return
+            # wait() rather than gather(): cancelling the caller must not cancel the uploads
+            await asyncio.wait(sending)
+
+    def _send_batch(self, target):
+        timer = self._timers.pop(target, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(target, None)
+        if not batch:
+            return
+        QUEUE_DEPTH.labels('delivery').dec(len(batch))
+        task = asyncio.ensure_future(self._send(target, batch))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, target, batch):
+        paths = [path for path, _ in batch]
+        delivered = False
+        try:
+            async with self._semaphore:
+                delivered = await self._send_file(target, paths)
+        finally:
+            # Resolve every waiter, also when the send was cancelled
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(delivered)
+
+    async def _send_file(self, target, paths) -> bool:
+        # Albums go out as one call with a list of files; single images as before
+        files = paths if len(paths) > 1 else paths[0]
+        for attempt in range(2):
+            try:
+                entity = self._entities.get(target)
+                if entity is None:
+                    entity = self._entities[target] = await self.client.get_entity(target)
+                with STAGE_SECONDS.labels('send_file').time():
+                    await self.client.send_file(entity, files)
+                logger.info("Sent %s image(s) to %s", len(paths), target)
+                return True
+            except (TypeNotFoundError, AuthKeyError) as e:
+                if attempt or self.reconnect is None:
+                    logger.error("Still unable to send to %s after reconnection: %s", target, e)
+                    return False
+                logger.error("Send error for %s: %s. Attempting to reconnect...", target, e)
+                self._entities.clear()
+                if not await self.reconnect():
+                    logger.warning("Reconnection failed, skipping send to %s.", target)
+                    return False
+            except Exception as e:
+                logger.error("Error sending %s image(s) to %s: %s", len(paths), target, e)
+                return False
+        return False
@@ -11,6 +11,11 @@ class OCRError(Exception):
     pass
 
 
+class ConfigError(Exception):
+    """Raised when the runtime configuration is invalid."""
+    pass
+
+
 class DatabaseError(Exception):
     """Raised when database operations fail."""
     pass
@@ -0,0 +1,168 @@
+"""
+Perceptual signatures for spotting re-shared screenshots.
+
+The same store screenshot comes back re-compressed by Telegram, forwarded from
+another chat at a different resolution, or with its bottom cut off, so its
+bytes differ but it looks the same. A signature reduces the header of a
+screenshot (where the store name is) to:
+
+- a 256-bit difference hash (``dhash``): whether each cell of a 16x16 grid is
+  clearly brighter than its right neighbour. Re-compressed copies differ in a
+  few bits. Used to find candidates quickly.
+- a 96x48 grayscale thumbnail. Store headers share one layout and differ
+  mainly in the name, which is too small a part of the header to separate
+  reliably by hash distance, so candidates are confirmed by checking that
+  almost no thumbnail pixels differ strongly.
+
+The header is measured relative to the image width, so screenshots cropped at
+the bottom keep the same signature. Top or side crops shift the layout and are
+treated as new images, erring on the side of running OCR again.
+
+``PerceptualHashIndex`` remembers the OCR result per signature and finds hashes
+within a Hamming distance using multi-index hashing: the hash is split into
+``max_distance + 1`` chunks, and by the pigeonhole principle any hash within
+the distance matches at least one chunk exactly, so a lookup only compares
+against entries sharing a chunk. Entries expire after ``ttl`` seconds and the
+oldest are evicted beyond ``max_entries`` (about 5 KB each).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Grid size of the hash (HASH_SIZE * HASH_SIZE bits)
+HASH_SIZE = 16
+# Neighbouring cells must differ by more than this to set a bit, so flat
+# backgrounds hash to stable zeros instead of compression noise
+MIN_GRADIENT = 12
+# Header height as a fraction of the image width (the top quarter of a 9:19.5 phone screenshot)
+HEADER_ASPECT = 0.54
+# Thumbnail used to confirm a match
+THUMBNAIL_SIZE = (96, 48)
+# Pixels differing by more than PIXEL_THRESHOLD are "strongly different"; a
+# match allows at most MAX_DIFFERENT_FRACTION of them
+PIXEL_THRESHOLD = 64
+MAX_DIFFERENT_FRACTION = 0.004
+
+DEFAULT_MAX_DISTANCE = 12
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 2000
+
+
+def image_signature(image_path):
+    """
+    Compute the perceptual signature of an image's header.
+
+    Returns:
+        Tuple of (hash as an int of HASH_SIZE * HASH_SIZE bits, uint8 thumbnail array)
+    """
+    with Image.open(image_path) as img:
+        # Let the JPEG decoder produce a small grayscale image directly
+        img.draft('L', (THUMBNAIL_SIZE[0] * 2, THUMBNAIL_SIZE[0] * 2))
+        width, height = img.size
+        header = img.crop((0, 0, width, max(1, min(height, int(width * HEADER_ASPECT))))).convert('L')
+        thumbnail = np.asarray(header.resize(THUMBNAIL_SIZE, Image.BOX), dtype=np.uint8)
+    grid = np.asarray(Image.fromarray(thumbnail).resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX), dtype=np.int16)
+    bits = (grid[:, 1:] - grid[:, :-1]) > MIN_GRADIENT
+    image_hash = int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+    return image_hash, thumbnail
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def thumbnails_match(a, b):
+    """Whether two thumbnails show the same image (almost no strongly differing pixels)."""
+    different = np.abs(a.astype(np.int16) - b.astype(np.int16)) > PIXEL_THRESHOLD
+    return different.mean() <= MAX_DIFFERENT_FRACTION
+
+
+class PerceptualHashIndex:
+    """Time- and size-bounded map from image signature to result, with near-duplicate lookup."""
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, ttl=DEFAULT_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, bits=HASH_SIZE * HASH_SIZE):
+        """
+        Args:
+            max_distance: Largest hash Hamming distance considered a candidate
+            ttl: Seconds an entry is kept
+            max_entries: Entries kept at most; the oldest are evicted first
+            bits: Hash length in bits
+        """
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # Chunk boundaries for multi-index hashing
+        chunks = max_distance + 1
+        self._chunks = [(bits * i // chunks, bits * (i + 1) // chunks) for i in range(chunks)]
+        self._tables = [{} for _ in self._chunks]
+
+        # hash -> (thumbnail, value, added timestamp), oldest first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _chunk_values(self, image_hash):
+        for start, end in self._chunks:
+            yield (image_hash >> start) & ((1 << (end - start)) - 1)
+
+    def _remove(self, image_hash):
+        del self._entries[image_hash]
+        for table, chunk in zip(self._tables, self._chunk_values(image_hash)):
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(image_hash)
+                if not bucket:
+                    del table[chunk]
+
+    def _expire(self, now):
+        while self._entries:
+            oldest, (_, _, added) = next(iter(self._entries.items()))
+            if now - added <= self.ttl and len(self._entries) <= self.max_entries:
+                break
+            self._remove(oldest)
+
+    def add(self, signature, value):
+        """Remember ``value`` (e.g. the store name, or None for a rejected image) for a signature."""
+        image_hash, thumbnail = signature
+        now = time.monotonic()
+        with self._lock:
+            if image_hash in self._entries:
+                self._remove(image_hash)
+            self._entries[image_hash] = (thumbnail, value, now)
+            for table, chunk in zip(self._tables, self._chunk_values(image_hash)):
+                table.setdefault(chunk, set()).add(image_hash)
+            self._expire(now)
+
+    def find(self, signature):
+        """
+        Look up an earlier near-duplicate of an image.
+
+        Candidates within ``max_distance`` are tried closest first and the
+        first whose thumbnail matches is returned.
+
+        Returns:
+            Tuple of (found, value, hash distance); ``found`` is False when there is no near-duplicate
+        """
+        image_hash, thumbnail = signature
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            candidates = set()
+            for table, chunk in zip(self._tables, self._chunk_values(image_hash)):
+                candidates.update(table.get(chunk, ()))
+
+            scored = sorted((hamming_distance(image_hash, candidate), candidate) for candidate in candidates)
+            for distance, candidate in scored:
+                if distance > self.max_distance:
+                    break
+                candidate_thumbnail, value, _ = self._entries[candidate]
+                if thumbnails_match(thumbnail, candidate_thumbnail):
+                    return True, value, distance
+        return False, None, None
@@ -0,0 +1,183 @@
+"""
+Logging configuration for the bot.
+
+Log records are handed to a bounded in-memory queue and written to stdout by a
+background thread, so emitting a log never blocks the event loop on Docker's
+log driver; if the writer falls behind, records are dropped and counted rather
+than stalling the pipeline. Output is either human-readable text or JSON lines.
+
+Every record carries the correlation ID of the message being processed (see
+``correlation_context``), and high-volume events can be rate limited by
+passing ``extra={'rate_key': ...}``.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Correlation ID of the message currently flowing through the pipeline
+correlation_id = contextvars.ContextVar('correlation_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_STANDARD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s [%(correlation_id)s] %(message)s'
+
+_listener = None
+
+
+@contextmanager
+def correlation_context(value):
+    """Tag every log record emitted inside the block (including in worker threads) with ``value``."""
+    token = correlation_id.set(value)
+    try:
+        yield
+    finally:
+        correlation_id.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    """Adds the current correlation ID to each record."""
+
+    def filter(self, record):
+        if not hasattr(record, 'correlation_id'):
+            record.correlation_id = correlation_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token-bucket rate limit for records tagged with ``rate_key``.
+
+    Each key may emit ``burst`` records at once and ``rate`` records per second
+    after that. Suppressed records are counted and reported on the next record
+    that gets through.
+    """
+
+    def __init__(self, rate=5.0, burst=20):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'rate_key', None)
+        if key is None or self.rate <= 0:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', '-'),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key not in entry:
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text format, noting how many rate limited records were suppressed."""
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            text += f" (+{record.suppressed} similar suppressed)"
+        return text
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=None, json_format=None, rate=5.0, burst=20, queue_size=10000, stream=None):
+    """
+    Route all logging through a non-blocking queue to stdout.
+
+    Args:
+        level: Log level name (default: $LOG_LEVEL or INFO)
+        json_format: Emit JSON lines instead of text (default: $LOG_FORMAT == 'json')
+        rate: Records per second allowed for each rate limited event (0 disables limiting)
+        burst: Records a rate limited event may emit at once
+        queue_size: Maximum records buffered before new ones are dropped
+        stream: Output stream (default: sys.stdout)
+
+    Returns:
+        The queue handler installed on the root logger
+    """
+    global _listener
+
+    if level is None:
+        level = os.getenv('LOG_LEVEL', 'INFO')
+    if json_format is None:
+        json_format = os.getenv('LOG_FORMAT', 'text').lower() == 'json'
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    # Filters run in the emitting thread so the correlation ID is still in context
+    handler.addFilter(CorrelationFilter())
+    handler.addFilter(RateLimitFilter(rate=rate, burst=burst))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return handler
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,35 +1,266 @@
+# Must stay the first import: importing startup records the process start time
+# that --startup-profile measures the other imports against
+from startup import STARTUP  # isort: skip
 import asyncio
 import argparse
-from telegram_client import TelegramGroupMonitor
-from select_group import select_target_group
+from datetime import datetime
+# telegram_client and select_group are imported by the mode that needs them, so
+# --select-group never pays for the OCR/HTTP stack and the bot can connect while
+# the OCR engine loads in the background
+from metrics import MetricsServer
+from log_setup import configure_logging
+from profiler import RuntimeProfiler, LoopWatchdog
+import logging
+import multiprocessing
+import os
 import signal
-import sys
+import threading
 
-def signal_handler(sig, frame):
-    print('\nShutting down gracefully...')
-    sys.exit(0)
+logger = logging.getLogger(__name__)
+
+async def run_until_signalled(monitor, run, shutdown_timeout):
+    """
+    Run ``run`` (the monitor's start or backfill) until it finishes or SIGINT/SIGTERM arrives.
+
+    On a signal the monitor stops ingesting after the message it is processing.
+    Ingestion, queued OCR and deliveries in flight share ``shutdown_timeout``
+    seconds to finish before they are cancelled; the state and caches are saved
+    and the client disconnected either way. A second signal cancels ingestion
+    right away.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(run)
+    stop_requested = asyncio.Event()
+
+    def on_signal(sig):
+        if stop_requested.is_set():
+            logger.warning("Received %s again, cancelling in-flight work", sig.name)
+            task.cancel()
+            return
+        logger.info("Received %s, shutting down gracefully...", sig.name)
+        stop_requested.set()
+        monitor.request_stop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, on_signal, sig)
+        except NotImplementedError:
+            # No loop signal handlers on this platform
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(on_signal, signal.Signals(signum)))
+
+    stop_wait = asyncio.create_task(stop_requested.wait())
+    try:
+        await asyncio.wait({task, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+        deadline = loop.time() + shutdown_timeout
+        if not task.done():
+            await asyncio.wait({task}, timeout=shutdown_timeout)
+        if not task.done():
+            logger.warning("Ingestion did not stop within %ss, cancelling it", shutdown_timeout)
+            task.cancel()
+            await asyncio.wait({task})
+        await monitor.stop(timeout=max(0.0, deadline - loop.time()))
+    finally:
+        stop_wait.cancel()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except NotImplementedError:
+                pass
+    if not task.cancelled():
+        task.result()  # Re-raise anything the run failed with
+
+def forward_signal(sig):
+    """Send ``sig`` to every worker process, skipping any that exited meanwhile"""
+    for process in multiprocessing.active_children():
+        try:
+            os.kill(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+async def report_startup(monitor):
+    """Log the startup profile once the monitor is ingesting and the OCR engine is loaded"""
+    try:
+        await monitor.wait_until_ready()
+    except Exception as e:
+        logger.error("Startup did not complete: %s", e)
+    logger.info("Startup profile:\n%s", STARTUP.report())
 
 async def main():
     parser = argparse.ArgumentParser(description='Telegram User Bot')
-    parser.add_argument('--select-group', action='store_true', 
-                        help='Run in group selection mode to choose which group to monitor')
+    parser.add_argument('--select-group', nargs='?', const='', metavar='QUERY',
+                        help='Run in group selection mode to choose which group to monitor; with a name or ID '
+                             '(or part of one) the matching group is selected without prompting')
+    parser.add_argument('--refresh-dialogs', action='store_true',
+                        help='With --select-group, reload the chat list from Telegram instead of the cache')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Process the monitored group\'s message history, then exit')
+    parser.add_argument('--from-date', type=datetime.fromisoformat,
+                        help='Backfill messages sent after this date (YYYY-MM-DD[THH:MM])')
+    parser.add_argument('--from-id', type=int,
+                        help='Backfill messages after this message ID (default: resume from checkpoint)')
+    parser.add_argument('--page-size', type=int, default=500,
+                        help='Number of messages processed per backfill page (default: 500)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Maximum messages processed concurrently during backfill (default: 8)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Backfill only builds the keyword and OCR caches without sending anything')
+    parser.add_argument('--metrics-port', type=int, default=os.getenv('METRICS_PORT'),
+                        help='Serve Prometheus metrics on this local port (default: $METRICS_PORT, disabled if unset)')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='Address the metrics endpoint binds to (default: 127.0.0.1)')
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'INFO'),
+                        help='Minimum log level: DEBUG, INFO, WARNING or ERROR (default: $LOG_LEVEL or INFO)')
+    parser.add_argument('--log-json', action='store_true', default=os.getenv('LOG_FORMAT', '').lower() == 'json',
+                        help='Write logs as JSON lines (default: on when $LOG_FORMAT=json)')
+    parser.add_argument('--log-rate', type=float, default=5.0,
+                        help='Maximum log lines per second for high-volume events such as new messages (default: 5, 0 = unlimited)')
+    parser.add_argument('--profile-seconds', type=float,
+                        help='Capture a cProfile of the first N seconds (send SIGUSR1 to capture later)')
+    parser.add_argument('--profile-dir', default='profiles',
+                        help='Directory profiles are written to (default: profiles)')
+    parser.add_argument('--slow-callback-ms', type=float, default=os.getenv('SLOW_CALLBACK_MS'),
+                        help='Report anything blocking the event loop for longer than this (default: disabled)')
+    parser.add_argument('--asyncio-debug', action='store_true',
+                        help='Also enable asyncio debug mode and its slow-callback warnings (higher overhead)')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='Log a breakdown of import and initialization time once the bot is ready')
+    parser.add_argument('--shutdown-timeout', type=float, default=20,
+                        help='Seconds to finish in-flight OCR and sends on SIGINT/SIGTERM before cancelling them (default: 20)')
+    parser.add_argument('--ocr-server', default=os.getenv('OCR_SERVER'),
+                        help='Use a shared OCR server (unix:/path or http://host:port) instead of loading models '
+                             '(default: $OCR_SERVER; start one with ocr_server.py)')
+    parser.add_argument('--ocr-idle-timeout', type=float, default=os.getenv('OCR_IDLE_TIMEOUT'),
+                        help='Unload the OCR models after this many seconds without a screenshot '
+                             '(default: $OCR_IDLE_TIMEOUT, never if unset)')
+    parser.add_argument('--ocr-max-rss-mb', type=float, default=os.getenv('OCR_MAX_RSS_MB'),
+                        help='Unload the OCR models whenever resident memory exceeds this many MB '
+                             '(default: $OCR_MAX_RSS_MB, no ceiling if unset)')
+    parser.add_argument('--sessions',
+                        help='Comma-separated session names; runs one sharded worker process per session')
+    parser.add_argument('--chats',
+                        help='Comma-separated chat IDs split across the sharded workers (default: the selected group)')
+    parser.add_argument('--coordination-db', default='coordination.db',
+                        help='SQLite database the sharded workers coordinate through (default: coordination.db)')
+    parser.add_argument('--config',
+                        help='Runtime configuration reloaded while the bot runs, on change or SIGHUP '
+                             '(default: $RUNTIME_CONFIG or runtime_config.json)')
     args = parser.parse_args()
 
-    if args.select_group:
+    configure_logging(level=args.log_level, json_format=args.log_json, rate=args.log_rate)
+
+    if args.ocr_server:
+        # Read by every monitor, including those in sharded worker processes
+        os.environ['OCR_SERVER'] = args.ocr_server
+    # Read by every ImageProcessor (see model_lifecycle.py)
+    if args.ocr_idle_timeout:
+        os.environ['OCR_IDLE_TIMEOUT'] = str(args.ocr_idle_timeout)
+    if args.ocr_max_rss_mb:
+        os.environ['OCR_MAX_RSS_MB'] = str(args.ocr_max_rss_mb)
+
+    if args.metrics_port and args.select_group is None:
+        server = MetricsServer(int(args.metrics_port), host=args.metrics_host).start()
+        logger.info("Serving metrics on %s", server.url)
+
+    if args.select_group is None:
+        # Profiling: SIGUSR1 toggles a capture; --profile-seconds starts one right away
+        profiler = RuntimeProfiler(args.profile_dir, default_seconds=args.profile_seconds or 30)
+        profiler.install_signal_handler(asyncio.get_running_loop())
+        if args.profile_seconds:
+            profiler.start()
+        if args.slow_callback_ms:
+            LoopWatchdog(float(args.slow_callback_ms), asyncio_debug=args.asyncio_debug).start()
+
+    if args.select_group is not None:
         # Run in group selection mode
-        await select_target_group()
-    else:
-        # Set up signal handler for graceful shutdown
-        signal.signal(signal.SIGINT, signal_handler)
+        with STARTUP.phase('import select_group'):
+            from select_group import select_target_group
+        group_id = await select_target_group(args.select_group or None, refresh=args.refresh_dialogs)
+        if args.startup_profile:
+            logger.info("Startup profile:\n%s", STARTUP.report())
+        if group_id is None and args.select_group:
+            raise SystemExit(1)  # Non-interactive selection found no unique match
+        return
+
+    # Settings that can change without a restart (see runtime_config.py)
+    from exceptions import ConfigError
+    from runtime_config import ConfigWatcher
+    try:
+        watcher = ConfigWatcher(args.config)
+    except ConfigError as e:
+        logger.error("Invalid runtime configuration: %s", e)
+        raise SystemExit(1)
+    config = watcher.config
+
+    if args.sessions:
+        # Sharded mode: worker processes split the chats (see sharding.py) and
+        # each watches the runtime configuration itself
+        from sharding import run_shards
+        if args.chats:
+            chats = [chat.strip() for chat in args.chats.split(',') if chat.strip()]
+        else:
+            chats = config.monitored_chats
+        if not chats:
+            raise ValueError("No chats to monitor. Pass --chats or run 'python main.py --select-group' first.")
+        sessions = [session.strip() for session in args.sessions.split(',') if session.strip()]
+        loop = asyncio.get_running_loop()
+        # run_shards runs in a thread, which never sees a KeyboardInterrupt: SIGINT and
+        # SIGTERM set this event, and run_shards passes SIGTERM on to the workers
+        stopping = threading.Event()
 
-        # Create and start the Telegram group monitor
-        monitor = TelegramGroupMonitor()
+        def on_signal(sig):
+            logger.info("Received %s, stopping the workers...", sig.name)
+            stopping.set()
 
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, on_signal, sig)
+            except NotImplementedError:
+                signal.signal(sig, lambda signum, frame: on_signal(signal.Signals(signum)))
         try:
-            await monitor.start()
-        except KeyboardInterrupt:
-            print("\nStopping the client...")
-            await monitor.stop()
+            # Workers poll the files anyway; forwarding SIGHUP makes them reload right away
+            loop.add_signal_handler(signal.SIGHUP, forward_signal, signal.SIGHUP)
+        except (AttributeError, NotImplementedError):
+            pass
+        try:
+            await asyncio.to_thread(run_shards, chats, sessions, args.coordination_db, stopping=stopping,
+                                    log_level=args.log_level, log_json=args.log_json, config_file=str(watcher.path))
+        finally:
+            stopping.set()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(sig)
+                except NotImplementedError:
+                    pass
+        return
+
+    with STARTUP.phase('import telegram_client'):
+        from telegram_client import TelegramGroupMonitor
+
+    # Create the Telegram group monitor; SIGINT/SIGTERM shut it down gracefully
+    monitor = TelegramGroupMonitor(group_id=config.chats[0] if config.chats else None)
+    monitor.apply_config(config, follow_chats=False)
+    # Kept so the task is not garbage collected, and cancelled if startup never completes
+    report_task = asyncio.create_task(report_startup(monitor)) if args.startup_profile else None
+
+    if args.backfill:
+        run = monitor.backfill(
+            from_date=args.from_date,
+            from_id=args.from_id,
+            page_size=args.page_size,
+            concurrency=args.concurrency,
+            dry_run=args.dry_run
+        )
+    else:
+        run = monitor.start()
+        # Reload on file changes and SIGHUP while monitoring
+        watcher.subscribe(monitor.apply_config)
+        watcher.start()
+    try:
+        await run_until_signalled(monitor, run, args.shutdown_timeout)
+    finally:
+        watcher.stop()
+        if report_task is not None:
+            report_task.cancel()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,254 @@
+"""
+Lightweight in-process metrics with a Prometheus text exposition endpoint.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock, so
+recording a value costs about a microsecond and the instrumentation can stay on
+in production. ``MetricsServer`` serves the current values on ``/metrics`` from
+a background thread when the bot is started with ``--metrics-port``.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stage latency buckets in seconds: Telegram calls take milliseconds, OCR seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the ``with`` block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    """A metric family; children hold the values for each label combination."""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the child for the given label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_string(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def samples(self):
+        """Yield (suffix, label string, value) for every child."""
+        for values, child in list(self._children.items()):
+            yield "", self._label_string(values), child.value
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                yield "_bucket", self._label_string(values, ('le', le)), cumulative
+            yield "_sum", self._label_string(values), child.sum
+            yield "_count", self._label_string(values), child.count
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Return counter and gauge values as a dictionary (histograms as count/sum)."""
+        values = {}
+        for metric in self._metrics:
+            for labels, child in list(metric._children.items()):
+                key = metric.name + (f"{{{','.join(labels)}}}" if labels else "")
+                if isinstance(child, _HistogramChild):
+                    values[key] = {'count': child.count, 'sum': round(child.sum, 6)}
+                else:
+                    values[key] = child.value
+        return values
+
+
+REGISTRY = Registry()
+
+# Pipeline metrics
+STAGE_SECONDS = Histogram(
+    'telegram_bot_stage_seconds', 'Time spent in each pipeline stage', ['stage'])
+MESSAGES = Counter('telegram_bot_messages_total', 'Messages processed')
+IMAGES = Counter('telegram_bot_images_total', 'Images downloaded')
+OCR_REJECTS = Counter('telegram_bot_ocr_rejects_total', 'Images rejected as not being store screenshots')
+CACHE_HITS = Counter('telegram_bot_cache_hits_total', 'Keyword and OCR cache hits', ['cache'])
+MATCHES = Counter('telegram_bot_matches_total', 'Store names matching a pending keyword')
+SENDS = Counter('telegram_bot_sends_total', 'Images delivered, counted once per delivery target')
+RECONNECTS = Counter('telegram_bot_reconnects_total', 'Reconnection attempts', ['result'])
+DEFERRED = Counter('telegram_bot_deferred_images_total', 'Images whose OCR was deferred, by outcome', ['outcome'])
+OCR_MODEL_EVENTS = Counter('telegram_bot_ocr_model_events_total', 'OCR model loads and unloads (idle, rss)', ['event'])
+CONFIG_RELOADS = Counter('telegram_bot_config_reloads_total', 'Configuration reloads, applied or rejected', ['result'])
+QUEUE_DEPTH = Gauge('telegram_bot_queue_depth', 'Items waiting in each pipeline queue', ['queue'])
+LOOP_STALLS = Counter('telegram_bot_loop_stalls_total', 'Event loop stalls longer than the watchdog threshold', ['stage'])
+
+
+def timed_call(stage, func, *args, **kwargs):
+    """Call ``func`` and record its duration under ``stage``; handy with ``asyncio.to_thread``."""
+    with STAGE_SECONDS.labels(stage).time():
+        return func(*args, **kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serves ``/metrics`` from a daemon thread."""
+
+    def __init__(self, port, host='127.0.0.1', registry=None):
+        self.httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry if registry is not None else REGISTRY
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
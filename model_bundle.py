@@ -0,0 +1,129 @@
+"""
+Pre-provisioned EasyOCR model bundles.
+
+A bundle is a directory holding the detector/recognizer weights together with a
+``manifest.json`` recording each file's SHA-256. ImageProcessor loads models
+from a verified bundle with downloads disabled, so a fresh container starts
+with a local load instead of fetching hundreds of megabytes.
+
+Files generated from the weights, such as the cached int8 recognizer, are
+only loaded when the manifest lists them: provision_models.py generates them
+before writing it. A checksum stored next to such a file would only catch
+corruption, since whoever can replace the file can rewrite the checksum too.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from exceptions import OCRError
+
+MANIFEST_FILE = "manifest.json"
+
+# Environment variables configuring the bundle used by ImageProcessor
+MODEL_DIR_ENV = "EASYOCR_MODEL_DIR"
+ALLOW_DOWNLOAD_ENV = "EASYOCR_ALLOW_DOWNLOAD"
+
+MODEL_SUFFIXES = ('.pth', '.pt', '.onnx', '.yaml', '.py')
+
+
+def default_model_dir():
+    """Model directory from $EASYOCR_MODEL_DIR, or None to use EasyOCR's default."""
+    return os.getenv(MODEL_DIR_ENV) or None
+
+
+def downloads_allowed():
+    """Whether $EASYOCR_ALLOW_DOWNLOAD permits fetching missing models at runtime."""
+    return os.getenv(ALLOW_DOWNLOAD_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_files(model_dir):
+    """Model files in a bundle directory (recursively), relative to it."""
+    model_dir = Path(model_dir)
+    return sorted(
+        str(path.relative_to(model_dir)) for path in model_dir.rglob('*')
+        if path.is_file() and path.suffix in MODEL_SUFFIXES
+    )
+
+
+def write_manifest(model_dir, languages, engine_version=None):
+    """
+    Record the checksums of every model file in ``model_dir``.
+
+    Returns:
+        The manifest dictionary
+    """
+    model_dir = Path(model_dir)
+    manifest = {
+        'created': datetime.now().isoformat(),
+        'languages': list(languages),
+        'engine_version': engine_version,
+        'files': {name: file_sha256(model_dir / name) for name in model_files(model_dir)},
+    }
+    with (model_dir / MANIFEST_FILE).open('w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(model_dir):
+    """The manifest of a bundle directory, or None if it has none."""
+    manifest_path = Path(model_dir) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    with manifest_path.open('r') as f:
+        return json.load(f)
+
+
+def verified_file(model_dir, path) -> bool:
+    """
+    Whether ``path`` (inside ``model_dir``) is listed in the bundle's manifest
+    with a matching checksum. Outside a bundle nothing is verified.
+    """
+    model_dir, path = Path(model_dir), Path(path)
+    manifest = load_manifest(model_dir)
+    if manifest is None:
+        return False
+    expected = manifest.get('files', {}).get(str(path.relative_to(model_dir)))
+    return expected is not None and file_sha256(path) == expected
+
+
+def verify_manifest(model_dir, languages=None):
+    """
+    Check a bundle against its manifest.
+
+    Args:
+        model_dir: Bundle directory
+        languages: Languages the caller needs; they must all be in the bundle
+
+    Returns:
+        The manifest dictionary
+
+    Raises:
+        OCRError: If the manifest is missing, a file is missing or a checksum differs
+    """
+    model_dir = Path(model_dir)
+    manifest = load_manifest(model_dir)
+    if manifest is None:
+        raise OCRError(f"No {MANIFEST_FILE} in model directory {model_dir}; run provision_models.py first")
+
+    missing_languages = set(languages or []) - set(manifest.get('languages', []))
+    if missing_languages:
+        raise OCRError(f"Model bundle {model_dir} lacks languages: {sorted(missing_languages)}")
+
+    for name, expected in manifest.get('files', {}).items():
+        path = model_dir / name
+        if not path.exists():
+            raise OCRError(f"Model file missing from bundle: {path}")
+        actual = file_sha256(path)
+        if actual != expected:
+            raise OCRError(f"Checksum mismatch for {path}: expected {expected}, got {actual}")
+    return manifest
@@ -0,0 +1,133 @@
+"""
+Unloading idle OCR models and giving their memory back to the OS.
+
+EasyOCR and torch hold more than a gigabyte once loaded, while a group can go
+hours without a screenshot. ``ModelWatcher`` checks an ImageProcessor in the
+background. It unloads the models once they have been idle for
+``idle_timeout`` seconds, or as soon as the process's resident memory exceeds
+``max_rss_mb``. The next image (or a ``prefetch()`` when activity resumes)
+loads them again.
+
+Dropping the models only returns memory to the allocator. ``release_memory``
+also collects reference cycles and frees torch's cached GPU blocks, then asks
+glibc to return free heap pages to the OS with ``malloc_trim``, so the
+resident size really shrinks.
+"""
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+import sys
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds without OCR after which the models are unloaded (unset: never)
+OCR_IDLE_TIMEOUT_ENV = "OCR_IDLE_TIMEOUT"
+# Resident memory in MB above which idle models are unloaded (unset: no ceiling)
+OCR_MAX_RSS_ENV = "OCR_MAX_RSS_MB"
+
+# Longest pause between two checks of the watcher
+MAX_CHECK_INTERVAL = 30.0
+
+_libc = None
+
+
+def env_float(name) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def malloc_trim() -> bool:
+    """Return free heap memory to the OS (glibc only); whether it was attempted."""
+    global _libc
+    if _libc is None:
+        name = ctypes.util.find_library('c')
+        try:
+            _libc = ctypes.CDLL(name) if name else False
+        except OSError:
+            _libc = False
+    if not _libc or not hasattr(_libc, 'malloc_trim'):
+        return False
+    _libc.malloc_trim(0)
+    return True
+
+
+def release_memory():
+    """Free what unloaded models leave behind: cycles, torch caches and unused heap pages."""
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        try:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception as e:
+            logger.debug("Could not empty torch caches: %s", e)
+    malloc_trim()
+
+
+class ModelWatcher:
+    """Background thread unloading a processor's models when idle or over the memory ceiling."""
+
+    def __init__(self, processor, idle_timeout: Optional[float] = None, max_rss_mb: Optional[float] = None,
+                 check_interval: Optional[float] = None):
+        """
+        Args:
+            processor: ImageProcessor (needs ``loaded``, ``idle_seconds()`` and ``unload(reason)``)
+            idle_timeout: Seconds without OCR before unloading, or None
+            max_rss_mb: Resident memory ceiling in MB, or None
+            check_interval: Seconds between checks (default: a quarter of the idle
+                timeout, at most MAX_CHECK_INTERVAL)
+        """
+        self.processor = processor
+        self._fixed_interval = check_interval is not None
+        self.set_limits(idle_timeout, max_rss_mb)
+        if check_interval is not None:
+            self.check_interval = check_interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def set_limits(self, idle_timeout: Optional[float], max_rss_mb: Optional[float]):
+        """Change the idle timeout and memory ceiling, also while the watcher runs."""
+        self.idle_timeout = idle_timeout
+        self.max_rss_mb = max_rss_mb
+        if not self._fixed_interval:
+            self.check_interval = min(MAX_CHECK_INTERVAL, idle_timeout / 4 if idle_timeout else MAX_CHECK_INTERVAL)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ocr-model-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def check(self):
+        """Unload the models if they are idle or the process is over the ceiling; returns the reason."""
+        if not self.processor.loaded:
+            return None
+        if self.idle_timeout is not None and self.processor.idle_seconds() >= self.idle_timeout:
+            reason = 'idle'
+        elif self.max_rss_mb is not None and (current_rss() or 0) > self.max_rss_mb * 1024 * 1024:
+            reason = 'rss'
+        else:
+            return None
+        return reason if self.processor.unload(reason) else None
+
+    def _run(self):
+        while not self._stopped.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Error checking OCR model usage: %s", e)
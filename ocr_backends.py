@@ -0,0 +1,337 @@
+"""
+OCR engines that ImageProcessor delegates to.
+
+Every backend reads a preprocessed image array and returns results in EasyOCR's
+``readtext`` format, a list of ``(bbox, text, confidence)`` with ``bbox`` as
+four corner points and ``confidence`` in [0, 1], so validation and store name
+extraction work the same whichever engine produced them.
+
+- ``EasyOCRBackend``: EasyOCR on torch; the most accurate and the heaviest
+  (1-2 GB of RAM, seconds per image on CPU). Supports two-phase detect/recognize.
+  On CPU the recognizer's LSTM/Linear layers run int8-quantized; provisioned
+  bundles cache the quantized module so it is not requantized on every start,
+  and it is only loaded when the bundle's manifest lists it (see model_bundle.py).
+- ``TesseractBackend``: the ``tesseract`` CLI in a subprocess; no torch, tens of
+  megabytes, a fraction of the latency on clean UI screenshots.
+- ``CascadeBackend``: tries engines in order and escalates when a result is not
+  accepted, e.g. Tesseract first and EasyOCR (loaded on first use) only for
+  screenshots Tesseract cannot read.
+"""
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from exceptions import OCRError
+from model_bundle import default_model_dir, downloads_allowed, verified_file, verify_manifest
+
+logger = logging.getLogger(__name__)
+
+OCR_BACKEND_ENV = "OCR_BACKEND"
+# Torch intra-op threads used by EasyOCR (default: torch's own choice)
+OCR_THREADS_ENV = "OCR_THREADS"
+# Subdirectory of the model directory holding cached quantized modules
+QUANTIZED_DIR = "quantized"
+
+# EasyOCR language codes that differ in Tesseract
+TESSERACT_LANGUAGES = {
+    'en': 'eng', 'th': 'tha', 'vi': 'vie', 'id': 'ind', 'ms': 'msa', 'ch_sim': 'chi_sim',
+    'ch_tra': 'chi_tra', 'ja': 'jpn', 'ko': 'kor', 'de': 'deu', 'fr': 'fra', 'es': 'spa',
+}
+
+
+class OCRBackend:
+    """Interface of an OCR engine."""
+
+    name = None
+    # Whether detect()/recognize() are available for two-phase OCR
+    supports_two_phase = False
+
+    def readtext(self, image: np.ndarray, batch_size: int = 1) -> List[Tuple]:
+        """Detect and recognize all text in ``image``."""
+        raise NotImplementedError
+
+    def detect(self, image: np.ndarray):
+        """Return EasyOCR-style ``(horizontal_list, free_list)`` text boxes."""
+        raise NotImplementedError
+
+    def recognize(self, image: np.ndarray, horizontal_list, free_list, batch_size: int = 1) -> List[Tuple]:
+        """Recognize the text in the given boxes."""
+        raise NotImplementedError
+
+
+class EasyOCRBackend(OCRBackend):
+    """EasyOCR reader, loaded from a verified model bundle when one is configured."""
+
+    name = "easyocr"
+    supports_two_phase = True
+
+    def __init__(self, languages: Sequence[str] = ('en',), gpu: bool = False,
+                 model_dir: Optional[str] = None, download_enabled: Optional[bool] = None,
+                 verify_checksums: bool = True, quantize: bool = True, threads: Optional[int] = None):
+        """
+        Args:
+            languages: EasyOCR language codes
+            gpu: Whether to use GPU acceleration
+            model_dir: Directory with pre-provisioned model weights
+                (default: $EASYOCR_MODEL_DIR, or EasyOCR's ~/.EasyOCR when unset)
+            download_enabled: Whether missing weights may be downloaded (default: only
+                when no model_dir is configured or $EASYOCR_ALLOW_DOWNLOAD is set)
+            verify_checksums: Verify model_dir against its manifest before loading
+            quantize: Run the recognizer with dynamic int8 quantization on CPU. The
+                CRAFT detector is convolutional, which dynamic quantization does
+                not cover, so it stays float32.
+            threads: Torch intra-op threads (default: $OCR_THREADS, or torch's default)
+        """
+        if threads is None and os.getenv(OCR_THREADS_ENV):
+            threads = int(os.getenv(OCR_THREADS_ENV))
+        if model_dir is None:
+            model_dir = default_model_dir()
+        if download_enabled is None:
+            download_enabled = model_dir is None or downloads_allowed()
+
+        reader_kwargs = {'download_enabled': download_enabled}
+        if model_dir is not None:
+            # Loading from a provisioned bundle: refuse tampered or partial weights
+            if verify_checksums and not download_enabled:
+                verify_manifest(model_dir, languages)
+            reader_kwargs['model_storage_directory'] = str(model_dir)
+            reader_kwargs['user_network_directory'] = os.path.join(str(model_dir), 'user_network')
+
+        try:
+            import easyocr
+            import torch
+            if threads:
+                torch.set_num_threads(threads)
+            # EasyOCR would requantize on every start; load float weights and
+            # quantize through the on-disk cache instead
+            self.reader = easyocr.Reader(list(languages), gpu=gpu, quantize=False, **reader_kwargs)
+        except Exception as e:
+            raise OCRError(f"Failed to initialize EasyOCR reader: {e}")
+
+        self.quantized = quantize and self.reader.device == 'cpu'
+        if self.quantized:
+            self.reader.recognizer = self._quantized_recognizer(torch)
+        self._inference_mode = torch.inference_mode
+
+    def _quantized_recognizer(self, torch):
+        """
+        Return the int8 recognizer, from the bundle's cache when it has one.
+
+        Cache entries are keyed by the float weights' checksum and the torch
+        version, so new weights or a torch upgrade requantize automatically.
+        Entries are pickled modules, so one is only unpickled when the bundle's
+        manifest lists it with a matching checksum. The manifest is written by
+        provision_models.py, which creates the cache with
+        ``save_quantized_recognizer``. Without a listed cache (including any
+        model directory without a manifest) the recognizer is quantized in
+        memory on every load.
+        """
+        model = self.reader.recognizer
+        digest = hashlib.sha256(torch.__version__.encode())
+        for key, tensor in sorted(model.state_dict().items()):
+            digest.update(key.encode())
+            digest.update(tensor.detach().cpu().numpy().tobytes())
+        model_dir = Path(self.reader.model_storage_directory)
+        self.recognizer_cache = model_dir / QUANTIZED_DIR / f"recognizer-int8-{digest.hexdigest()[:16]}.pt"
+
+        if self.recognizer_cache.exists():
+            if verified_file(model_dir, self.recognizer_cache):
+                try:
+                    quantized = torch.load(self.recognizer_cache, weights_only=False)
+                    logger.info("Loaded quantized recognizer from %s", self.recognizer_cache)
+                    return quantized.eval()
+                except Exception as e:
+                    logger.warning("Ignoring unreadable quantized recognizer cache %s: %s",
+                                   self.recognizer_cache, e)
+            else:
+                logger.warning("Ignoring quantized recognizer cache %s: it is not listed in the bundle's "
+                               "manifest (run provision_models.py to add it)", self.recognizer_cache)
+
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8).eval()
+
+    def save_quantized_recognizer(self) -> Path:
+        """
+        Write the int8 recognizer to the model directory's cache.
+
+        Only provision_models.py calls this, before it writes the manifest
+        that lets the bot load the cache.
+
+        Returns:
+            Path of the cache file
+        """
+        if not self.quantized:
+            raise OCRError("The recognizer is not quantized (quantization runs on CPU only)")
+        import torch
+        cache_path = self.recognizer_cache
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            torch.save(self.reader.recognizer, tmp_name)
+            os.replace(tmp_name, cache_path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return cache_path
+
+    def readtext(self, image, batch_size=1):
+        with self._inference_mode():
+            return self.reader.readtext(image, batch_size=batch_size)
+
+    def detect(self, image):
+        with self._inference_mode():
+            return self.reader.detect(image)
+
+    def recognize(self, image, horizontal_list, free_list, batch_size=1):
+        with self._inference_mode():
+            return self.reader.recognize(image, horizontal_list=horizontal_list, free_list=free_list,
+                                         batch_size=batch_size)
+
+
+class TesseractBackend(OCRBackend):
+    """Tesseract run through its command line tool, one subprocess per image."""
+
+    name = "tesseract"
+
+    def __init__(self, languages: Sequence[str] = ('en',), executable: str = "tesseract",
+                 page_segmentation: int = 11, timeout: float = 30):
+        """
+        Args:
+            languages: EasyOCR language codes (mapped to Tesseract's)
+            executable: Name or path of the tesseract binary
+            page_segmentation: Tesseract --psm mode; 11 finds sparse text such as UI labels
+            timeout: Seconds before a tesseract run is abandoned
+        """
+        self.executable = shutil.which(executable)
+        if self.executable is None:
+            raise OCRError(f"Tesseract executable '{executable}' not found; install tesseract-ocr")
+        self.languages = "+".join(TESSERACT_LANGUAGES.get(lang, lang) for lang in languages)
+        self.page_segmentation = page_segmentation
+        self.timeout = timeout
+
+    def readtext(self, image, batch_size=1):
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format='PNG', compress_level=1)
+        try:
+            completed = subprocess.run(
+                [self.executable, 'stdin', 'stdout', '-l', self.languages,
+                 '--psm', str(self.page_segmentation), 'tsv'],
+                input=buffer.getvalue(), capture_output=True, timeout=self.timeout, check=True,
+            )
+        except subprocess.TimeoutExpired:
+            raise OCRError(f"Tesseract timed out after {self.timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise OCRError(f"Tesseract failed: {e.stderr.decode('utf-8', 'replace').strip()}")
+        return self.parse_tsv(completed.stdout.decode('utf-8', 'replace'))
+
+    @staticmethod
+    def parse_tsv(tsv: str) -> List[Tuple]:
+        """
+        Convert Tesseract TSV output to ``readtext`` results, one per text line.
+
+        Words are joined per (block, paragraph, line); the line's box encloses
+        its words and its confidence is the words' mean, scaled to [0, 1].
+        """
+        lines = {}
+        rows = tsv.splitlines()
+        for row in rows[1:]:
+            fields = row.split('\t')
+            if len(fields) < 12 or fields[0] != '5':
+                continue  # Only word-level rows carry text
+            text = fields[11].strip()
+            confidence = float(fields[10])
+            if not text or confidence < 0:
+                continue
+            left, top, width, height = (int(value) for value in fields[6:10])
+            key = tuple(fields[2:5])
+            lines.setdefault(key, []).append((left, top, left + width, top + height, text, confidence))
+
+        results = []
+        for words in lines.values():
+            x_min = min(word[0] for word in words)
+            y_min = min(word[1] for word in words)
+            x_max = max(word[2] for word in words)
+            y_max = max(word[3] for word in words)
+            bbox = [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+            text = " ".join(word[4] for word in words)
+            confidence = sum(word[5] for word in words) / len(words) / 100
+            results.append((bbox, text, confidence))
+        return results
+
+
+class CascadeBackend(OCRBackend):
+    """
+    Tries backends in order, escalating when ``accept`` rejects a result.
+
+    Later backends may be given as factories so an expensive engine is only
+    loaded once the first image needs it.
+    """
+
+    name = "cascade"
+
+    def __init__(self, backends: Sequence, accept: Optional[Callable[[List[Tuple]], bool]] = None):
+        """
+        Args:
+            backends: OCRBackend instances or zero-argument callables creating them
+            accept: Returns whether a result is good enough to stop at (default: any text)
+        """
+        self._backends = list(backends)
+        self.accept = accept or bool
+        # Number of images passed on to each later backend
+        self.escalations = [0] * len(self._backends)
+
+    def backend(self, index: int) -> OCRBackend:
+        backend = self._backends[index]
+        if not isinstance(backend, OCRBackend):
+            backend = self._backends[index] = backend()
+        return backend
+
+    def readtext(self, image, batch_size=1):
+        results = []
+        for index in range(len(self._backends)):
+            if index:
+                self.escalations[index] += 1
+            results = self.backend(index).readtext(image, batch_size=batch_size)
+            if self.accept(results):
+                break
+        return results
+
+
+OCR_BACKENDS = ["easyocr", "tesseract", "cascade"]
+
+
+def default_backend_name():
+    """Backend from $OCR_BACKEND, or easyocr."""
+    return os.getenv(OCR_BACKEND_ENV) or "easyocr"
+
+
+def create_backend(name: str, languages: Sequence[str] = ('en',), accept=None, **easyocr_kwargs) -> OCRBackend:
+    """
+    Create a backend by name.
+
+    Args:
+        name: One of OCR_BACKENDS
+        languages: EasyOCR language codes
+        accept: Result check the cascade escalates on
+        easyocr_kwargs: Passed to EasyOCRBackend (gpu, model_dir, ...)
+    """
+    if name == "easyocr":
+        return EasyOCRBackend(languages, **easyocr_kwargs)
+    if name == "tesseract":
+        return TesseractBackend(languages)
+    if name == "cascade":
+        return CascadeBackend(
+            [TesseractBackend(languages), lambda: EasyOCRBackend(languages, **easyocr_kwargs)],
+            accept=accept,
+        )
+    raise OCRError(f"Unknown OCR backend: {name} (available: {', '.join(OCR_BACKENDS)})")
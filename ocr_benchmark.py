@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Speed/accuracy benchmark for ImageProcessor over a labeled screenshot corpus.
+
+A corpus is a directory of screenshots plus a ``labels.json`` mapping file name
+to the expected store name (null for images that should be rejected). Build one
+offline with synthetic_screenshots.py, or label real images from group_images.
+
+Every combination of the given settings is run and reported with images/sec,
+latency percentiles, memory and exact/fuzzy accuracy:
+
+    python ocr_benchmark.py --corpus corpus/synthetic --crop 20,25,35 --downscale auto,1,0.5 --grayscale both
+
+With ``--quantize both`` each int8 configuration is also compared against the
+same configuration at full precision (speedup and accuracy delta).
+"""
+import argparse
+import itertools
+import json
+import time
+from datetime import datetime
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from benchmark import current_rss_mb, git_revision, peak_rss_mb, summarize
+from ocr_backends import OCR_BACKENDS
+from synthetic_screenshots import LABELS_FILE
+
+RESULTS_DIR = Path("bench_results")
+
+# Backends that run (or may escalate to) EasyOCR on torch
+TORCH_BACKENDS = ('easyocr', 'cascade')
+
+# Minimum similarity ratio for a prediction to count as a fuzzy match
+FUZZY_THRESHOLD = 0.8
+
+
+def load_corpus(corpus_dir):
+    """
+    Load a labeled corpus.
+
+    Returns:
+        List of (image path, expected store name or None)
+    """
+    corpus_dir = Path(corpus_dir)
+    with (corpus_dir / LABELS_FILE).open('r') as f:
+        labels = json.load(f)
+    return [(str(corpus_dir / name), expected) for name, expected in sorted(labels.items())]
+
+
+def normalize(text):
+    return " ".join(text.lower().split()) if text else ""
+
+
+def score(predicted, expected):
+    """
+    Score a prediction against its label.
+
+    Returns:
+        Tuple of (exact match, fuzzy match). Images labelled None are correct when rejected.
+    """
+    if expected is None:
+        return predicted is None, predicted is None
+    if predicted is None:
+        return False, False
+    exact = normalize(predicted) == normalize(expected)
+    fuzzy = exact or SequenceMatcher(None, normalize(predicted), normalize(expected)).ratio() >= FUZZY_THRESHOLD
+    return exact, fuzzy
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def parse_downscale(value):
+    """Parse a downscale factor; 'auto' picks one per image from its width."""
+    return None if value.strip() == 'auto' else float(value)
+
+
+def parse_switch(value):
+    return {'on': [True], 'off': [False], 'both': [False, True]}[value]
+
+
+def set_threads(backend, threads):
+    """
+    Set the number of intra-op threads used by torch, for the backends running on it.
+
+    Returns:
+        Whether they were set (not for Tesseract, or when torch is not installed)
+    """
+    if backend not in TORCH_BACKENDS:
+        return False
+    try:
+        import torch
+    except ImportError:
+        return False
+    torch.set_num_threads(threads)
+    return True
+
+
+def create_processor(backend, quantize=True):
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {backend}")
+    from temu_extractor_easyocr import ImageProcessor
+    return ImageProcessor(backend=backend, quantize=quantize)
+
+
+def compare_quantization(results):
+    """
+    Pair each quantized result with the full-precision run of the same configuration.
+
+    Returns:
+        List of comparisons with the speedup and exact/fuzzy accuracy deltas
+    """
+    def settings(result):
+        return tuple((key, value) for key, value in result['config'].items() if key != 'quantize')
+
+    full_precision = {settings(result): result for result in results if not result['config']['quantize']}
+    comparisons = []
+    for result in results:
+        baseline = full_precision.get(settings(result))
+        if not result['config']['quantize'] or baseline is None:
+            continue
+        comparisons.append({
+            'config': dict(settings(result)),
+            'speedup': round(result['images_per_sec'] / baseline['images_per_sec'], 3)
+            if baseline['images_per_sec'] else None,
+            'p50_ms': [baseline['latency']['p50_ms'], result['latency']['p50_ms']],
+            'exact_accuracy_delta': round(result['exact_accuracy'] - baseline['exact_accuracy'], 4),
+            'fuzzy_accuracy_delta': round(result['fuzzy_accuracy'] - baseline['fuzzy_accuracy'], 4),
+        })
+    return comparisons
+
+
+def run_configuration(processor, corpus, config, repeat=1):
+    """Run every corpus image through ``processor`` with ``config`` applied."""
+    from exceptions import InvalidImageError, OCRError
+
+    processor.crop_percent = config['crop_percent']
+    processor.downscale = config['downscale']
+    processor.grayscale = config['grayscale']
+    processor.contrast = config['contrast']
+    processor.two_phase = config['two_phase']
+    processor.batch_size = config['batch_size']
+    set_threads(config['backend'], config['threads'])
+
+    fallbacks_before = processor.fallbacks
+    detected_before, recognized_before = processor.boxes_detected, processor.boxes_recognized
+    escalations_before = list(getattr(processor.backend, 'escalations', []))
+    durations = []
+    exact = fuzzy = rejected = 0
+    mistakes = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for image_path, expected in corpus:
+            image_started = time.perf_counter()
+            try:
+                predicted = processor.process_image(image_path)
+            except (InvalidImageError, OCRError):
+                predicted = None
+                rejected += 1
+            durations.append(time.perf_counter() - image_started)
+
+            is_exact, is_fuzzy = score(predicted, expected)
+            exact += is_exact
+            fuzzy += is_fuzzy
+            if not is_exact and len(mistakes) < 10:
+                mistakes.append({'image': Path(image_path).name, 'expected': expected, 'predicted': predicted})
+    elapsed = time.perf_counter() - started
+    escalations_after = getattr(processor.backend, 'escalations', [])
+
+    total = len(durations)
+    return {
+        'config': config,
+        'images': total,
+        'images_per_sec': round(total / elapsed, 3) if elapsed else 0.0,
+        'latency': summarize(durations),
+        'exact_accuracy': round(exact / total, 4) if total else 0.0,
+        'fuzzy_accuracy': round(fuzzy / total, 4) if total else 0.0,
+        'rejected': rejected,
+        'full_resolution_fallbacks': processor.fallbacks - fallbacks_before,
+        'boxes_detected': processor.boxes_detected - detected_before,
+        'boxes_recognized': processor.boxes_recognized - recognized_before,
+        # Images passed on to each backend after the first (the first one is never escalated to)
+        'escalations': [escalations_after[index] - escalations_before[index]
+                        for index in range(1, len(escalations_before))],
+        'rss_mb': current_rss_mb(),
+        'peak_rss_mb': peak_rss_mb(),
+        'mistakes': mistakes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR speed/accuracy benchmark for ImageProcessor')
+    parser.add_argument('--corpus', default='corpus/synthetic', help='Labeled corpus directory (default: corpus/synthetic)')
+    parser.add_argument('--crop', default='25', help='Comma separated crop percentages (default: 25)')
+    parser.add_argument('--downscale', default='auto',
+                        help="Comma separated downscale factors, 'auto' to adapt to each image (default: auto)")
+    parser.add_argument('--grayscale', choices=['on', 'off', 'both'], default='on',
+                        help='Grayscale conversion (default: on)')
+    parser.add_argument('--contrast', choices=['on', 'off', 'both'], default='on',
+                        help='Contrast normalization (default: on)')
+    parser.add_argument('--two-phase', choices=['on', 'off', 'both'], default='on',
+                        help='Detect first and recognize only the boxes needed (default: on)')
+    parser.add_argument('--quantize', choices=['on', 'off', 'both'], default='on',
+                        help='Int8-quantized EasyOCR recognizer (default: on)')
+    parser.add_argument('--batch-size', default='1', help='Comma separated recognizer batch sizes (default: 1)')
+    parser.add_argument('--threads', default='4', help='Comma separated torch thread counts (default: 4)')
+    parser.add_argument('--backend', default='easyocr',
+                        help=f"Comma separated OCR backends (available: {', '.join(OCR_BACKENDS)})")
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the corpus per configuration (default: 1)')
+    parser.add_argument('--output', help='Where to save the JSON results (default: bench_results/ocr-<timestamp>.json)')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    print(f"Loaded {len(corpus)} labeled images from {args.corpus}")
+
+    quantize_options = parse_switch(args.quantize)
+    grid = itertools.product(
+        parse_list(args.backend, str),
+        quantize_options,
+        parse_list(args.crop, float),
+        parse_list(args.downscale, parse_downscale),
+        parse_switch(args.grayscale),
+        parse_switch(args.contrast),
+        parse_switch(args.two_phase),
+        parse_list(args.batch_size, int),
+        parse_list(args.threads, int),
+    )
+
+    processors = {}
+    init_times = {}
+    results = []
+    for backend, quantize, crop_percent, downscale, grayscale, contrast, two_phase, batch_size, threads in grid:
+        if quantize and backend not in TORCH_BACKENDS:
+            # Only torch models are quantized; an int8 run would repeat the float one
+            if False in quantize_options:
+                continue
+            quantize = False
+        engine = f"{backend}{'-int8' if quantize else ''}"
+        if engine not in processors:
+            started = time.perf_counter()
+            processors[engine] = create_processor(backend, quantize)
+            init_times[engine] = round(time.perf_counter() - started, 3)
+            print(f"Initialized {engine} in {init_times[engine]}s")
+
+        config = {
+            'backend': backend,
+            'quantize': quantize,
+            'crop_percent': crop_percent,
+            'downscale': downscale,
+            'grayscale': grayscale,
+            'contrast': contrast,
+            'two_phase': two_phase,
+            'batch_size': batch_size,
+            'threads': threads,
+        }
+        result = run_configuration(processors[engine], corpus, config, repeat=args.repeat)
+        results.append(result)
+        latency = result['latency']
+        print(f"{engine:<13} crop={crop_percent:<5} scale={downscale or 'auto':<5} gray={str(grayscale):<5} "
+              f"contrast={str(contrast):<5} two-phase={str(two_phase):<5} "
+              f"batch={batch_size:<3} threads={threads:<3} | {result['images_per_sec']:>7} img/s  "
+              f"p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  "
+              f"exact {result['exact_accuracy']:.1%}  fuzzy {result['fuzzy_accuracy']:.1%}  "
+              f"fallbacks {result['full_resolution_fallbacks']}  "
+              f"recognized {result['boxes_recognized']}/{result['boxes_detected']} boxes  "
+              f"rss {result['rss_mb']}MB")
+
+    comparisons = compare_quantization(results)
+    for comparison in comparisons:
+        config = comparison['config']
+        print(f"int8 vs float32 ({config['backend']}, threads={config['threads']}, batch={config['batch_size']}): "
+              f"{comparison['speedup']}x throughput, p50 {comparison['p50_ms'][0]}ms -> {comparison['p50_ms'][1]}ms, "
+              f"exact {comparison['exact_accuracy_delta']:+.1%}, fuzzy {comparison['fuzzy_accuracy_delta']:+.1%}")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"ocr-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open('w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'corpus': args.corpus,
+            'init_s': init_times,
+            'results': results,
+            'quantization': comparisons,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
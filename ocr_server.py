@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Standalone OCR service shared by several bot processes.
+
+Every bot process normally loads its own OCR models (1-2 GB with EasyOCR).
+``OCRServer`` loads one ImageProcessor and serves it over localhost HTTP or a
+Unix socket, so any number of bots (``TelegramGroupMonitor(ocr_server=...)``
+or ``$OCR_SERVER``) share one model copy and one inference queue.
+
+Protocol, on either transport:
+
+- ``POST /ocr`` with the image bytes as the body, or with a JSON body
+  ``{"shm": <name>, "size": <bytes>}`` naming a shared memory block the
+  client wrote the image to (same host only; skips copying it through the
+  socket). The reply is JSON: ``{"valid": true, "store_name": ...}`` for a
+  store screenshot, ``{"valid": false, "error": ...}`` when validation
+  rejects the image, or status 500 with ``{"error": ...}`` when OCR fails.
+- ``GET /health``: ``{"ready": ..., "queued": ..., "batches": ..., "images": ...}``
+
+Requests from all clients go into one queue drained by a single engine
+thread in batches: whatever arrived within ``batch_window`` seconds, up to
+``max_batch`` images. Identical images in a batch are read once. EasyOCR
+cannot run differently sized crops through one forward pass (its batched
+API resizes every image to one size, which would undo the adaptive
+scaling), so the images of a batch run back to back on the warm engine.
+
+Run it with::
+
+    python ocr_server.py --socket /tmp/ocr.sock
+    python main.py --ocr-server unix:/tmp/ocr.sock
+"""
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import resource_tracker, shared_memory
+
+from exceptions import InvalidImageError, OCRError
+from metrics import QUEUE_DEPTH, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Address of the OCR server used by TelegramGroupMonitor: unix:/path or http://host:port
+OCR_SERVER_ENV = "OCR_SERVER"
+# Pass images to the server through shared memory instead of the socket
+OCR_SERVER_SHM_ENV = "OCR_SERVER_SHM"
+
+DEFAULT_PORT = 8765
+
+
+def _attach_shared_memory(name):
+    """Open a client's shared memory block without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with this process's
+        # resource tracker, which would unlink it on exit; the client owns it
+        block = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+class OCRServer:
+    """Batching front end for one ImageProcessor."""
+
+    def __init__(self, processor, max_batch=8, batch_window=0.02):
+        """
+        Args:
+            processor: ImageProcessor (anything with ``process_image(path or file)``)
+            max_batch: Most images taken from the queue at once
+            batch_window: Seconds to wait for more requests after the first of a batch
+        """
+        self.processor = processor
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._servers = []
+
+    def submit(self, data: bytes) -> Future:
+        """Queue image bytes; the future resolves to the reply dictionary."""
+        future = Future()
+        self._queue.put((data, future))
+        QUEUE_DEPTH.labels('ocr_server').inc()
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, remaining)) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        QUEUE_DEPTH.labels('ocr_server').dec(len(batch))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch[0][0] is None:
+                return
+            self.batches += 1
+            replies = {}
+            for data, future in batch:
+                key = hashlib.sha1(data).digest()
+                if key not in replies:
+                    replies[key] = self._read(data)
+                    self.images += 1
+                future.set_result(replies[key])
+
+    def _read(self, data):
+        try:
+            with STAGE_SECONDS.labels('process_image').time():
+                store_name = self.processor.process_image(io.BytesIO(data))
+            return {'valid': True, 'store_name': store_name}
+        except InvalidImageError as e:
+            return {'valid': False, 'error': str(e)}
+        except Exception as e:
+            logger.error("OCR failed: %s", e)
+            return {'error': str(e)}
+
+    def start_engine(self):
+        self._thread = threading.Thread(target=self._run, name="ocr-engine", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_http(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        """Start serving on localhost HTTP in a background thread; returns the bound address."""
+        httpd = ThreadingHTTPServer((host, port), _OCRHandler)
+        return self._serve(httpd)
+
+    def serve_unix(self, path):
+        """Start serving on a Unix socket in a background thread."""
+        if os.path.exists(path):
+            os.unlink(path)
+        httpd = _ThreadingUnixHTTPServer(path, _OCRHandler)
+        return self._serve(httpd)
+
+    def _serve(self, httpd):
+        httpd.daemon_threads = True
+        httpd.ocr = self
+        threading.Thread(target=httpd.serve_forever, name="ocr-server", daemon=True).start()
+        self._servers.append(httpd)
+        return httpd.server_address
+
+    def stop(self):
+        for httpd in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
+        self._queue.put((None, None))
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class _OCRHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return str(self.client_address or 'unix')
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._reply(404, {'error': 'not found'})
+            return
+        ocr = self.server.ocr
+        self._reply(200, {'ready': ocr._thread is not None and ocr._thread.is_alive(),
+                          'queued': ocr._queue.qsize(), 'batches': ocr.batches, 'images': ocr.images})
+
+    def do_POST(self):
+        if self.path != '/ocr':
+            self._reply(404, {'error': 'not found'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if self.headers.get('Content-Type') == 'application/json':
+                request = json.loads(body)
+                block = _attach_shared_memory(request['shm'])
+                try:
+                    body = bytes(block.buf[:request['size']])
+                finally:
+                    block.close()
+        except Exception as e:
+            self._reply(400, {'error': f"Bad request: {e}"})
+            return
+        reply = self.server.ocr.submit(body).result()
+        self._reply(500 if 'valid' not in reply else 200, reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class OCRClient:
+    """
+    Drop-in replacement for ImageProcessor that asks an OCRServer.
+
+    ``process_image`` returns the store name or raises InvalidImageError /
+    OCRError exactly like ImageProcessor. It is thread-safe; every call uses
+    its own connection.
+    """
+
+    def __init__(self, address, shared_memory=None, timeout=120):
+        """
+        Args:
+            address: ``unix:/path/to/socket`` or ``http://host:port``
+            shared_memory: Pass images through shared memory (default: $OCR_SERVER_SHM)
+            timeout: Seconds to wait for a reply
+        """
+        self.address = address
+        if shared_memory is None:
+            shared_memory = os.getenv(OCR_SERVER_SHM_ENV, '').lower() in ('1', 'true', 'yes')
+        self.shared_memory = shared_memory
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.address.startswith('unix:'):
+            return _UnixHTTPConnection(self.address[len('unix:'):], self.timeout)
+        host = self.address.split('://', 1)[-1].rstrip('/')
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def _request(self, method, path, body=None, headers=None):
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read() or b'{}')
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            raise OCRError(f"OCR server {self.address} unavailable: {e}")
+        finally:
+            connection.close()
+
+    def health(self):
+        return self._request('GET', '/health')[1]
+
+    def process_image(self, image_path):
+        with open(image_path, 'rb') as f:
+            data = f.read()
+
+        if self.shared_memory:
+            block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+            try:
+                block.buf[:len(data)] = data
+                status, reply = self._request(
+                    'POST', '/ocr', json.dumps({'shm': block.name, 'size': len(data)}),
+                    {'Content-Type': 'application/json'})
+            finally:
+                block.close()
+                block.unlink()
+        else:
+            status, reply = self._request('POST', '/ocr', data, {'Content-Type': 'application/octet-stream'})
+
+        if reply.get('valid'):
+            return reply['store_name']
+        if status == 200 and reply.get('valid') is False:
+            raise InvalidImageError(reply.get('error', 'Rejected by OCR server'))
+        raise OCRError(f"OCR server error: {reply.get('error', status)}")
+
+
+def serve_until_signalled(server, calibration=None):
+    """Block until SIGINT or SIGTERM, then stop ``server`` and save the calibration."""
+    stopping = threading.Event()
+    previous = {sig: signal.signal(sig, lambda signum, frame: stopping.set())
+                for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        stopping.wait()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        logger.info("Stopping the OCR server")
+        server.stop()
+        if calibration is not None:
+            calibration.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve OCR to several bot processes from one model copy')
+    parser.add_argument('--socket', help='Unix socket path to listen on')
+    parser.add_argument('--port', type=int, help=f'Localhost HTTP port to listen on (default: {DEFAULT_PORT} without --socket)')
+    parser.add_argument('--host', default='127.0.0.1', help='HTTP bind address (default: 127.0.0.1)')
+    parser.add_argument('--max-batch', type=int, default=8, help='Most images per batch (default: 8)')
+    parser.add_argument('--batch-window-ms', type=float, default=20,
+                        help='Milliseconds to collect a batch after its first request (default: 20)')
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'INFO'))
+    args = parser.parse_args()
+
+    from log_setup import configure_logging
+    configure_logging(level=args.log_level)
+
+    from temu_extractor_easyocr import ImageProcessor
+    from roi_calibration import RegionCalibration
+    calibration = RegionCalibration()
+    server = OCRServer(ImageProcessor(calibration=calibration),
+                       max_batch=args.max_batch, batch_window=args.batch_window_ms / 1000).start_engine()
+    if args.socket:
+        server.serve_unix(args.socket)
+        logger.info("OCR server listening on unix:%s", args.socket)
+    if args.port or not args.socket:
+        host, port = server.serve_http(args.port or DEFAULT_PORT, args.host)[:2]
+        logger.info("OCR server listening on http://%s:%s", host, port)
+    serve_until_signalled(server, calibration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Opt-in runtime profiling for the running bot.
+
+``RuntimeProfiler`` captures a cProfile of the event loop thread for a fixed
+number of seconds and dumps the stats to disk. It is started with
+``--profile-seconds`` or toggled at runtime with ``kill -USR1 <pid>``.
+
+``LoopWatchdog`` flags anything that blocks the event loop for longer than a
+threshold. A heartbeat coroutine updates a timestamp on every loop iteration
+and a watcher thread checks it; when the loop stalls, the watcher grabs the
+loop thread's stack and logs the pipeline stage that is hogging it, such as
+OCR or a ``requests`` call still running on the loop.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+from metrics import LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path("profiles")
+
+# Functions that identify a pipeline stage when found on a blocked loop's stack
+STAGE_FUNCTIONS = {
+    'process_image': 'process_image',
+    'readtext': 'process_image',
+    'extract_first_keyword': 'extract_first_keyword',
+    'download_media': 'download_media',
+    'send_file': 'send_file',
+    'get_messages': 'get_messages',
+    'save_json': 'save_state',
+}
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class RuntimeProfiler:
+    """Captures cProfile stats of the event loop thread on demand."""
+
+    def __init__(self, profile_dir=PROFILE_DIR, default_seconds=30, top=40):
+        """
+        Args:
+            profile_dir: Directory the .pstats dumps and text summaries are written to
+            default_seconds: Capture length when toggled by signal
+            top: Number of functions listed in the text summary
+        """
+        self.profile_dir = Path(profile_dir)
+        self.default_seconds = default_seconds
+        self.top = top
+        self._profile = None
+        self._stop_handle = None
+        self._started = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self, seconds=None):
+        """Start a capture that stops itself after ``seconds`` (must run on the event loop)."""
+        if self.running:
+            return
+        seconds = seconds or self.default_seconds
+        self._profile = cProfile.Profile()
+        self._started = time.time()
+        self._profile.enable()
+        self._stop_handle = asyncio.get_running_loop().call_later(seconds, self.stop)
+        logger.info("Profiling started for %ss", seconds)
+
+    def stop(self):
+        """Stop the capture and dump it; returns the .pstats path."""
+        if not self.running:
+            return None
+        self._profile.disable()
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        profile, self._profile = self._profile, None
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / f"profile-{datetime.now():%Y%m%d-%H%M%S}.pstats"
+        profile.dump_stats(str(path))
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        path.with_suffix('.txt').write_text(summary.getvalue())
+
+        logger.info("Profile of %.1fs written to %s", time.time() - self._started, path)
+        return path
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def install_signal_handler(self, loop, signum=getattr(signal, 'SIGUSR1', None)):
+        """Toggle profiling when the process receives ``signum`` (SIGUSR1 by default)."""
+        if signum is None:
+            logger.warning("SIGUSR1 is not available on this platform; signal-triggered profiling disabled")
+            return
+        loop.add_signal_handler(signum, self.toggle)
+
+
+def describe_stack(frame):
+    """
+    Name the pipeline stage on a stack and summarize the innermost project frames.
+
+    Returns:
+        Tuple of (stage, short stack description)
+    """
+    stack = traceback.extract_stack(frame)
+    stage = None
+    for entry in reversed(stack):
+        if entry.name in STAGE_FUNCTIONS:
+            stage = STAGE_FUNCTIONS[entry.name]
+            break
+    project_frames = [entry for entry in stack if entry.filename.startswith(_PROJECT_DIR)]
+    if stage is None:
+        stage = project_frames[-1].name if project_frames else stack[-1].name
+    innermost = stack[-1]
+    frames = [f"{os.path.basename(e.filename)}:{e.lineno} {e.name}" for e in project_frames[-3:]]
+    frames.append(f"{os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name}")
+    return stage, " <- ".join(reversed(frames))
+
+
+class LoopWatchdog:
+    """Detects and names blocking work on the asyncio event loop."""
+
+    def __init__(self, threshold_ms=100, asyncio_debug=False):
+        """
+        Args:
+            threshold_ms: Loop stalls longer than this are reported
+            asyncio_debug: Also enable asyncio debug mode, which logs every slow
+                callback itself (adds noticeable overhead)
+        """
+        self.threshold = threshold_ms / 1000
+        self.asyncio_debug = asyncio_debug
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    async def _beat(self):
+        interval = self.threshold / 4
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _watch(self):
+        reported = False
+        while not self._stop.wait(self.threshold / 2):
+            lag = time.monotonic() - self._heartbeat
+            if lag <= self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue  # One report per stall
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stage, stack = describe_stack(frame)
+            self.stalls += 1
+            LOOP_STALLS.labels(stage).inc()
+            logger.warning("Event loop blocked for %.0fms in stage '%s': %s", lag * 1000, stage, stack,
+                           extra={'stage': stage, 'lag_ms': round(lag * 1000)})
+
+    def start(self):
+        """Start watching the running loop."""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self.asyncio_debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            logging.getLogger('asyncio').setLevel(logging.WARNING)
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("Event loop watchdog started (threshold %.0fms)", self.threshold * 1000)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Download EasyOCR models into a local bundle and record their checksums.
+
+Run this at image build time (or against a mounted volume) so the bot never
+downloads weights at runtime:
+
+    python provision_models.py --model-dir /opt/easyocr-models
+    python provision_models.py --model-dir /opt/easyocr-models --verify
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from exceptions import OCRError
+from model_bundle import MANIFEST_FILE, default_model_dir, verify_manifest, write_manifest
+from ocr_backends import EasyOCRBackend
+
+
+def provision(model_dir, languages):
+    """Download the models for ``languages`` into ``model_dir`` and write the manifest."""
+    import easyocr
+
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Downloading EasyOCR models for {', '.join(languages)} into {model_dir}...")
+    easyocr.Reader(
+        languages,
+        gpu=False,
+        model_storage_directory=str(model_dir),
+        user_network_directory=str(model_dir / 'user_network'),
+        download_enabled=True
+    )
+
+    # Quantize the recognizer once now so containers load the cached int8
+    # module. The manifest is written afterwards so it records the cache too:
+    # the bot only unpickles a cached module whose checksum is in the manifest.
+    (model_dir / MANIFEST_FILE).unlink(missing_ok=True)
+    backend = EasyOCRBackend(languages, model_dir=str(model_dir), download_enabled=False,
+                             verify_checksums=False, quantize=True)
+    print(f"Cached the quantized recognizer at {backend.save_quantized_recognizer()}")
+
+    manifest = write_manifest(model_dir, languages, engine_version=getattr(easyocr, '__version__', None))
+    for name, checksum in manifest['files'].items():
+        print(f"  {name}  sha256:{checksum[:16]}...")
+    print(f"Wrote {model_dir / MANIFEST_FILE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provision an offline EasyOCR model bundle')
+    parser.add_argument('--model-dir', default=default_model_dir(),
+                        help='Bundle directory (default: $EASYOCR_MODEL_DIR)')
+    parser.add_argument('--languages', default='en', help='Comma separated language codes (default: en)')
+    parser.add_argument('--verify', action='store_true', help='Only verify an existing bundle against its manifest')
+    args = parser.parse_args()
+
+    if not args.model_dir:
+        parser.error("--model-dir is required when $EASYOCR_MODEL_DIR is not set")
+    languages = [language.strip() for language in args.languages.split(',') if language.strip()]
+
+    if args.verify:
+        try:
+            manifest = verify_manifest(args.model_dir, languages)
+        except OCRError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+        print(f"✓ {len(manifest['files'])} model files verified in {args.model_dir}")
+        return
+
+    provision(args.model_dir, languages)
+
+
+if __name__ == "__main__":
+    main()
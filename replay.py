@@ -0,0 +1,349 @@
+"""
+Offline replay of recorded group messages through the real processing path.
+
+A recording is a JSON Lines file with one message per line. Text messages
+carrying a Temu share link name the store the link resolves to, and image
+messages point at a screenshot on disk (optionally with the expected store
+name, used when OCR is stubbed out):
+
+    {"id": 1, "text": "https://share.temu.com/AbCdEfGhIjK", "share_title": "Crystal Shop"}
+    {"id": 2, "image": "group_images/image_2.jpg", "store_name": "Crystal Shop"}
+
+The replay uses a fake Telethon client that serves the recorded messages and
+copies the recorded images on download, and a local stub HTTP server that
+answers share links with the same redirect Temu sends.
+"""
+import asyncio
+import json
+import random
+import shutil
+import string
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import quote
+
+from exceptions import InvalidImageError
+
+# Share codes are 11 characters, which makes the URL exactly 34 characters long
+SHARE_URL_PREFIX = "https://share.temu.com/"
+SHARE_CODE_LENGTH = 11
+
+
+class FakeMedia:
+    """Stands in for a Telethon media object; points at the recorded image."""
+
+    def __init__(self, path):
+        self.path = str(path)
+
+
+class FakeMessage:
+    """Minimal Telethon message with the attributes the monitor reads."""
+
+    def __init__(self, id, text=None, media=None, date=None):
+        self.id = id
+        self.text = text
+        self.message = text
+        self.media = media
+        self.date = date or datetime.now()
+
+
+class FakeTelegramClient:
+    """
+    In-memory replacement for ``TelegramClient`` that serves recorded messages.
+
+    ``get_messages`` hands out the next unseen messages, newest first like
+    Telegram does, so repeated fetch cycles walk through the whole recording.
+    Sent files are collected in ``sent`` instead of being uploaded.
+    """
+
+    def __init__(self, messages, group_id=1, latency=0.0):
+        """
+        Args:
+            messages: FakeMessage objects in chronological order
+            group_id: ID reported for the monitored group
+            latency: Simulated network round trip in seconds for each API call
+        """
+        self.messages = list(messages)
+        self.group_id = group_id
+        self.latency = latency
+        self.sent = []
+        self.position = 0
+        self.last_fetch_started = None
+        self._connected = False
+
+    @property
+    def exhausted(self):
+        """True once every recorded message has been handed out"""
+        return self.position >= len(self.messages)
+
+    async def _network(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def connect(self):
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self):
+        return self._connected
+
+    async def is_user_authorized(self):
+        return True
+
+    async def start(self):
+        self._connected = True
+
+    async def get_me(self):
+        return SimpleNamespace(id=0, first_name="Replay", username="replay")
+
+    async def get_dialogs(self, *args, **kwargs):
+        return []
+
+    async def iter_dialogs(self, *args, **kwargs):
+        for dialog in []:
+            yield dialog
+
+    async def get_entity(self, entity):
+        await self._network()
+        return SimpleNamespace(id=self.group_id, title="Replay group", megagroup=False, username=None)
+
+    async def get_messages(self, entity, limit=50, **kwargs):
+        self.last_fetch_started = time.perf_counter()
+        await self._network()
+        batch = self.messages[self.position:self.position + limit]
+        self.position += len(batch)
+        return list(reversed(batch))
+
+    async def iter_messages(self, entity, limit=None, reverse=False, min_id=0, offset_date=None, **kwargs):
+        messages = [m for m in self.messages if m.id > (min_id or 0)]
+        if offset_date is not None:
+            messages = [m for m in messages if m.date > offset_date]
+        if not reverse:
+            messages.reverse()
+        for message in messages[:limit]:
+            yield message
+
+    async def download_media(self, media, file=None):
+        await self._network()
+        shutil.copyfile(media.path, file)
+        return file
+
+    async def send_file(self, entity, file, **kwargs):
+        await self._network()
+        self.sent.append((entity, file))
+
+
+class _StubTemuHandler(BaseHTTPRequestHandler):
+    """Answers /<share code> with the 302 redirect share.temu.com sends."""
+
+    def _redirect(self):
+        code = self.path.strip('/').split('?')[0]
+        title = self.server.titles.get(code)
+        if title is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        location = f"https://www.temu.com/mall.html?share_title={quote(title)}&refer_share_id={code}"
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = _redirect
+    do_HEAD = _redirect
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubTemuServer:
+    """
+    Local HTTP server resolving share codes to store titles.
+
+    Use as a context manager; ``url`` is passed to TemuKeywordExtractor as its
+    endpoint.
+    """
+
+    def __init__(self, titles=None, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _StubTemuHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.titles = dict(titles or {})
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def titles(self):
+        return self.httpd.titles
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubImageProcessor:
+    """ImageProcessor replacement returning the store names from the recording."""
+
+    def __init__(self, store_names):
+        """
+        Args:
+            store_names: Mapping of downloaded image path to store name
+                (None for screenshots that should fail validation)
+        """
+        self.store_names = store_names
+
+    def process_image(self, image_path):
+        store_name = self.store_names.get(str(image_path))
+        if not store_name:
+            raise InvalidImageError(f"No store name recorded for {image_path}")
+        return store_name
+
+
+def load_recording(path):
+    """Load a JSON Lines recording into a list of message records."""
+    records = []
+    with Path(path).open('r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def save_recording(path, records):
+    """Write message records as JSON Lines."""
+    with Path(path).open('w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def random_share_code(rng):
+    """Return a random share code that makes a 34 character share URL."""
+    return ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(SHARE_CODE_LENGTH))
+
+
+def generate_recording(images, count, store_names=None, seed=0):
+    """
+    Build a synthetic recording from screenshots on disk.
+
+    Every image is preceded by a share link; roughly half of the links resolve
+    to the image's store name so both matches and misses are exercised, and
+    every third message is plain chat text.
+
+    Args:
+        images: Paths of screenshots to cycle through
+        count: Number of messages to generate
+        store_names: Optional mapping of image path to its true store name
+        seed: Random seed for reproducible recordings
+
+    Returns:
+        List of message records
+    """
+    rng = random.Random(seed)
+    images = [str(path) for path in images]
+    if not images:
+        raise ValueError("No images to build a recording from")
+    store_names = store_names or {}
+
+    records = []
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        message_id = i + 1
+        record = {'id': message_id, 'date': (start + timedelta(seconds=message_id)).isoformat()}
+        kind = i % 3
+        image = images[(i // 3) % len(images)]
+        store_name = store_names.get(image) or f"Store{(i // 3) % len(images)}"
+        if kind == 0:
+            title = store_name if rng.random() < 0.5 else f"Other{rng.randrange(10**6)} shop"
+            record['text'] = f"Look at this {SHARE_URL_PREFIX}{random_share_code(rng)}"
+            record['share_title'] = title
+        elif kind == 1:
+            record['image'] = image
+            record['store_name'] = store_name
+        else:
+            record['text'] = "thanks, followed!"
+        records.append(record)
+    return records
+
+
+def build_messages(records):
+    """
+    Turn recording records into fake messages plus the stub lookup tables.
+
+    Returns:
+        Tuple of (messages, share titles by share code, store names by message ID)
+    """
+    messages = []
+    titles = {}
+    store_names = {}
+    for record in records:
+        text = record.get('text')
+        media = FakeMedia(record['image']) if record.get('image') else None
+        date = datetime.fromisoformat(record['date']) if record.get('date') else None
+        messages.append(FakeMessage(record['id'], text=text, media=media, date=date))
+
+        if text and record.get('share_title'):
+            for word in text.split():
+                if word.startswith(SHARE_URL_PREFIX):
+                    titles[word[len(SHARE_URL_PREFIX):][:SHARE_CODE_LENGTH]] = record['share_title']
+        if media is not None:
+            store_names[record['id']] = record.get('store_name')
+    return messages, titles, store_names
+
+
+def build_replay_monitor(records, images_dir, endpoint, ocr_stub=False, latency=0.0, group_id=1,
+                         **monitor_kwargs):
+    """
+    Create a TelegramGroupMonitor wired to a fake client for a recording.
+
+    Args:
+        records: Message records from load_recording/generate_recording
+        images_dir: Scratch directory for downloaded images
+        endpoint: Base URL of the StubTemuServer
+        ocr_stub: Use the recorded store names instead of running EasyOCR
+        latency: Simulated Telegram round trip in seconds
+        group_id: ID of the replayed group
+        monitor_kwargs: Passed on to TelegramGroupMonitor
+
+    Returns:
+        Tuple of (monitor, fake client, share titles by share code)
+    """
+    from telegram_client import TelegramGroupMonitor
+    from temu_keyword_extractor import TemuKeywordExtractor
+
+    messages, titles, store_names = build_messages(records)
+    client = FakeTelegramClient(messages, group_id=group_id, latency=latency)
+    monitor = TelegramGroupMonitor(
+        client=client,
+        group_id=client.group_id,
+        keyword_extractor=TemuKeywordExtractor(endpoint=endpoint),
+        images_dir=images_dir,
+        **{'cache_file': None, 'state_file': None, **monitor_kwargs}
+    )
+    if ocr_stub:
+        monitor._image_processor = StubImageProcessor({
+            str(monitor.images_dir / f"image_{message_id}.jpg"): name
+            for message_id, name in store_names.items()
+        })
+    return monitor, client, titles
@@ -0,0 +1,120 @@
+"""
+Learned store-name regions of interest for ImageProcessor.
+
+Screenshots from the same device layout put the store name and the
+"Following/Sold/Items" anchors in the same place. Each successful extraction
+records where they were, normalized to the image size and grouped by the
+screen's aspect ratio, and once a layout has been seen a few times OCR is run
+on just that band of the screenshot instead of the fixed top-percent crop.
+The calibration is persisted to JSON so it survives restarts. It is written
+right away when a layout's region changes; samples that leave the region as
+it was are written by ``flush()``, which the monitor calls once per fetch cycle.
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from state_store import load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+ROI_CALIBRATION_FILE = "roi_calibration.json"
+
+# Normalized (left, top, right, bottom) box
+Region = Tuple[float, float, float, float]
+
+
+class RegionCalibration:
+    """Per aspect-ratio bucket record of where store names and anchors appear."""
+
+    def __init__(self, path: Optional[str] = ROI_CALIBRATION_FILE, min_samples: int = 3,
+                 max_samples: int = 50, margin: float = 0.02, bucket_step: float = 0.05):
+        """
+        Args:
+            path: JSON file the calibration is loaded from and saved to (None keeps it in memory)
+            min_samples: Successful extractions needed before a bucket's region is used
+            max_samples: Most recent extractions kept per bucket
+            margin: Padding added above and below the learned band, as a fraction of image height
+            bucket_step: Width of the aspect ratio (height / width) buckets
+        """
+        self.path = path
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.margin = margin
+        self.bucket_step = bucket_step
+        self._lock = threading.Lock()
+        # Whether samples were recorded since the last save
+        self._unsaved = False
+        self.buckets: Dict[str, List[List[float]]] = {}
+        if path is not None:
+            self.buckets = load_json(path, default={}) or {}
+
+    def bucket(self, width: int, height: int) -> str:
+        """Aspect ratio bucket key for an image size, e.g. '2.15'."""
+        aspect = height / width
+        return f"{round(aspect / self.bucket_step) * self.bucket_step:.2f}"
+
+    def region_for(self, width: int, height: int) -> Optional[Region]:
+        """
+        Learned crop region for an image size.
+
+        The band spans the full width (store names vary in length) and covers
+        every recorded store name and anchor box plus ``margin``.
+
+        Returns:
+            Normalized (left, top, right, bottom), or None while the layout is
+            not calibrated yet
+        """
+        with self._lock:
+            return self._region(self.buckets.get(self.bucket(width, height), []))
+
+    def _region(self, boxes) -> Optional[Region]:
+        if len(boxes) < self.min_samples:
+            return None
+        top = min(box[1] for box in boxes)
+        bottom = max(box[3] for box in boxes)
+        return (0.0, max(0.0, top - self.margin), 1.0, min(1.0, bottom + self.margin))
+
+    def record(self, width: int, height: int, boxes: Sequence[Region]):
+        """
+        Record the normalized boxes of a successful extraction's store name and anchors.
+
+        They are stored as one box enclosing them all. The file is only
+        rewritten when this changes the layout's region; see ``flush()``.
+        """
+        if not boxes:
+            return
+        enclosing = [
+            round(min(box[0] for box in boxes), 4),
+            round(min(box[1] for box in boxes), 4),
+            round(max(box[2] for box in boxes), 4),
+            round(max(box[3] for box in boxes), 4),
+        ]
+        key = self.bucket(width, height)
+        with self._lock:
+            samples = self.buckets.setdefault(key, [])
+            before = self._region(samples)
+            samples.append(enclosing)
+            del samples[:-self.max_samples]
+            if len(samples) == self.min_samples:
+                logger.info("Calibrated store name region for aspect ratio %s", key)
+            changed = self._region(samples) != before
+            self._unsaved = True
+        if changed:
+            self.save()
+
+    def flush(self):
+        """Save samples recorded since the last save, if any."""
+        if self._unsaved:
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            snapshot = {bucket: list(samples) for bucket, samples in self.buckets.items()}
+            self._unsaved = False
+        try:
+            save_json(self.path, snapshot)
+        except Exception as e:
+            logger.error("Error saving ROI calibration: %s", e)
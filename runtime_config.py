@@ -0,0 +1,369 @@
+"""
+Runtime configuration that can change while the bot runs.
+
+Everything the bot may need to change without a restart is read into one
+``RuntimeConfig``:
+
+- ``runtime_config.json`` (or ``$RUNTIME_CONFIG``), for example::
+
+    {
+      "chats": ["-1001234567890"],
+      "poll_interval": 120,
+      "delivery_concurrency": 4,
+      "album_window": 1.0,
+      "ocr_concurrency": 1,
+      "deferred_window": 1800,
+      "deferred_max_items": 500,
+      "ocr": {"min_confidence": 0.6, "crop_percent": 30, "threads": 4, "idle_timeout": 900},
+      "delivery": {"default_targets": ["@alice"], "rules": []}
+    }
+
+  Every key is optional. Without ``chats`` the chat in selected_group.json is
+  monitored. Without ``delivery`` the targets come from delivery_targets.json.
+- ``selected_group.json`` and ``delivery_targets.json`` themselves.
+
+``ConfigWatcher`` checks these files every few seconds and reloads them on
+SIGHUP. Listeners get the new configuration and apply it in place. Loaded OCR
+models, keywords, parked images and queued deliveries are kept. A file that
+does not parse or validate is reported and the running configuration stays
+in effect.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import signal
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from deferred_ocr import DEFAULT_MAX_ITEMS, DEFAULT_WINDOW
+from exceptions import ConfigError
+from metrics import CONFIG_RELOADS
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_CONFIG_FILE = Path("runtime_config.json")
+RUNTIME_CONFIG_ENV = "RUNTIME_CONFIG"
+# Seconds between checks of the configuration files for changes
+CONFIG_CHECK_INTERVAL_ENV = "CONFIG_CHECK_INTERVAL"
+DEFAULT_CHECK_INTERVAL = 5.0
+
+SELECTED_GROUP_FILE = Path("selected_group.json")
+
+# Seconds between fetches of recent messages
+DEFAULT_POLL_INTERVAL = 300
+# Uploads in flight at once, and seconds images wait to be sent together as an album
+DEFAULT_DELIVERY_CONCURRENCY = 4
+DEFAULT_ALBUM_WINDOW = 1.0
+
+# ImageProcessor attributes that can be changed without reloading the models
+# (plus threads, idle_timeout and max_rss_mb; see ImageProcessor.configure)
+OCR_SETTINGS = {
+    'crop_percent': float, 'downscale': float, 'grayscale': bool, 'contrast': bool,
+    'target_text_height': int, 'min_confidence': float, 'two_phase': bool, 'top_k': int,
+    'threads': int, 'idle_timeout': float, 'max_rss_mb': float,
+}
+
+
+def _read_json(path):
+    """The JSON object in ``path``, or an empty one if the file does not exist"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with path.open('r') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read {path}: {e}")
+    if not isinstance(data, dict):
+        raise ConfigError(f"{path} must contain a JSON object")
+    return data
+
+
+# Ranges of the OCR settings that are not simply positive: (minimum, maximum, whether
+# the minimum itself is allowed). A min_confidence of 0 turns the fallback off.
+OCR_BOUNDS = {
+    'crop_percent': (0, 100, False),
+    'downscale': (0, 1, False),
+    'min_confidence': (0, 1, True),
+    'top_k': (1, None, True),
+}
+
+
+def _number(data, key, kind, default, minimum=0, maximum=None, inclusive=False):
+    """``data[key]`` as ``kind``, checked to lie above ``minimum`` and at most ``maximum``"""
+    value = data.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ConfigError(f"'{key}' must be a number, not {value!r}")
+    # Written so that NaN fails every check
+    above = value >= minimum if inclusive else value > minimum
+    if not above or (maximum is not None and not value <= maximum):
+        if maximum is not None:
+            allowed = f"in {'[' if inclusive else '('}{minimum}, {maximum}]"
+        elif inclusive:
+            allowed = f"at least {minimum}"
+        else:
+            allowed = "positive" if minimum == 0 else f"greater than {minimum}"
+        raise ConfigError(f"'{key}' must be {allowed}, not {value!r}")
+    if kind is int and value != int(value):
+        raise ConfigError(f"'{key}' must be a whole number, not {value!r}")
+    return kind(value)
+
+
+class RuntimeConfig:
+    """One consistent set of the settings that can be reloaded."""
+
+    def __init__(self, chats: Optional[List[str]] = None, selected_group=None, delivery=None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 delivery_concurrency: int = DEFAULT_DELIVERY_CONCURRENCY,
+                 album_window: float = DEFAULT_ALBUM_WINDOW, ocr_concurrency: Optional[int] = None,
+                 deferred_window: float = DEFAULT_WINDOW, deferred_max_items: int = DEFAULT_MAX_ITEMS,
+                 ocr: Optional[dict] = None):
+        """
+        Args:
+            chats: Chats to monitor from the runtime config file, or None to use the selected group
+            selected_group: Chat ID from selected_group.json
+            delivery: DeliveryConfig with the targets and routing rules
+            poll_interval: Seconds between fetches of recent messages
+            delivery_concurrency: Uploads in flight at once
+            album_window: Seconds images for one target wait to go out as one album
+            ocr_concurrency: Images OCR'd at once (default: 1, or more with an OCR server)
+            deferred_window: Seconds images stay parked waiting for a keyword
+            deferred_max_items: Parked images kept at most
+            ocr: ImageProcessor settings (see OCR_SETTINGS)
+        """
+        if delivery is None:
+            from delivery import DeliveryConfig
+            delivery = DeliveryConfig()
+        self.chats = [str(chat) for chat in chats] if chats is not None else None
+        self.selected_group = selected_group
+        self.delivery = delivery
+        self.poll_interval = poll_interval
+        self.delivery_concurrency = delivery_concurrency
+        self.album_window = album_window
+        self.ocr_concurrency = ocr_concurrency
+        self.deferred_window = deferred_window
+        self.deferred_max_items = deferred_max_items
+        self.ocr = dict(ocr or {})
+
+    @property
+    def monitored_chats(self) -> List[str]:
+        """The configured chats, or the selected group"""
+        if self.chats is not None:
+            return self.chats
+        return [str(self.selected_group)] if self.selected_group is not None else []
+
+    @classmethod
+    def load(cls, path=None, delivery_path=None, selected_group_file=SELECTED_GROUP_FILE):
+        """
+        Read and validate the configuration files.
+
+        Raises:
+            ConfigError: If the runtime config file is not valid JSON or a value is invalid
+        """
+        # delivery.py imports ResizableSemaphore from this module
+        from delivery import DELIVERY_CONFIG_FILE, DeliveryConfig
+
+        path = Path(path or os.getenv(RUNTIME_CONFIG_ENV) or RUNTIME_CONFIG_FILE)
+        data = _read_json(path)
+        unknown = set(data) - {'chats', 'poll_interval', 'delivery_concurrency', 'album_window', 'ocr_concurrency',
+                               'deferred_window', 'deferred_max_items', 'ocr', 'delivery'}
+        if unknown:
+            logger.warning("Ignoring unknown settings in %s: %s", path, ", ".join(sorted(unknown)))
+
+        chats = data.get('chats')
+        if chats is not None and (not isinstance(chats, list) or not all(isinstance(c, (str, int)) for c in chats)):
+            raise ConfigError(f"'chats' must be a list of chat IDs, not {chats!r}")
+
+        ocr = data.get('ocr') or {}
+        if not isinstance(ocr, dict):
+            raise ConfigError(f"'ocr' must be an object, not {ocr!r}")
+        for key, value in ocr.items():
+            kind = OCR_SETTINGS.get(key)
+            if kind is None:
+                raise ConfigError(f"Unknown OCR setting '{key}' (can be changed live: {', '.join(OCR_SETTINGS)})")
+            if kind is bool and not isinstance(value, bool):
+                raise ConfigError(f"OCR setting '{key}' must be true or false, not {value!r}")
+            if kind is not bool:
+                _number(ocr, key, kind, None, *OCR_BOUNDS.get(key, ()))
+
+        delivery = data.get('delivery')
+        if delivery is None:
+            delivery = _read_json(delivery_path or DELIVERY_CONFIG_FILE)
+        if not isinstance(delivery, dict):
+            raise ConfigError(f"'delivery' must be an object, not {delivery!r}")
+        try:
+            delivery = DeliveryConfig.from_dict(delivery)
+        except (AttributeError, TypeError) as e:
+            raise ConfigError(f"Invalid delivery configuration: {e}")
+
+        return cls(
+            chats=chats,
+            selected_group=_read_json(selected_group_file).get('group_id'),
+            delivery=delivery,
+            poll_interval=_number(data, 'poll_interval', float, DEFAULT_POLL_INTERVAL),
+            delivery_concurrency=_number(data, 'delivery_concurrency', int, DEFAULT_DELIVERY_CONCURRENCY),
+            album_window=_number(data, 'album_window', float, DEFAULT_ALBUM_WINDOW),
+            ocr_concurrency=_number(data, 'ocr_concurrency', int, None),
+            deferred_window=_number(data, 'deferred_window', float, DEFAULT_WINDOW),
+            deferred_max_items=_number(data, 'deferred_max_items', int, DEFAULT_MAX_ITEMS),
+            ocr=ocr,
+        )
+
+    def changes(self, other) -> List[str]:
+        """Names of the settings that differ from ``other``"""
+        changed = [name for name in ('chats', 'selected_group', 'poll_interval', 'delivery_concurrency',
+                                     'album_window', 'ocr_concurrency', 'deferred_window',
+                                     'deferred_max_items', 'ocr')
+                   if getattr(self, name) != getattr(other, name)]
+        if self.delivery.to_dict() != other.delivery.to_dict():
+            changed.append('delivery')
+        return changed
+
+
+class ResizableSemaphore(asyncio.Semaphore):
+    """
+    Semaphore whose number of slots can change while it is in use.
+
+    Growing frees the new slots right away. Shrinking takes free slots first;
+    slots still held are retired as their holders release them, so running
+    work is never interrupted.
+    """
+
+    def __init__(self, value=1):
+        super().__init__(value)
+        self.size = value
+        self._retiring = 0
+
+    def resize(self, size):
+        if size < 1:
+            raise ValueError(f"Semaphore size must be at least 1, not {size}")
+        delta = size - self.size
+        self.size = size
+        if delta > 0:
+            reclaimed = min(delta, self._retiring)
+            self._retiring -= reclaimed
+            for _ in range(delta - reclaimed):
+                super().release()
+        for _ in range(-delta):
+            if self._value > 0:
+                self._value -= 1
+            else:
+                self._retiring += 1
+
+    def release(self):
+        if self._retiring:
+            self._retiring -= 1
+            return
+        super().release()
+
+
+class ConfigWatcher:
+    """Reloads the RuntimeConfig when its files change or on SIGHUP, and tells the listeners."""
+
+    def __init__(self, path=None, interval: Optional[float] = None, delivery_path=None,
+                 selected_group_file=SELECTED_GROUP_FILE):
+        """
+        Args:
+            path: Runtime config file (default: $RUNTIME_CONFIG or runtime_config.json)
+            interval: Seconds between checks for changed files (default:
+                $CONFIG_CHECK_INTERVAL or DEFAULT_CHECK_INTERVAL); 0 only reloads on SIGHUP
+            delivery_path: Delivery targets file (default: delivery_targets.json)
+            selected_group_file: Selected group file
+
+        Raises:
+            ConfigError: If the configuration is invalid at startup
+        """
+        from delivery import DELIVERY_CONFIG_FILE
+
+        self.path = Path(path or os.getenv(RUNTIME_CONFIG_ENV) or RUNTIME_CONFIG_FILE)
+        self.delivery_path = Path(delivery_path or DELIVERY_CONFIG_FILE)
+        self.selected_group_file = Path(selected_group_file)
+        if interval is None:
+            interval = float(os.getenv(CONFIG_CHECK_INTERVAL_ENV, DEFAULT_CHECK_INTERVAL))
+        self.interval = interval
+        self.config = self._load()
+        self.reloads = 0
+        self._stamps = self._file_stamps()
+        self._listeners: List[Callable] = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def _load(self):
+        return RuntimeConfig.load(self.path, self.delivery_path, self.selected_group_file)
+
+    def _file_stamps(self):
+        stamps = []
+        for path in (self.path, self.delivery_path, self.selected_group_file):
+            try:
+                stat = path.stat()
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def subscribe(self, listener: Callable):
+        """Call ``listener(config)`` (a function or coroutine function) after every reload that changed something"""
+        self._listeners.append(listener)
+
+    async def reload(self, reason='request'):
+        """
+        Read the files again and apply what changed.
+
+        Returns:
+            False if the new configuration was rejected
+        """
+        async with self._lock:
+            self._stamps = self._file_stamps()
+            try:
+                config = self._load()
+            except ConfigError as e:
+                CONFIG_RELOADS.labels('rejected').inc()
+                logger.error("Configuration not reloaded (%s), keeping the current one: %s", reason, e)
+                return False
+            changed = self.config.changes(config)
+            self.config = config
+            if not changed:
+                logger.debug("Configuration reloaded (%s), nothing changed", reason)
+                return True
+            self.reloads += 1
+            CONFIG_RELOADS.labels('applied').inc()
+            logger.info("Configuration reloaded (%s): %s changed", reason, ", ".join(changed))
+            for listener in self._listeners:
+                try:
+                    result = listener(config)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.error("Error applying the new configuration: %s", e)
+            return True
+
+    async def run(self):
+        """Check the files for changes until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._file_stamps() != self._stamps:
+                await self.reload('file changed')
+
+    def start(self):
+        """Watch the files in the background (unless the interval is 0) and reload on SIGHUP"""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.reload('SIGHUP')))
+        except (AttributeError, NotImplementedError, RuntimeError):
+            logger.debug("No SIGHUP on this platform; configuration changes are picked up from the files only")
+        if self.interval:
+            self._task = asyncio.create_task(self.run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass
@@ -1,25 +1,246 @@
 #!/usr/bin/env python3
 """
-Interactive group selection script for Telegram User Bot.
+Group selection script for Telegram User Bot.
 Run this script to select which group chat to monitor.
+
+Dialogs are streamed with ``iter_dialogs`` and only groups and channels are
+kept, so accounts with thousands of chats neither wait for one huge request
+nor hold every entity in memory. The list is cached in dialog_cache.json for
+a day, so repeat runs do not contact Telegram at all. Chats are found by
+searching for part of their name or ID, or selected without any prompt with
+``python main.py --select-group <name or ID>``.
 """
 
 import asyncio
 import os
 import json
+import sys
+import time
 from telethon import TelegramClient
 from telethon.errors import AuthKeyError
 from dotenv import load_dotenv
 from pathlib import Path
 
+from buffered_session import open_session
+from state_store import load_json, save_json
+
 # Load environment variables
 load_dotenv()
 
 # Define the path for storing the selected group
 SELECTED_GROUP_FILE = Path("selected_group.json")
 
-async def select_target_group():
-    """Interactively select a target group from the user's chats"""
+# Groups and channels of the account, reused for this many seconds
+DIALOG_CACHE_FILE = Path("dialog_cache.json")
+DIALOG_CACHE_TTL = 24 * 60 * 60
+
+# Chats listed at once in interactive mode
+PAGE_SIZE = 20
+
+
+def group_info(dialog):
+    """The name and IDs of a group or channel dialog, or None for any other chat"""
+    if not (dialog.is_group or dialog.is_channel):
+        return None
+    info = {'name': dialog.name, 'id': dialog.id}
+    # For megagroups, determine the full ID format
+    if getattr(dialog.entity, 'megagroup', False):
+        info['full_id'] = int(f"-100{dialog.entity.id}")
+    return info
+
+
+def selected_id(group):
+    """The ID the bot monitors a group by (the full ID for megagroups)"""
+    return group.get('full_id', group['id'])
+
+
+def search_groups(groups, query):
+    """
+    Groups whose name or ID contains ``query`` (case-insensitive), best matches first.
+
+    Exact ID or name matches come first, then names starting with the query,
+    then any other match.
+    """
+    query = query.strip().lower()
+    ranked = []
+    for group in groups:
+        name = group['name'].lower()
+        ids = [str(group['id']), str(group.get('full_id', ''))]
+        if query in ids or query == name:
+            rank = 0
+        elif name.startswith(query):
+            rank = 1
+        elif query in name or any(query in group_id for group_id in ids):
+            rank = 2
+        else:
+            continue
+        ranked.append((rank, group))
+    return [group for rank, group in sorted(ranked, key=lambda entry: entry[0])]
+
+
+def load_dialog_cache(session_name='session_name', max_age=DIALOG_CACHE_TTL):
+    """The cached groups of a session, or None if there is no recent enough cache"""
+    cache = load_json(DIALOG_CACHE_FILE, default=None)
+    if not cache or cache.get('session') != session_name:
+        return None
+    if time.time() - cache.get('updated', 0) > max_age:
+        return None
+    return cache.get('groups')
+
+
+def save_dialog_cache(groups, session_name='session_name'):
+    try:
+        save_json(DIALOG_CACHE_FILE, {'session': session_name, 'updated': time.time(), 'groups': groups})
+    except Exception as e:
+        print(f"Error saving dialog cache: {e}")
+
+
+async def fetch_groups(client, exact=None):
+    """
+    Stream the account's groups and channels.
+
+    Args:
+        client: Connected TelegramClient
+        exact: Stop as soon as a group with this ID (or full ID) is found
+
+    Returns:
+        Tuple of (groups, whether every dialog was read)
+    """
+    groups = []
+    read = 0
+    async for dialog in client.iter_dialogs(ignore_migrated=True):
+        read += 1
+        if read % 500 == 0:
+            print(f"Read {read} chats...", end='\r', flush=True)
+        info = group_info(dialog)
+        if info is None:
+            continue
+        groups.append(info)
+        if exact is not None and exact in (str(info['id']), str(info.get('full_id'))):
+            return groups, False
+    return groups, True
+
+
+def resolve_query(groups, query):
+    """
+    Non-interactive selection.
+
+    Returns:
+        The group ID for a query matching exactly one group (or an exact ID or
+        name), a numeric query matching no group as is, otherwise None
+    """
+    matches = search_groups(groups, query)
+    exact = [group for group in matches if query.strip().lower() in
+             (group['name'].lower(), str(group['id']), str(group.get('full_id', '')))]
+    if len(exact) == 1 or len(matches) == 1:
+        group = (exact or matches)[0]
+        print(f"Selected: {group['name']} (ID: {selected_id(group)})")
+        return selected_id(group)
+    if not matches:
+        try:
+            group_id = int(query)
+        except ValueError:
+            print(f"No group or channel matches '{query}'.")
+            return None
+        print(f"No chat with ID {group_id} in your dialogs; using it as entered.")
+        return group_id
+    print(f"'{query}' matches {len(matches)} chats, be more specific:")
+    show_groups(matches[:PAGE_SIZE])
+    return None
+
+
+def show_groups(groups):
+    for i, group in enumerate(groups, 1):
+        print(f"{i}. {group['name']} (ID: {group['id']})")
+
+        # Show the full ID for megagroups if available
+        if 'full_id' in group:
+            print(f"   Full ID: {group['full_id']} (use this for megagroups)")
+
+
+def choose_group(groups):
+    """Let the user search the groups and pick one; returns the group ID or None"""
+    matches = groups
+    while True:
+        shown = matches[:PAGE_SIZE]
+        print()
+        show_groups(shown)
+        if len(matches) > len(shown):
+            print(f"... and {len(matches) - len(shown)} more, search to narrow the list")
+
+        try:
+            choice = input("\nEnter a number to select, text to search by name or ID, "
+                           "'m' to enter an ID manually or 'q' to quit: ").strip()
+        except EOFError:
+            return None
+        if choice.lower() == 'q':
+            return None
+        if choice.lower() == 'm':
+            # User wants to enter ID manually
+            manual_id = input("Enter the group ID manually: ").strip()
+            try:
+                group_id = int(manual_id)
+                print(f"Selected group with ID: {group_id}")
+                return group_id
+            except ValueError:
+                print("Invalid ID format. Please enter a numeric ID.")
+                continue
+        if choice.isdigit() and 1 <= int(choice) <= len(shown):
+            # User selected a group from the list
+            group = shown[int(choice) - 1]
+            print(f"Selected: {group['name']} (ID: {selected_id(group)})")
+            return selected_id(group)
+
+        matches = search_groups(groups, choice) if choice else groups
+        if not matches:
+            print(f"No chats match '{choice}'.")
+            matches = groups
+
+
+async def select_target_group(query=None, refresh=False, session_name='session_name'):
+    """
+    Select a target group from the user's chats and save it.
+
+    Args:
+        query: Name or ID (or part of one) to select without prompting; None
+            asks interactively
+        refresh: Read the dialogs from Telegram even if the cache is recent
+        session_name: Telethon session file to use
+
+    Returns:
+        The selected group ID, or None if nothing was selected
+    """
+    groups = None if refresh else load_dialog_cache(session_name)
+    if groups is not None:
+        print(f"Using {len(groups)} cached groups and channels from {DIALOG_CACHE_FILE} "
+              f"(pass --refresh-dialogs to reload them)")
+    else:
+        groups = await fetch_groups_from_telegram(session_name, exact=query.strip() if query else None)
+        if groups is None:
+            return None
+
+    if not groups and not query:
+        print("No groups or channels found in your account.")
+        return None
+
+    if query:
+        group_id = resolve_query(groups, query)
+    else:
+        print(f"\nFound {len(groups)} groups and channels. Select one to monitor:")
+        group_id = choose_group(groups)
+    if group_id is None:
+        return None
+
+    # Save the selected group ID to the persistent storage
+    save_selected_group(group_id)
+
+    print(f"\nSelected group ID {group_id} has been saved successfully!")
+    print("The bot will now monitor this group when restarted.")
+    return group_id
+
+
+async def fetch_groups_from_telegram(session_name='session_name', exact=None):
+    """Connect and stream the groups, caching them when every dialog was read; None on failure"""
     api_id = os.getenv('API_ID')
     api_hash = os.getenv('API_HASH')
 
@@ -27,10 +248,10 @@ async def select_target_group():
         raise ValueError("Missing required environment variables: API_ID or API_HASH")
 
     print("Connecting to Telegram to fetch your chats...")
-    
+
     # Create client with the same session name as the main bot
     client = TelegramClient(
-        'session_name',
+        open_session(session_name),
         api_id,
         api_hash,
         device_model='Telegram User Bot',
@@ -46,97 +267,20 @@ async def select_target_group():
 
         if not await client.is_user_authorized():
             print("Session is not authorized. Please run setup_session.py first.")
-            return
+            return None
 
         print("Fetching your chats...")
-        
-        # Get all dialogs (chats)
-        dialogs = await client.get_dialogs()
-        
-        # Filter out only groups/channels/private chats
-        groups = []
-        for dialog in dialogs:
-            # Include groups, channels, and private chats (but not the user's own chat)
-            if (hasattr(dialog.entity, 'megagroup') or 
-                hasattr(dialog.entity, 'broadcast') or 
-                dialog.is_user) and dialog.name != 'Saved Messages':
-                
-                # Format the group info for display
-                group_info = {
-                    'name': dialog.name,
-                    'id': dialog.id,
-                    'entity': dialog.entity
-                }
-                
-                # For megagroups, determine the full ID format
-                if hasattr(dialog.entity, 'megagroup') and dialog.entity.megagroup:
-                    full_group_id = int(f"-100{dialog.entity.id}")
-                    group_info['full_id'] = full_group_id
-                
-                groups.append(group_info)
-
-        if not groups:
-            print("No groups or channels found in your account.")
-            return
-
-        print(f"\nFound {len(groups)} chats. Select one to monitor:\n")
-        
-        # Display the groups with indices
-        for i, group in enumerate(groups, 1):
-            print(f"{i}. {group['name']} (ID: {group['id']})")
-            
-            # Show the full ID for megagroups if available
-            if 'full_id' in group:
-                print(f"   Full ID: {group['full_id']} (use this for megagroups)")
-
-        print(f"\n{len(groups) + 1}. Enter group ID manually")
-        
-        # Get user selection
-        while True:
-            try:
-                choice = input(f"\nEnter your choice (1-{len(groups) + 1}): ").strip()
-                choice_idx = int(choice) - 1
-                
-                if 0 <= choice_idx < len(groups):
-                    # User selected a group from the list
-                    selected_group = groups[choice_idx]
-                    
-                    # Determine which ID to use
-                    if 'full_id' in selected_group:
-                        selected_id = selected_group['full_id']
-                        print(f"Selected: {selected_group['name']} (Full ID: {selected_id})")
-                    else:
-                        selected_id = selected_group['id']
-                        print(f"Selected: {selected_group['name']} (ID: {selected_id})")
-                    
-                    break
-                elif choice_idx == len(groups):
-                    # User wants to enter ID manually
-                    manual_id = input("Enter the group ID manually: ").strip()
-                    try:
-                        selected_id = int(manual_id)
-                        print(f"Selected group with ID: {selected_id}")
-                        break
-                    except ValueError:
-                        print("Invalid ID format. Please enter a numeric ID.")
-                        continue
-                else:
-                    print(f"Please enter a number between 1 and {len(groups) + 1}")
-            except ValueError:
-                print(f"Please enter a number between 1 and {len(groups) + 1}")
-
-        # Save the selected group ID to the persistent storage
-        save_selected_group(selected_id)
-        
-        print(f"\nSelected group ID {selected_id} has been saved successfully!")
-        print("The bot will now monitor this group when restarted.")
-
+        groups, complete = await fetch_groups(client, exact=exact)
+        if complete:
+            save_dialog_cache(groups, session_name)
+        return groups
     except AuthKeyError:
         print("Authentication error. Please run setup_session.py to set up your session.")
     except Exception as e:
         print(f"Error during group selection: {e}")
     finally:
         await client.disconnect()
+    return None
 
 
 def save_selected_group(group_id):
@@ -173,4 +317,4 @@ def remove_selected_group():
 
 
 if __name__ == "__main__":
-    asyncio.run(select_target_group())
\ No newline at end of file
+    asyncio.run(select_target_group(sys.argv[1] if len(sys.argv) > 1 else None))
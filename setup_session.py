@@ -4,15 +4,18 @@ Authentication setup script for Telegram User Bot.
 Run this script in an environment where you can interact with it to set up your session.
 """
 
+import argparse
 import asyncio
 import os
 from telethon import TelegramClient
 from dotenv import load_dotenv
 
+from buffered_session import open_session
+
 # Load environment variables
 load_dotenv()
 
-async def setup_session():
+async def setup_session(session_name='session_name'):
     """Set up the Telegram session"""
     api_id = os.getenv('API_ID')
     api_hash = os.getenv('API_HASH')
@@ -25,7 +28,7 @@ async def setup_session():
     
     # Create client with the same session name as the main bot
     client = TelegramClient(
-        'session_name',
+        open_session(session_name),
         api_id,
         api_hash,
         device_model='Telegram User Bot',
@@ -56,4 +59,8 @@ async def setup_session():
         await client.disconnect()
 
 if __name__ == "__main__":
-    asyncio.run(setup_session())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Set up a Telegram session')
+    parser.add_argument('--session', default='session_name',
+                        help='Session file to create (default: session_name; sharded workers each need their own)')
+    args = parser.parse_args()
+    asyncio.run(setup_session(args.session))
\ No newline at end of file
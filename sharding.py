@@ -0,0 +1,358 @@
+"""
+Sharded monitoring: several worker processes split the monitored chats.
+
+Each worker runs one TelegramGroupMonitor per chat it owns, on its own
+Telegram session, with one OCR engine per process. Chats are assigned by
+consistent hashing over the live workers, so adding or losing a worker only
+moves the chats that hashed to it. Ownership is enforced with leases in the
+shared CoordinationStore (coordination.py): a worker renews its leases on
+every heartbeat, and when it dies its leases expire and the chats rehash to
+the survivors. Message dedup, the keyword registry and sent keywords live in
+the same store, so a chat that changes hands mid-stream is not reprocessed
+and no store is forwarded twice.
+
+Each worker also watches the runtime configuration (runtime_config.py): new
+settings apply to its running monitors, and a changed ``chats`` list is
+rebalanced on the next heartbeat.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence
+
+from coordination import COORDINATION_DB_FILE, MAX_MESSAGES_PER_CHAT, CoordinationStore, ShardCoordinator
+
+logger = logging.getLogger(__name__)
+
+# Directory holding each chat's images and caches when sharded
+SHARD_STATE_DIR = "shards"
+
+# Seconds a handed-over chat gets to finish the fetch in progress before it is
+# cancelled (less when the lease is shorter, see ShardWorker.stop_timeout)
+STOP_TIMEOUT = 20.0
+
+
+def _ring_hash(key: str) -> int:
+    # Stable across processes (unlike hash(), which is salted per interpreter)
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes, with virtual nodes for balance."""
+
+    def __init__(self, nodes: Sequence[str], replicas: int = 64):
+        self.nodes = sorted(nodes)
+        self._points = sorted((_ring_hash(f"{node}#{replica}"), node)
+                              for node in self.nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+
+    def node_for(self, key) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._hashes, _ring_hash(str(key))) % len(self._points)
+        return self._points[index][1]
+
+
+class TelegramMonitorFactory:
+    """Creates a worker's monitors on one Telegram session, sharing one OCR engine."""
+
+    def __init__(self, session_name='session_name', state_dir=SHARD_STATE_DIR, **monitor_kwargs):
+        """
+        Args:
+            session_name: Telethon session file of this worker
+            state_dir: Directory for each chat's images and caches
+            monitor_kwargs: Passed on to TelegramGroupMonitor
+        """
+        self.session_name = session_name
+        self.state_dir = Path(state_dir)
+        self.monitor_kwargs = monitor_kwargs
+        self._first = None
+
+    def __call__(self, chat_id, coordinator):
+        from telegram_client import TelegramGroupMonitor
+
+        # Message IDs are per chat, so every chat gets its own image directory and cache
+        chat_dir = self.state_dir / str(chat_id)
+        chat_dir.mkdir(parents=True, exist_ok=True)
+        monitor = TelegramGroupMonitor(
+            client=self._first.client if self._first else None,
+            group_id=chat_id,
+            images_dir=chat_dir / "images",
+            cache_file=chat_dir / "pipeline_cache.json",
+            state_file=chat_dir / "monitor_state.json",
+            session_name=self.session_name,
+            coordinator=coordinator,
+            **self.monitor_kwargs
+        )
+        if self._first is None:
+            self._first = monitor
+            monitor.preload_image_processor()
+        else:
+            monitor.share_ocr_engine(self._first)
+        return monitor
+
+
+class ShardWorker:
+    """One worker process: heartbeats, claims its chats and monitors them."""
+
+    def __init__(self, worker_id: str, chats: Sequence, store_path=COORDINATION_DB_FILE,
+                 monitor_factory: Optional[Callable] = None, heartbeat_interval: float = 5.0,
+                 lease_ttl: float = 15.0):
+        """
+        Args:
+            worker_id: Unique name of this worker
+            chats: Every monitored chat (all workers get the same list)
+            store_path: Shared CoordinationStore database
+            monitor_factory: Called with (chat ID, ShardCoordinator) to create a
+                monitor (default: TelegramMonitorFactory on the default session)
+            heartbeat_interval: Seconds between heartbeats and rebalancing
+            lease_ttl: Seconds a silent worker keeps its chats; must exceed heartbeat_interval
+        """
+        if lease_ttl <= heartbeat_interval:
+            raise ValueError(f"lease_ttl ({lease_ttl}s) must exceed heartbeat_interval ({heartbeat_interval}s)")
+        self.worker_id = worker_id
+        self.chats = [str(chat) for chat in chats]
+        self.store = CoordinationStore(store_path)
+        self.coordinator = ShardCoordinator(self.store, worker_id)
+        self.monitor_factory = monitor_factory or TelegramMonitorFactory()
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_ttl = lease_ttl
+        # A chat being handed over must be gone before its lease would expire
+        self.stop_timeout = min(STOP_TIMEOUT, (lease_ttl - heartbeat_interval) / 2)
+        # chat -> (monitor, fetch task), and every client connected so far
+        self.monitors: Dict = {}
+        self._clients: Dict = {}
+        # chat -> task stopping its monitor in the background
+        self._handovers: Dict = {}
+        # RuntimeConfig applied to every monitor, once a ConfigWatcher is attached
+        self.config = None
+
+    def apply_config(self, config):
+        """
+        Apply a reloaded RuntimeConfig to every monitor of this worker.
+
+        Chats are not switched per monitor: a ``chats`` list in the config
+        replaces the chats the workers split, and the next heartbeat hands
+        over or claims chats accordingly.
+        """
+        self.config = config
+        self.coordinator.keyword_ttl = config.deferred_window
+        if config.chats is not None and config.chats != self.chats:
+            logger.info("Monitored chats changed to %s", ", ".join(config.chats))
+            self.chats = list(config.chats)
+        for monitor, _ in self.monitors.values():
+            monitor.apply_config(config, follow_chats=False)
+
+    def assignment(self):
+        """Chats this worker should own among the currently live workers."""
+        live = self.store.live_workers(self.lease_ttl)
+        if self.worker_id not in live:
+            live.append(self.worker_id)
+        ring = HashRing(live)
+        return {chat for chat in self.chats if ring.node_for(chat) == self.worker_id}
+
+    async def rebalance(self):
+        """Heartbeat, hand over chats that hash elsewhere and claim the ones hashing here."""
+        # In a thread, like the monitors' store calls: waiting for another worker's
+        # write lock must not stall the event loop
+        await asyncio.to_thread(self.store.heartbeat, self.worker_id)
+        await asyncio.to_thread(self.store.prune, self.coordinator.keyword_ttl, MAX_MESSAGES_PER_CHAT)
+        wanted = await asyncio.to_thread(self.assignment)
+
+        for chat in list(self.monitors):
+            if chat not in wanted:
+                logger.info("Handing chat %s over to another worker", chat)
+                self._hand_over(chat)
+
+        for chat in self.chats:
+            if chat not in wanted or chat in self._handovers:
+                continue
+            if await asyncio.to_thread(self.store.acquire_lease, chat, self.worker_id, self.lease_ttl):
+                if chat not in self.monitors:
+                    await self._start_chat(chat)
+            elif chat in self.monitors:
+                # We were silent past the lease and another worker took the chat
+                logger.warning("Lost the lease on chat %s", chat)
+                self._hand_over(chat, release=False)
+
+    async def _start_chat(self, chat):
+        try:
+            monitor = self.monitor_factory(chat, self.coordinator)
+            if self.config is not None:
+                monitor.apply_config(self.config, follow_chats=False)
+            await monitor.connect_and_authorize()
+            if await monitor.resolve_target_entity() is None:
+                self.store.release_lease(chat, self.worker_id)
+                return
+        except Exception as e:
+            logger.error("Could not start monitoring chat %s: %s", chat, e)
+            self.store.release_lease(chat, self.worker_id)
+            return
+        self._clients[id(monitor.client)] = monitor.client
+        monitor.ingesting.set()
+        task = asyncio.create_task(monitor.fetch_recent_messages_periodically())
+        self.monitors[chat] = (monitor, task)
+        logger.info("Worker %s monitoring chat %s", self.worker_id, chat)
+        # Connecting can take a while; show other workers we are still alive
+        await asyncio.to_thread(self.store.heartbeat, self.worker_id)
+
+    def _hand_over(self, chat, release=True):
+        """Stop monitoring ``chat`` in the background, so the heartbeats go on meanwhile."""
+        monitor, task = self.monitors.pop(chat)
+        stopping = asyncio.create_task(self._stop_monitor(chat, monitor, task, release))
+        self._handovers[chat] = stopping
+        stopping.add_done_callback(lambda _: self._handovers.pop(chat, None))
+        return stopping
+
+    async def _stop_monitor(self, chat, monitor, task, release=True):
+        try:
+            monitor.request_stop()
+            await asyncio.wait({task}, timeout=self.stop_timeout)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            await monitor.flush_deliveries()
+            monitor.save_caches()
+            monitor.save_state()
+        except Exception as e:
+            logger.error("Error stopping chat %s: %s", chat, e)
+        finally:
+            if release:
+                self.store.release_lease(chat, self.worker_id)
+
+    async def run(self, duration: Optional[float] = None):
+        """Monitor until cancelled (or for ``duration`` seconds), then hand every chat back."""
+        deadline = time.monotonic() + duration if duration else None
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                try:
+                    await self.rebalance()
+                except Exception as e:
+                    logger.error("Error rebalancing worker %s: %s", self.worker_id, e)
+                await asyncio.sleep(self.heartbeat_interval)
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        for chat in list(self.monitors):
+            self._hand_over(chat)
+        if self._handovers:
+            await asyncio.gather(*self._handovers.values())
+        self.store.remove_worker(self.worker_id)
+        for client in self._clients.values():
+            if client.is_connected():
+                await client.disconnect()
+        self.store.close()
+
+
+def run_worker(worker_id, chats, store_path=COORDINATION_DB_FILE, session_name='session_name',
+               monitor_factory=None, duration=None, log_level='INFO', log_json=False, config_file=None,
+               **worker_kwargs):
+    """
+    Entry point of a worker process.
+
+    With ``config_file`` the worker watches that runtime configuration (see
+    runtime_config.py) and applies it to its monitors as it changes.
+    """
+    from log_setup import configure_logging
+    configure_logging(level=log_level, json_format=log_json)
+    worker = ShardWorker(worker_id, chats, store_path,
+                         monitor_factory=monitor_factory or TelegramMonitorFactory(session_name),
+                         **worker_kwargs)
+
+    async def run():
+        # SIGTERM (docker stop, or run_shards stopping) and SIGINT cancel the worker,
+        # whose stop() then saves the monitors' state and releases the leases
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        signalled = []
+
+        def on_signal(sig):
+            if not signalled:
+                logger.info("Worker %s received %s, stopping...", worker_id, sig.name)
+                signalled.append(sig)
+                task.cancel()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, on_signal, sig)
+            except NotImplementedError:
+                pass
+
+        watcher = None
+        if config_file is not None:
+            from runtime_config import ConfigWatcher
+            watcher = ConfigWatcher(config_file)
+            worker.apply_config(watcher.config)
+            watcher.subscribe(worker.apply_config)
+            watcher.start()
+        try:
+            await worker.run(duration)
+        except asyncio.CancelledError:
+            if not signalled:
+                raise
+        finally:
+            if watcher is not None:
+                watcher.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_shards(chats, sessions, store_path=COORDINATION_DB_FILE, restart_delay=10.0,
+               stopping: Optional[threading.Event] = None, stop_timeout: float = 30.0, **worker_kwargs):
+    """
+    Run one worker process per session and restart workers that crash.
+
+    Chats of a crashed worker move to the others once its leases expire and
+    move back when it has been restarted.
+
+    Args:
+        stopping: Event that stops the workers when set (main.py sets it on
+            SIGINT/SIGTERM, as this runs in a thread that gets no KeyboardInterrupt)
+        stop_timeout: Seconds the workers get to stop after SIGTERM before they are killed
+    """
+    context = multiprocessing.get_context('spawn')
+    if stopping is None:
+        stopping = threading.Event()
+
+    def spawn(index):
+        process = context.Process(
+            target=run_worker, name=f"worker-{index}",
+            args=(f"worker-{index}", chats, store_path, sessions[index]), kwargs=worker_kwargs)
+        process.start()
+        logger.info("Started worker-%s (pid %s, session %s)", index, process.pid, sessions[index])
+        return process
+
+    processes = [spawn(index) for index in range(len(sessions))]
+    try:
+        while not stopping.wait(restart_delay):
+            for index, process in enumerate(processes):
+                # Workers exiting on a Ctrl+C sent to the whole process group are not restarted
+                if not process.is_alive() and not stopping.is_set():
+                    logger.warning("worker-%s exited with code %s, restarting", index, process.exitcode)
+                    processes[index] = spawn(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Stopping workers...")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM: the worker saves its state and releases its leases
+        deadline = time.monotonic() + stop_timeout
+        for process in processes:
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("worker %s did not stop within %ss, killing it", process.name, stop_timeout)
+                process.kill()
+                process.join()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Soak test: push a very long synthetic message stream through the pipeline and
+watch memory and latency over time.
+
+The benchmark replays a few hundred messages; weeks of uptime are a different
+question. ``soak.py`` generates messages as they are fetched (so millions never
+sit in memory at once) and runs them through the real TelegramGroupMonitor with
+a fake Telegram client, the stub Temu server and a small pool of synthetic
+screenshots. Every ``--sample-every`` messages it records RSS, Python heap size
+and top allocators (tracemalloc), the size of the monitor's structures and
+queues, and latency percentiles of the messages since the last sample. It
+exits non-zero when memory keeps growing or latency drifts upwards after the
+warm-up:
+
+    python soak.py --messages 1000000
+    python soak.py --messages 200000 --sample-every 5000 --max-rss-slope 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from benchmark import RESULTS_DIR, git_revision, summarize
+from exceptions import InvalidImageError
+from log_setup import configure_logging, shutdown_logging
+from metrics import QUEUE_DEPTH, REGISTRY
+from model_lifecycle import current_rss
+from replay import (SHARE_CODE_LENGTH, SHARE_URL_PREFIX, FakeMedia, FakeMessage, FakeTelegramClient,
+                    StubTemuServer)
+from synthetic_screenshots import LABELS_FILE, generate_corpus
+
+DEFAULT_MESSAGES = 1_000_000
+DEFAULT_SAMPLE_EVERY = 10_000
+DEFAULT_POOL_SIZE = 40
+
+# Growth allowed after the warm-up, in MB per 100k messages
+DEFAULT_MAX_RSS_SLOPE = 5.0
+# Allowed rise of p95 latency from the start to the end of the run, as a fraction
+DEFAULT_MAX_LATENCY_DRIFT = 0.5
+# Latency rises smaller than this are noise, however large as a fraction
+LATENCY_FLOOR_MS = 1.0
+# Fraction of the samples ignored while caches and pools fill up
+DEFAULT_WARMUP = 0.2
+
+TOP_ALLOCATORS = 5
+
+
+class SoakTitles:
+    """
+    Share titles for the stub Temu server, computed from the share code.
+
+    Codes starting with ``S`` name a screenshot of the pool, any other code a
+    store no screenshot is ever posted for. Nothing is stored per code, so the
+    harness itself does not grow during the run.
+    """
+
+    def __init__(self, store_names):
+        self.store_names = store_names
+
+    def get(self, code, default=None):
+        try:
+            number = int(code[1:])
+        except ValueError:
+            return default
+        if code.startswith('S'):
+            return self.store_names[number % len(self.store_names)] or default
+        return f"Other{number} shop"
+
+
+class SoakTelegramClient(FakeTelegramClient):
+    """
+    FakeTelegramClient generating ``count`` messages on the fly.
+
+    Like ``generate_recording``, every third message is a share link (half of
+    them for the next screenshot's store), followed by a screenshot from the
+    pool and a plain chat message. Downloads are hard links to the pool
+    images, and sends are only counted.
+    """
+
+    def __init__(self, images, count, seed=0, group_id=1):
+        """
+        Args:
+            images: List of (screenshot path, store name or None) pairs
+            count: Number of messages to hand out
+            seed: Random seed for which links match
+            group_id: ID reported for the monitored group
+        """
+        super().__init__([], group_id=group_id)
+        self.images = images
+        self.count = count
+        self.rng = random.Random(seed)
+        self.next_id = 1
+        self.images_sent = 0
+
+    @property
+    def exhausted(self):
+        return self.next_id > self.count
+
+    def image_index(self, message_id):
+        return (message_id - 1) // 3 % len(self.images)
+
+    def store_name(self, message_id):
+        return self.images[self.image_index(message_id)][1]
+
+    def message(self, message_id):
+        kind = (message_id - 1) % 3
+        if kind == 0:
+            index = self.image_index(message_id)
+            if self.images[index][1] and self.rng.random() < 0.5:
+                code = f"S{index:0{SHARE_CODE_LENGTH - 1}d}"
+            else:
+                code = f"X{message_id:0{SHARE_CODE_LENGTH - 1}d}"
+            return FakeMessage(message_id, text=f"Look at this {SHARE_URL_PREFIX}{code}")
+        if kind == 1:
+            return FakeMessage(message_id, media=FakeMedia(self.images[self.image_index(message_id)][0]))
+        return FakeMessage(message_id, text="thanks, followed!")
+
+    async def get_messages(self, entity, limit=50, **kwargs):
+        self.last_fetch_started = time.perf_counter()
+        last = min(self.count + 1, self.next_id + limit)
+        batch = [self.message(message_id) for message_id in range(self.next_id, last)]
+        self.next_id = last
+        return list(reversed(batch))
+
+    async def iter_messages(self, *args, **kwargs):
+        for message in []:
+            yield message
+
+    async def download_media(self, media, file=None):
+        try:
+            os.link(media.path, file)
+        except OSError:
+            shutil.copyfile(media.path, file)
+        return file
+
+    async def send_file(self, entity, file, **kwargs):
+        self.images_sent += len(file) if isinstance(file, list) else 1
+
+
+class SoakImageProcessor:
+    """ImageProcessor replacement reading the store name off the message ID in the file name."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def process_image(self, image_path):
+        message_id = int(Path(image_path).stem.rsplit('_', 1)[-1])
+        store_name = self.client.store_name(message_id)
+        if not store_name:
+            raise InvalidImageError(f"No store header in {image_path}")
+        return store_name
+
+
+def load_pool(corpus_dir, pool_size, seed):
+    """The (path, store name) pairs of a labeled corpus, generated first if missing."""
+    corpus_dir = Path(corpus_dir)
+    labels_file = corpus_dir / LABELS_FILE
+    if labels_file.exists():
+        with labels_file.open('r') as f:
+            labels = json.load(f)
+    else:
+        labels = generate_corpus(corpus_dir, pool_size, seed=seed)
+    return [(str(corpus_dir / name), label) for name, label in sorted(labels.items())]
+
+
+def structure_sizes(monitor):
+    """Entry counts of the monitor's long-lived structures."""
+    return {
+        'seen_message_ids': len(monitor.seen_message_ids),
+        'pending_keywords': len(monitor.pending_keywords),
+        'sent_keywords': len(monitor.sent_keywords),
+        'keyword_added_at': len(monitor.keyword_added_at),
+        'keyword_cache': len(monitor.keyword_cache),
+        'ocr_cache': len(monitor.ocr_cache),
+        'near_duplicates': len(monitor.near_duplicates) if monitor.near_duplicates is not None else 0,
+        'deferred': len(monitor.deferred) if monitor.deferred is not None else 0,
+        'background_tasks': len(monitor._background_tasks),
+        'deliveries': len(monitor._deliveries),
+    }
+
+
+def queue_depths():
+    prefix = QUEUE_DEPTH.name + '{'
+    return {key[len(prefix):-1]: value for key, value in REGISTRY.snapshot().items() if key.startswith(prefix)}
+
+
+def top_allocators(snapshot, limit=TOP_ALLOCATORS):
+    return [{'where': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]]
+
+
+def allocator_growth(snapshot, baseline, limit=TOP_ALLOCATORS * 2):
+    """Source lines whose allocations grew most between two tracemalloc snapshots."""
+    return [{'where': str(stat.traceback), 'growth_kb': round(stat.size_diff / 1024, 1),
+             'size_kb': round(stat.size / 1024, 1), 'count_diff': stat.count_diff}
+            for stat in snapshot.compare_to(baseline, 'lineno')[:limit] if stat.size_diff > 0]
+
+
+def remove_downloads(monitor):
+    """Delete downloaded screenshots no parked image needs (the soak would otherwise fill the disk)."""
+    for path in monitor.images_dir.glob('image_*.jpg'):
+        if monitor.deferred is None or str(path) not in monitor.deferred:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def slope(xs, ys):
+    """Least-squares slope of ys over xs (0 for fewer than two points)."""
+    if len(xs) < 2:
+        return 0.0
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def evaluate(samples, max_rss_slope=DEFAULT_MAX_RSS_SLOPE, max_latency_drift=DEFAULT_MAX_LATENCY_DRIFT,
+             warmup=DEFAULT_WARMUP):
+    """
+    Fit memory and latency trends to the samples taken after the warm-up.
+
+    Memory is the least-squares slope of RSS and of the traced Python heap in
+    MB per 100k messages. Latency drift compares the median p95 of the first
+    and last quarter of the samples.
+
+    Returns:
+        Tuple of (trends dictionary, list of threshold violations)
+    """
+    steady = samples[int(len(samples) * warmup):]
+    trends = {'samples': len(steady)}
+    failures = []
+    if len(steady) < 4:
+        return trends, failures
+
+    messages = [sample['messages'] / 100_000 for sample in steady]
+    for key in ('rss_mb', 'traced_mb'):
+        values = [sample[key] for sample in steady]
+        if None in values:
+            continue
+        growth = round(slope(messages, values), 3)
+        trends[f'{key}_per_100k'] = growth
+        if growth > max_rss_slope:
+            failures.append(f"{key} grows {growth} MB per 100k messages (limit {max_rss_slope})")
+
+    quarter = max(1, len(steady) // 4)
+    for key in ('latency', 'cycle'):
+        first = sorted(sample[key]['p95_ms'] for sample in steady[:quarter])[quarter // 2]
+        last = sorted(sample[key]['p95_ms'] for sample in steady[-quarter:])[quarter // 2]
+        drift = round(last / first - 1, 3) if first else 0.0
+        trends[f'{key}_p95_ms'] = {'start': first, 'end': last, 'drift': drift}
+        if drift > max_latency_drift and last - first > LATENCY_FLOOR_MS:
+            failures.append(f"{key} p95 rose from {first}ms to {last}ms (+{drift:.0%}, limit +{max_latency_drift:.0%})")
+    return trends, failures
+
+
+async def run_soak(images, count, sample_every=DEFAULT_SAMPLE_EVERY, seed=0, trace=True,
+                   workdir=None, on_sample=None):
+    """
+    Run ``count`` generated messages through a TelegramGroupMonitor and sample it.
+
+    The monitor runs as in production: with its pipeline cache and state file
+    (in ``workdir``), near-duplicate detection and the deferred OCR drain task.
+
+    Args:
+        images: Screenshot pool from load_pool
+        count: Number of messages
+        sample_every: Messages between samples
+        seed: Random seed
+        trace: Record Python allocations with tracemalloc
+        workdir: Directory for downloads, cache and state (default: a temporary directory)
+        on_sample: Called with every sample as it is taken
+
+    Returns:
+        Dictionary with the samples and allocator growth
+    """
+    from telegram_client import TelegramGroupMonitor
+    from temu_keyword_extractor import TemuKeywordExtractor
+
+    samples = []
+    latencies = []
+    cycles = []
+    baseline = None
+
+    with tempfile.TemporaryDirectory(prefix="soak_") as tmp, \
+            StubTemuServer() as server:
+        server.httpd.titles = SoakTitles([name for _, name in images])
+        workdir = Path(workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        client = SoakTelegramClient(images, count, seed=seed)
+        monitor = TelegramGroupMonitor(
+            client=client,
+            group_id=client.group_id,
+            keyword_extractor=TemuKeywordExtractor(endpoint=server.url),
+            images_dir=workdir / "images",
+            cache_file=workdir / "pipeline_cache.json",
+            state_file=workdir / "monitor_state.json",
+        )
+        monitor._image_processor = SoakImageProcessor(client)
+        if monitor.deferred is not None:
+            monitor._drain_task = asyncio.create_task(monitor.drain_deferred_images())
+
+        process_message = monitor.process_message
+
+        async def timed_process_message(message, send=True):
+            started = time.perf_counter()
+            await process_message(message, send=send)
+            latencies.append(time.perf_counter() - started)
+
+        monitor.process_message = timed_process_message
+
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        next_sample = sample_every
+        try:
+            while not client.exhausted:
+                cycle_started = time.perf_counter()
+                await monitor.fetch_recent_messages()
+                cycles.append(time.perf_counter() - cycle_started)
+
+                processed = client.next_id - 1
+                if processed < next_sample and not client.exhausted:
+                    continue
+                next_sample += sample_every
+                remove_downloads(monitor)
+                rss = current_rss()
+                sample = {
+                    'messages': processed,
+                    'elapsed_s': round(time.perf_counter() - started, 2),
+                    'rss_mb': round(rss / 1024 / 1024, 1) if rss is not None else None,
+                    'traced_mb': None,
+                    'latency': summarize(latencies),
+                    'cycle': summarize(cycles),
+                    'sizes': structure_sizes(monitor),
+                    'queues': queue_depths(),
+                }
+                if trace:
+                    snapshot = tracemalloc.take_snapshot()
+                    sample['traced_mb'] = round(tracemalloc.get_traced_memory()[0] / 1024 / 1024, 2)
+                    sample['top_allocators'] = top_allocators(snapshot)
+                    if baseline is None and len(samples) + 1 >= 2:
+                        baseline = snapshot  # Allocations after the first window, for the growth report
+                samples.append(sample)
+                latencies.clear()
+                cycles.clear()
+                if on_sample:
+                    on_sample(sample)
+        finally:
+            growth = allocator_growth(snapshot, baseline) if trace and baseline is not None else []
+            if trace:
+                tracemalloc.stop()
+            monitor.stop_draining()
+            await asyncio.gather(*monitor._background_tasks, return_exceptions=True)
+
+    return {
+        'messages': client.next_id - 1,
+        'images_sent': client.images_sent,
+        'elapsed_s': round(time.perf_counter() - started, 2),
+        'samples': samples,
+        'allocator_growth': growth,
+    }
+
+
+def print_sample(sample):
+    sizes = sample['sizes']
+    largest = ', '.join(f"{name}={size}" for name, size in
+                        sorted(sizes.items(), key=lambda item: -item[1])[:3])
+    traced = f"  heap {sample['traced_mb']}MB" if sample['traced_mb'] is not None else ""
+    print(f"{sample['messages']:>9} msgs  {sample['elapsed_s']:>8}s  RSS {sample['rss_mb']}MB{traced}  "
+          f"p95 {sample['latency']['p95_ms']}ms  cycle p95 {sample['cycle']['p95_ms']}ms  {largest}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Soak test the message pipeline for memory growth and latency drift')
+    parser.add_argument('--messages', type=int, default=DEFAULT_MESSAGES,
+                        help=f'Messages to push through the pipeline (default: {DEFAULT_MESSAGES})')
+    parser.add_argument('--sample-every', type=int, default=DEFAULT_SAMPLE_EVERY,
+                        help=f'Messages between samples (default: {DEFAULT_SAMPLE_EVERY})')
+    parser.add_argument('--corpus', help='Labeled screenshot directory (default: a generated synthetic pool)')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help=f'Synthetic screenshots to generate without --corpus (default: {DEFAULT_POOL_SIZE})')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--max-rss-slope', type=float, default=DEFAULT_MAX_RSS_SLOPE,
+                        help=f'Allowed memory growth in MB per 100k messages (default: {DEFAULT_MAX_RSS_SLOPE})')
+    parser.add_argument('--max-latency-drift', type=float, default=DEFAULT_MAX_LATENCY_DRIFT,
+                        help=f'Allowed rise of p95 latency as a fraction (default: {DEFAULT_MAX_LATENCY_DRIFT})')
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP,
+                        help=f'Fraction of samples ignored for the trends (default: {DEFAULT_WARMUP})')
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help='Skip allocation tracing (faster, but no heap size or top allocators)')
+    parser.add_argument('--output', help='Where to save the JSON results (default: bench_results/soak-<timestamp>.json)')
+    args = parser.parse_args()
+
+    configure_logging(level='WARNING')
+    with tempfile.TemporaryDirectory(prefix="soak_corpus_") as corpus:
+        images = load_pool(args.corpus or corpus, args.pool_size, args.seed)
+        print(f"Soaking {args.messages} messages over {len(images)} screenshots, "
+              f"sampling every {args.sample_every}...")
+        results = asyncio.run(run_soak(images, args.messages, sample_every=args.sample_every, seed=args.seed,
+                                       trace=not args.no_tracemalloc, on_sample=print_sample))
+    shutdown_logging()
+
+    trends, failures = evaluate(results['samples'], args.max_rss_slope, args.max_latency_drift, args.warmup)
+    results.update({
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'config': {key: getattr(args, key) for key in ('messages', 'sample_every', 'pool_size', 'seed',
+                                                       'max_rss_slope', 'max_latency_drift', 'warmup')},
+        'trends': trends,
+        'failures': failures,
+    })
+
+    print(f"\n{results['messages']} messages in {results['elapsed_s']}s, {results['images_sent']} images sent")
+    print(f"Trends: {json.dumps(trends)}")
+    if results['allocator_growth']:
+        print("Largest allocation growth:")
+        for stat in results['allocator_growth']:
+            print(f"  +{stat['growth_kb']}KB ({stat['count_diff']:+} blocks) {stat['where']}")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"soak-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open('w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if failures:
+        print("Soak test failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("No memory growth or latency drift beyond the thresholds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Cold-start timing for ``--startup-profile``.
+
+Phases are recorded with ``STARTUP.phase(name)`` as the bot starts (imports,
+Telegram connection, OCR engine load in the background) and reported together
+once the bot is ready, along with which heavy libraries ended up loaded.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Modules whose presence in sys.modules means the ML stack was loaded
+HEAVY_MODULES = ['torch', 'torchvision', 'easyocr', 'scipy', 'skimage', 'cv2', 'bs4']
+
+PROCESS_START = time.perf_counter()
+
+
+class StartupProfile:
+    """Records named startup phases with their offset from process start."""
+
+    def __init__(self):
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.phases.append((name, started - PROCESS_START, finished - started,
+                                    threading.current_thread().name))
+
+    def report(self):
+        """Return a text table of the recorded phases."""
+        lines = [f"{'phase':<28} {'start':>8} {'duration':>9}  thread"]
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        for name, offset, duration, thread in phases:
+            lines.append(f"{name:<28} {offset:>7.3f}s {duration:>8.3f}s  {thread}")
+        lines.append(f"{'total since start':<28} {time.perf_counter() - PROCESS_START:>7.3f}s")
+        loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+        lines.append(f"heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+        return "\n".join(lines)
+
+
+STARTUP = StartupProfile()
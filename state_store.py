@@ -0,0 +1,109 @@
+"""
+Small helpers for persisting bot state as JSON files.
+
+Writes go to a temporary file in the same directory and are then moved into
+place, so a crash mid-write never leaves a truncated state file behind.
+
+The bot runs for weeks, so the state it keeps (and saves after every fetch
+cycle) is bounded: ``BoundedSet`` forgets its oldest entries and
+``newest_entries`` trims the insertion-ordered caches.
+"""
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from collections.abc import MutableSet
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def load_json(path, default=None):
+    """
+    Load a JSON document from disk.
+
+    Args:
+        path: Path to the JSON file
+        default: Value returned when the file is missing or unreadable
+
+    Returns:
+        The decoded document, or ``default``
+    """
+    path = Path(path)
+    try:
+        if path.exists():
+            with path.open('r') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error("Error loading %s: %s", path, e)
+    return default
+
+
+def save_json(path, data):
+    """
+    Atomically write a JSON document to disk.
+
+    Args:
+        path: Destination path
+        data: JSON-serialisable object
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_name, path)
+    except Exception:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+class BoundedSet(MutableSet):
+    """Set keeping at most ``max_items`` entries; the least recently added are forgotten first."""
+
+    def __init__(self, max_items, items=()):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self.update(items)
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Results of set operations (a - b, a | b) are plain sets
+        return set(iterable)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self._items)!r})"
+
+    def add(self, item):
+        """Add ``item`` (or mark it as the most recent), forgetting the oldest beyond ``max_items``."""
+        self._items[item] = None
+        self._items.move_to_end(item)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def discard(self, item):
+        self._items.pop(item, None)
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+
+def newest_entries(mapping, max_items):
+    """``mapping`` itself, or a copy with only its ``max_items`` most recently inserted entries."""
+    if len(mapping) <= max_items:
+        return mapping
+    return dict(list(mapping.items())[len(mapping) - max_items:])
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic Temu "Store Follow" screenshots for offline OCR testing.
+
+Each screenshot mimics a phone capture of a store page: a header with the store
+name in large type, a "Following" button and "Sold"/"Items" counters, followed
+by a product grid. A fraction of the images are negatives without the header
+anchors. Labels are written to ``labels.json`` in the output directory, mapping
+file name to the expected store name (null for negatives):
+
+    python synthetic_screenshots.py --output corpus/synthetic --count 50
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+LABELS_FILE = "labels.json"
+
+# Common phone screen sizes (width, height)
+SCREEN_SIZES = [(720, 1600), (1080, 2340), (1080, 2400), (1170, 2532), (1284, 2778), (1440, 3200)]
+
+NAME_PARTS = [
+    "Crystal", "Lumi", "Happy", "Golden", "Urban", "Bloom", "Nova", "Cozy", "Sunny", "Maple",
+    "Pixel", "Ocean", "Velvet", "Amber", "Lucky", "Silver", "Jade", "Coral", "Echo", "Willow",
+]
+NAME_SUFFIXES = ["Shop", "Store", "Home", "Fashion", "Outlet", "Boutique", "Studio", "Mart", "Goods", ""]
+
+FONT_CANDIDATES = [
+    "DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "Arial Bold.ttf",
+    "/Library/Fonts/Arial Bold.ttf",
+]
+
+
+def load_font(size):
+    """Load a bold TrueType font at ``size`` pixels, falling back to Pillow's default font."""
+    for candidate in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def random_store_name(rng):
+    name = rng.choice(NAME_PARTS)
+    if rng.random() < 0.5:
+        name += rng.choice(NAME_PARTS)
+    suffix = rng.choice(NAME_SUFFIXES)
+    return f"{name} {suffix}".strip()
+
+
+def render_screenshot(store_name, size, rng, with_header=True):
+    """
+    Draw one synthetic store page screenshot.
+
+    Args:
+        store_name: Store name shown in the header
+        size: (width, height) of the screenshot
+        rng: random.Random instance
+        with_header: Whether to draw the store header with the anchor words
+
+    Returns:
+        PIL Image
+    """
+    width, height = size
+    unit = width / 1080  # Layout is designed for a 1080px wide screen
+    image = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+
+    # Status bar and navigation
+    draw.rectangle((0, 0, width, int(90 * unit)), fill=(245, 245, 245))
+    draw.text((int(40 * unit), int(25 * unit)), f"{rng.randrange(1, 13)}:{rng.randrange(60):02d}",
+              fill=(0, 0, 0), font=load_font(int(36 * unit)))
+
+    top = int(rng.uniform(140, 220) * unit)
+    if with_header:
+        # Store avatar
+        avatar = int(150 * unit)
+        left = int(40 * unit)
+        draw.ellipse((left, top, left + avatar, top + avatar),
+                     fill=tuple(rng.randrange(60, 220) for _ in range(3)))
+
+        # Store name in the largest type on the page
+        text_left = left + avatar + int(30 * unit)
+        draw.text((text_left, top), store_name, fill=(20, 20, 20), font=load_font(int(rng.uniform(56, 68) * unit)))
+
+        # Counters and follow button
+        small = load_font(int(32 * unit))
+        stats = f"{rng.randrange(1, 99)}.{rng.randrange(10)}K+ Sold | {rng.randrange(20, 900)} Items"
+        draw.text((text_left, top + int(90 * unit)), stats, fill=(110, 110, 110), font=small)
+        button = (width - int(300 * unit), top + int(20 * unit), width - int(40 * unit), top + int(100 * unit))
+        draw.rounded_rectangle(button, radius=int(40 * unit), outline=(40, 40, 40), width=max(1, int(3 * unit)))
+        draw.text((button[0] + int(45 * unit), button[1] + int(20 * unit)), "Following", fill=(40, 40, 40), font=small)
+        top += avatar + int(60 * unit)
+    else:
+        draw.text((int(40 * unit), top), "Recommended for you", fill=(20, 20, 20), font=load_font(int(48 * unit)))
+        top += int(120 * unit)
+
+    # Product grid
+    tile = (width - int(120 * unit)) // 2
+    y = top
+    while y < height:
+        for column in range(2):
+            x = int(40 * unit) + column * (tile + int(40 * unit))
+            draw.rectangle((x, y, x + tile, y + tile), fill=tuple(rng.randrange(150, 250) for _ in range(3)))
+            draw.text((x, y + tile + int(10 * unit)), f"${rng.randrange(1, 60)}.{rng.randrange(100):02d}",
+                      fill=(200, 60, 0), font=load_font(int(34 * unit)))
+        y += tile + int(90 * unit)
+    return image
+
+
+def generate_corpus(output_dir, count, seed=0, negative_ratio=0.1, quality=85):
+    """
+    Write ``count`` synthetic screenshots and their labels to ``output_dir``.
+
+    Returns:
+        Mapping of file name to expected store name (None for negatives)
+    """
+    rng = random.Random(seed)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    labels = {}
+    for i in range(count):
+        negative = rng.random() < negative_ratio
+        store_name = random_store_name(rng)
+        image = render_screenshot(store_name, rng.choice(SCREEN_SIZES), rng, with_header=not negative)
+        name = f"synthetic_{i:04d}.jpg"
+        image.save(output_dir / name, quality=quality)
+        labels[name] = None if negative else store_name
+
+    with (output_dir / LABELS_FILE).open('w') as f:
+        json.dump(labels, f, indent=2)
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a labeled synthetic screenshot corpus')
+    parser.add_argument('--output', default='corpus/synthetic', help='Output directory (default: corpus/synthetic)')
+    parser.add_argument('--count', type=int, default=50, help='Number of screenshots (default: 50)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--negative-ratio', type=float, default=0.1,
+                        help='Fraction of screenshots without a store header (default: 0.1)')
+    args = parser.parse_args()
+
+    labels = generate_corpus(args.output, args.count, seed=args.seed, negative_ratio=args.negative_ratio)
+    print(f"Wrote {len(labels)} screenshots and {LABELS_FILE} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
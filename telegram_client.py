@@ -3,33 +3,97 @@ import asyncio
 import re
 import json
 from telethon import TelegramClient, events
+from buffered_session import open_session
 from telethon.errors import TypeNotFoundError, FloodWaitError, AuthKeyError
 from dotenv import load_dotenv
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 from temu_keyword_extractor import TemuKeywordExtractor
+from state_store import BoundedSet, load_json, newest_entries, save_json
+from log_setup import correlation_context
+from startup import STARTUP
+import threading
+from exceptions import InvalidImageError
+from image_hash import PerceptualHashIndex, image_signature
+from delivery import DeliveryConfig, DeliveryDispatcher
+from deferred_ocr import DeferredImages
+from runtime_config import ResizableSemaphore
+from metrics import (STAGE_SECONDS, MESSAGES, IMAGES, OCR_REJECTS, CACHE_HITS,
+                     MATCHES, SENDS, RECONNECTS, QUEUE_DEPTH, DEFERRED, timed_call)
 import time
 
+# Persistent caches and backfill progress
+PIPELINE_CACHE_FILE = Path("pipeline_cache.json")
+BACKFILL_CHECKPOINT_FILE = Path("backfill_checkpoint.json")
+# Dedup state, keywords and parked images saved on shutdown and after every fetch cycle
+MONITOR_STATE_FILE = Path("monitor_state.json")
+
+# Most recent message IDs remembered (and kept in the saved state) to skip messages fetched again
+MAX_SAVED_MESSAGE_IDS = 10000
+# Keywords waiting for a screenshot, and keywords already forwarded; the oldest are forgotten first
+MAX_PENDING_KEYWORDS = 10000
+MAX_SENT_KEYWORDS = 50000
+# Newest entries kept in each of the keyword and OCR caches
+MAX_CACHE_ENTRIES = 20000
+
+# Temu share URLs are matched on their first 34 characters
+TEMU_URL_PATTERN = r'https://share\.temu\.com/\S+'
+TEMU_URL_LENGTH = 34
+
+# Deferred images are rechecked at least this often (seconds) for expiry and idle OCR
+DEFERRED_POLL_INTERVAL = 30
+# Images OCR'd at the same time when an OCR server does the work (it batches them)
+OCR_SERVER_CONCURRENCY = 4
+
+# Parked images are OCR'd ahead of time while the 1-minute load average per CPU is below this
+IDLE_LOAD_PER_CPU = 0.5
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class TelegramGroupMonitor:
-    def __init__(self):
+    def __init__(self, client=None, group_id=None, keyword_extractor=None,
+                 images_dir="group_images", cache_file=PIPELINE_CACHE_FILE, dedupe_images=True,
+                 defer_ocr=True, delivery_config=None, session_name='session_name', coordinator=None,
+                 ocr_server=None, state_file=MONITOR_STATE_FILE):
+        """
+        Args:
+            client: Telegram client to use instead of creating one from API_ID/API_HASH
+                (the replay harness passes a fake client here)
+            group_id: Group to monitor instead of the one in selected_group.json
+            keyword_extractor: TemuKeywordExtractor to use for share URLs
+            images_dir: Directory downloaded images are written to
+            cache_file: Path of the persistent keyword/OCR cache, or None to keep it in memory only
+            dedupe_images: Reuse the OCR result of an earlier near-identical screenshot
+                (re-compressed or forwarded copies) instead of running OCR again
+            defer_ocr: While monitoring, park images instead of running OCR when no
+                keyword could match them (see deferred_ocr.py)
+            delivery_config: DeliveryConfig with the targets and routing rules for
+                matching images (default: delivery_targets.json / $DELIVERY_TARGETS)
+            session_name: Telethon session file used when no client is given
+            coordinator: ShardCoordinator shared with other worker processes (see
+                sharding.py); message dedup, keywords and sent keywords then span all workers
+            ocr_server: Address of a shared OCR server (unix:/path or http://host:port,
+                default: $OCR_SERVER) to use instead of loading OCR models in this process
+            state_file: Where seen messages, keywords and parked images are saved so a
+                restart continues where the last run stopped, or None to keep them in memory only
+        """
         # Get credentials from environment variables
         api_id = os.getenv('API_ID')
         api_hash = os.getenv('API_HASH')
-        self.target_username = '@imelda87541'  # Target user to send matching images
 
         # Load the selected group from storage (mandatory)
-        selected_group_id = self.load_selected_group()
+        selected_group_id = group_id if group_id is not None else self.load_selected_group()
         if selected_group_id is None:
             raise ValueError("No group selected. Please run 'python main.py --select-group' to select a group to monitor first.")
 
         self.target_group_identifier = str(selected_group_id)
-        print(f"Using selected group ID from storage: {selected_group_id}")
+        logger.info("Using selected group ID from storage: %s", selected_group_id)
 
-        if not api_id or not api_hash:
+        if client is None and (not api_id or not api_hash):
             raise ValueError("Missing required environment variables: API_ID or API_HASH")
 
         # Convert to integer if it's a numeric string, otherwise keep as string
@@ -40,26 +104,91 @@ class TelegramGroupMonitor:
             self.target_group_chat_id = self.target_group_identifier
 
         # Create images directory if it doesn't exist
-        self.images_dir = Path("group_images")
+        self.images_dir = Path(images_dir)
         self.images_dir.mkdir(exist_ok=True)
+        self._remove_partial_downloads()
 
         # Initialize the client with additional connection parameters
-        self.client = TelegramClient(
-            'session_name', 
-            api_id, 
-            api_hash,
-            device_model='Telegram User Bot',
-            system_version='1.0',
-            app_version='8.0',
-            lang_code='en',
-            system_lang_code='en'
-        )
+        if client is None:
+            client = TelegramClient(
+                open_session(session_name),
+                api_id, 
+                api_hash,
+                device_model='Telegram User Bot',
+                system_version='1.0',
+                app_version='8.0',
+                lang_code='en',
+                system_lang_code='en'
+            )
+        self.client = client
+
+        # Targets matching images are sent to, and the concurrent album-batching sender
+        self.delivery = delivery_config or DeliveryConfig.load()
+        self.dispatcher = DeliveryDispatcher(self.client, reconnect=self.reconnect)
+        # Delivery task -> keyword, until every target has been tried
+        self._deliveries = {}
 
         # Track previously seen message IDs to avoid duplicates
-        self.seen_message_ids = set()
+        self.seen_message_ids = BoundedSet(MAX_SAVED_MESSAGE_IDS)
 
         # Track keywords that have been sent to avoid duplicates
-        self.sent_keywords = set()
+        self.sent_keywords = BoundedSet(MAX_SENT_KEYWORDS)
+
+        # Keywords extracted from Temu share URLs, matched against store names
+        self.pending_keywords = BoundedSet(MAX_PENDING_KEYWORDS)
+
+        # Shared state when running as one of several sharded workers
+        self.coordinator = coordinator
+
+        # Seconds between fetches of recent messages
+        self.poll_interval = 300
+
+        # Set by apply_config(): the chat to switch to before the next fetch, and
+        # the event cutting the pause between fetches short
+        self._next_group = None
+        self._reconfigured = asyncio.Event()
+
+        # Images parked until a keyword could match them, and when each keyword
+        # arrived (in arrival order). Deferral is active while start()'s drain task runs.
+        self.deferred = DeferredImages() if defer_ocr else None
+        self.keyword_added_at = {}
+        self._keywords_changed = False
+        self._deferred_wakeup = asyncio.Event()
+        self._drain_task = None
+
+        # Caches for keyword lookups (URL -> keyword) and OCR (image file -> store name)
+        self.cache_file = cache_file
+        cache = (load_json(cache_file, default={}) if cache_file else None) or {}
+        self.keyword_cache = cache.get('keywords', {})
+        # Images are named by message ID, which another chat reuses
+        self.ocr_cache = cache.get('ocr', {}) if str(cache.get('group')) == self.target_group_identifier else {}
+
+        # Set by request_stop(): ingestion ends at the next message boundary
+        self.stopping = asyncio.Event()
+
+        # Restore what the last run saved on shutdown
+        self.state_file = state_file
+        self.load_state()
+
+        # Perceptual signatures of recently OCR'd screenshots (bounded, in memory)
+        self.near_duplicates = PerceptualHashIndex() if dedupe_images else None
+
+        # The OCR engine is created on first use (or preloaded in the background
+        # by start()) and shared by all images. With an OCR server it is a client
+        # for the server, and several images are sent at once so the server can batch them.
+        self.ocr_server = ocr_server or os.getenv('OCR_SERVER')
+        self._image_processor = None
+        self._image_processor_lock = threading.Lock()
+        self._image_processor_task = None
+        self._ocr_lock = ResizableSemaphore(OCR_SERVER_CONCURRENCY if self.ocr_server else 1)
+        # ImageProcessor settings from the runtime configuration
+        self.ocr_settings = {}
+
+        # Images waiting for the OCR engine to finish loading
+        self._background_tasks = set()
+
+        # Set once the client is connected and the group resolved
+        self.ingesting = asyncio.Event()
 
         # Connection management attributes
         self.last_reconnect_time = 0
@@ -69,7 +198,7 @@ class TelegramGroupMonitor:
         self.connection_health_check_interval = 300  # 5 minutes
 
         # Initialize the keyword extractor
-        self.keyword_extractor = TemuKeywordExtractor()
+        self.keyword_extractor = keyword_extractor or TemuKeywordExtractor()
 
     def load_selected_group(self):
         """Load the selected group ID from the persistent file"""
@@ -81,7 +210,7 @@ class TelegramGroupMonitor:
                     return data.get('group_id')
             return None
         except Exception as e:
-            print(f"Error loading selected group: {e}")
+            logger.error("Error loading selected group: %s", e)
             return None
 
     async def is_connected(self):
@@ -100,15 +229,15 @@ class TelegramGroupMonitor:
         # Check if we're within the reconnect delay period
         if current_time - self.last_reconnect_time < self.reconnect_delay:
             wait_time = self.reconnect_delay - (current_time - self.last_reconnect_time)
-            print(f"Waiting {wait_time:.1f}s before attempting reconnection...")
+            logger.warning("Waiting %.1fs before attempting reconnection...", wait_time)
             await asyncio.sleep(wait_time)
         
         # Check if we've exceeded max attempts
         if self.reconnect_attempts >= self.max_reconnect_attempts:
-            print(f"Maximum reconnection attempts ({self.max_reconnect_attempts}) reached. Stopping.")
+            logger.error("Maximum reconnection attempts (%s) reached. Stopping.", self.max_reconnect_attempts)
             return False
         
-        print(f"Attempting to reconnect... (attempt {self.reconnect_attempts + 1}/{self.max_reconnect_attempts})")
+        logger.warning("Attempting to reconnect... (attempt %s/%s)", self.reconnect_attempts + 1, self.max_reconnect_attempts)
         
         try:
             # Disconnect first if connected
@@ -120,124 +249,236 @@ class TelegramGroupMonitor:
             
             # Re-authorize if needed
             if not await self.client.is_user_authorized():
-                print("User authorization required after reconnection...")
+                logger.warning("User authorization required after reconnection...")
                 await self.client.start()
             
             # Reset reconnect attempts on success
             self.reconnect_attempts = 0
             self.last_reconnect_time = time.time()
             
-            print("Reconnection successful!")
+            RECONNECTS.labels('success').inc()
+            logger.info("Reconnection successful!")
             return True
             
         except Exception as e:
-            print(f"Reconnection failed: {e}")
+            RECONNECTS.labels('failure').inc()
+            logger.warning("Reconnection failed: %s", e)
             self.reconnect_attempts += 1
             # Exponential backoff: double the delay after each failed attempt
             self.reconnect_delay = min(self.reconnect_delay * 2, 300)  # Max 5 minutes
             return False
         
-    async def start(self):
-        """Start the Telegram client and begin listening for messages"""
-        # Connect and authorize the client
+    async def connect_and_authorize(self):
+        """Connect and authorize the client, reconnecting if the first attempt fails"""
         try:
             await self.client.connect()
             
             if not await self.client.is_user_authorized():
-                print("Session is not authorized. Please make sure you have a valid session.")
-                print("If this is the first time running the bot, you'll need to authenticate manually.")
-                print("Run this script in an environment where you can enter the login code when prompted.")
+                logger.warning("Session is not authorized. Please make sure you have a valid session.")
+                logger.warning("If this is the first time running the bot, you'll need to authenticate manually.")
+                logger.warning("Run this script in an environment where you can enter the login code when prompted.")
                 await self.client.start()
             
             if not await self.client.is_user_authorized():
                 raise Exception("User authorization failed. Please check your credentials.")
         except Exception as e:
-            print(f"Error during initial connection: {e}")
-            print("Attempting to reconnect with fresh session...")
+            logger.error("Error during initial connection: %s", e)
+            logger.warning("Attempting to reconnect with fresh session...")
             if not await self.reconnect():
                 raise Exception("Could not establish connection after multiple attempts.")
 
-        # Debug: List all dialogs to see accessible chats
-        print("Fetching all accessible chats...")
-        try:
-            all_dialogs = await self.client.get_dialogs()
-            print("Accessible chats:")
-            for dialog in all_dialogs:
-                print(f"Chat: {dialog.name}, ID: {dialog.id}")
-        except Exception as e:
-            print(f"Error fetching dialogs: {e}")
-
-        # Also get the entity for the target group to verify it exists
+    async def resolve_target_entity(self):
+        """Resolve the monitored group, switching to the -100 prefixed ID for megagroups"""
         try:
             target_entity = await self.client.get_entity(self.target_group_chat_id)
-            print(f"Target group entity: {target_entity}")
-            print(f"Target group ID: {target_entity.id}")
-            print(f"Target group title: {target_entity.title}")
+            logger.debug("Target group entity: %s", target_entity)
+            logger.info("Target group ID: %s", target_entity.id)
+            logger.info("Target group title: %s", target_entity.title)
 
             # For megagroups/channels, the full ID is typically in the format -100xxxxxxxxx
             if hasattr(target_entity, 'megagroup') and target_entity.megagroup:
                 # For megagroups, the full ID is usually -100 + regular ID
                 full_group_id = int(f"-100{target_entity.id}")
-                print(f"Megagroup detected. Using full ID: {full_group_id}")
+                logger.info("Megagroup detected. Using full ID: %s", full_group_id)
 
                 # Update the target group chat ID to use the correct format
                 self.target_group_chat_id = full_group_id
         except Exception as e:
-            print(f"Error getting target group entity: {e}")
-            print(f"Make sure the TARGET_GROUP_CHAT_ID '{self.target_group_chat_id}' is correct")
-            return
+            logger.error("Error getting target group entity: %s", e)
+            logger.warning("Make sure the TARGET_GROUP_CHAT_ID '%s' is correct", self.target_group_chat_id)
+            return None
 
         # Force refresh of the target entity with the updated ID
         try:
-            target_entity = await self.client.get_entity(self.target_group_chat_id)
+            return await self.client.get_entity(self.target_group_chat_id)
         except Exception as e:
-            print(f"Error refreshing target entity: {e}")
+            logger.error("Error refreshing target entity: %s", e)
+            return None
+
+    async def start(self):
+        """Start the Telegram client and begin listening for messages"""
+        # Load the OCR engine in the background while we connect and start ingesting
+        self.preload_image_processor()
+
+        # Connect and authorize the client
+        with STARTUP.phase('telegram_connect'):
+            await self.connect_and_authorize()
+
+        # Debug: List all dialogs to see accessible chats (streamed, and only when debugging)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Accessible chats:")
+            try:
+                async for dialog in self.client.iter_dialogs():
+                    logger.debug("Chat: %s, ID: %s", dialog.name, dialog.id)
+            except Exception as e:
+                logger.error("Error fetching dialogs: %s", e)
+
+        # Also get the entity for the target group to verify it exists
+        with STARTUP.phase('resolve_group'):
+            target_entity = await self.resolve_target_entity()
+        if target_entity is None:
             return
 
+        self.ingesting.set()
+
+        # OCR parked images once keywords arrive or the CPU is idle
+        if self.deferred is not None:
+            self._drain_task = asyncio.create_task(self.drain_deferred_images())
+
         # Start the periodic message fetching task
         fetch_task = asyncio.create_task(self.fetch_recent_messages_periodically())
 
-        print(f"\nStarted periodic monitoring of group: {self.target_group_chat_id}")
-        print("Checking for new messages every 5 minutes...")
-        print("Press Ctrl+C to stop...")
+        logger.info("Started periodic monitoring of group: %s", self.target_group_chat_id)
+        logger.info("Checking for new messages every 5 minutes...")
+        logger.info("Press Ctrl+C to stop...")
 
         try:
             # Wait indefinitely until cancelled
             await fetch_task
         except asyncio.CancelledError:
-            print("Monitoring task was cancelled")
+            logger.info("Monitoring task was cancelled")
+        finally:
+            self.stop_draining()
     
     async def fetch_recent_messages_periodically(self):
         """Fetch recent messages from the target group every 5 minutes"""
         last_health_check = time.time()
         
-        while True:
+        while not self.stopping.is_set():
             try:
                 # Perform connection health check periodically
                 current_time = time.time()
                 if current_time - last_health_check > self.connection_health_check_interval:
                     if not await self.is_connected():
-                        print("Connection health check failed, attempting to reconnect...")
+                        logger.warning("Connection health check failed, attempting to reconnect...")
                         if not await self.reconnect():
-                            print("Reconnection failed, waiting before next health check...")
-                            await asyncio.sleep(self.connection_health_check_interval)
+                            logger.warning("Reconnection failed, waiting before next health check...")
+                            await self._pause(self.connection_health_check_interval)
                             continue
                     last_health_check = current_time
                 
+                if self._next_group is not None:
+                    await self.switch_group(self._next_group)
+
                 await self.fetch_recent_messages()
-                # Wait for 5 minutes before next fetch
-                await asyncio.sleep(300)  # 300 seconds = 5 minutes
+                # Wait before the next fetch (5 minutes by default)
+                await self._pause(self.poll_interval)
             except Exception as e:
-                print(f"Error in periodic message fetching: {e}")
+                logger.error("Error in periodic message fetching: %s", e)
                 
                 # Handle specific connection-related errors
                 if isinstance(e, (TypeNotFoundError, AuthKeyError)):
-                    print("Critical connection error detected, attempting reconnection...")
+                    logger.error("Critical connection error detected, attempting reconnection...")
                     if not await self.reconnect():
-                        print("Reconnection failed after critical error.")
+                        logger.error("Reconnection failed after critical error.")
                 
                 # Wait before retrying to avoid rapid error loops
-                await asyncio.sleep(60)  # Wait 1 minute before retrying
+                await self._pause(60)  # Wait 1 minute before retrying
+
+    async def _pause(self, seconds):
+        """Sleep for ``seconds``, or less if a stop is requested or the poll interval or chat changes meanwhile"""
+        self._reconfigured.clear()
+        waiters = [asyncio.ensure_future(self.stopping.wait()), asyncio.ensure_future(self._reconfigured.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    def apply_config(self, config, follow_chats=True):
+        """
+        Apply a reloaded RuntimeConfig (see runtime_config.py) in place.
+
+        New targets and routing rules apply to the next match; images already
+        queued go to the targets they were queued for. The upload and OCR
+        pools are resized without interrupting work in flight, and the OCR
+        engine keeps its loaded models.
+
+        Args:
+            config: The new RuntimeConfig
+            follow_chats: Switch to the configured chat before the next fetch
+                (sharded workers assign chats themselves)
+        """
+        self.delivery = config.delivery
+        self.dispatcher.resize(config.delivery_concurrency)
+        self.dispatcher.coalesce_window = config.album_window
+        self._ocr_lock.resize(config.ocr_concurrency or (OCR_SERVER_CONCURRENCY if self.ocr_server else 1))
+        if self.deferred is not None:
+            self.deferred.window = config.deferred_window
+            self.deferred.max_items = config.deferred_max_items
+        self.ocr_settings = config.ocr
+        processor = self._image_processor
+        if processor is not None and hasattr(processor, 'configure'):
+            processor.configure(self.ocr_settings)
+
+        wake = config.poll_interval != self.poll_interval
+        self.poll_interval = config.poll_interval
+        if follow_chats:
+            chats = config.monitored_chats
+            if len(chats) > 1:
+                logger.warning("Monitoring only chat %s of %s; run sharded workers (--sessions) to monitor several",
+                               chats[0], len(chats))
+            if chats and chats[0] != self.target_group_identifier:
+                self._next_group = chats[0]
+                wake = True
+        if wake:
+            self._reconfigured.set()
+
+    async def switch_group(self, group_id):
+        """
+        Monitor another group from the next fetch on.
+
+        Deliveries in flight finish first. Keywords, parked images and the OCR
+        engine are kept; seen message IDs and cached OCR results by file name
+        are per chat and start over.
+
+        Returns:
+            Whether the new group could be resolved (otherwise the old one stays)
+        """
+        self._next_group = None
+        await self.flush_deliveries()
+        self.save_caches()
+        self.save_state()
+
+        previous = (self.target_group_identifier, self.target_group_chat_id, self.seen_message_ids)
+        self.target_group_identifier = str(group_id)
+        try:
+            self.target_group_chat_id = int(self.target_group_identifier)
+        except ValueError:
+            self.target_group_chat_id = self.target_group_identifier
+        self.seen_message_ids = BoundedSet(MAX_SAVED_MESSAGE_IDS)
+        if await self.resolve_target_entity() is None:
+            logger.error("Could not switch to group %s, still monitoring %s", group_id, previous[0])
+            self.target_group_identifier, self.target_group_chat_id, self.seen_message_ids = previous
+            return False
+        # Images are named by message ID, which another chat reuses
+        self.ocr_cache.clear()
+        logger.info("Now monitoring group %s", self.target_group_chat_id)
+        return True
+
+    def request_stop(self):
+        """Stop ingesting; the message being processed is finished first"""
+        self.stopping.set()
     
     async def fetch_recent_messages(self):
         """Fetch messages from the last 5 minutes"""
@@ -249,190 +490,731 @@ class TelegramGroupMonitor:
             try:
                 target_entity = await self.client.get_entity(self.target_group_chat_id)
             except (TypeNotFoundError, AuthKeyError) as e:
-                print(f"Entity error: {e}. Attempting to reconnect...")
+                logger.error("Entity error: %s. Attempting to reconnect...", e)
                 if not await self.reconnect():
-                    print("Reconnection failed, skipping this fetch cycle.")
+                    logger.warning("Reconnection failed, skipping this fetch cycle.")
                     return
                 # Retry getting the entity after reconnection
                 try:
                     target_entity = await self.client.get_entity(self.target_group_chat_id)
                 except Exception as e:
-                    print(f"Still unable to get target entity after reconnection: {e}")
+                    logger.error("Still unable to get target entity after reconnection: %s", e)
                     return
             except Exception as e:
-                print(f"Error getting target entity: {e}")
+                logger.error("Error getting target entity: %s", e)
                 return
 
             try:
-                messages = await self.client.get_messages(
-                    target_entity,
-                    limit=50,  # Get up to 50 recent messages
-                    offset_date=five_minutes_ago
-                )
+                with STAGE_SECONDS.labels('get_messages').time():
+                    messages = await self.client.get_messages(
+                        target_entity,
+                        limit=50,  # Get up to 50 recent messages
+                        offset_date=five_minutes_ago
+                    )
             except (TypeNotFoundError, AuthKeyError) as e:
-                print(f"Message fetch error: {e}. Attempting to reconnect...")
+                logger.error("Message fetch error: %s. Attempting to reconnect...", e)
                 if not await self.reconnect():
-                    print("Reconnection failed, skipping this fetch cycle.")
+                    logger.warning("Reconnection failed, skipping this fetch cycle.")
                     return
                 # Retry fetching messages after reconnection
                 try:
-                    messages = await self.client.get_messages(
-                        target_entity,
-                        limit=50,
-                        offset_date=five_minutes_ago
-                    )
+                    with STAGE_SECONDS.labels('get_messages').time():
+                        messages = await self.client.get_messages(
+                            target_entity,
+                            limit=50,
+                            offset_date=five_minutes_ago
+                        )
                 except Exception as e:
-                    print(f"Still unable to fetch messages after reconnection: {e}")
+                    logger.error("Still unable to fetch messages after reconnection: %s", e)
                     return
             except Exception as e:
-                print(f"Error fetching messages: {e}")
+                logger.error("Error fetching messages: %s", e)
                 return
 
-            print(f"Fetched {len(messages)} messages from the last 5 minutes")
+            logger.info("Fetched %s messages from the last 5 minutes", len(messages))
 
             # Process each message
+            backlog = QUEUE_DEPTH.labels('fetched')
+            backlog.set(len(messages))
             for message in reversed(messages):  # Process in chronological order
+                if self.stopping.is_set():
+                    break  # The rest are fetched again after the restart
+                backlog.dec()
                 if message.id in self.seen_message_ids:
                     continue  # Skip already processed messages
 
+                if self.coordinator is not None and not await self.coordinator.claim_message(
+                        self.target_group_chat_id, message.id):
+                    self.seen_message_ids.add(message.id)
+                    continue  # Handled by another worker before this chat moved here
+
+                await self.process_message(message)
+                # Only marked once handled, so a message interrupted by shutdown is processed again
                 self.seen_message_ids.add(message.id)
+            backlog.set(0)
 
-                # Check if the message contains media (images)
-                if message.media:
-                    # Download the image
-                    filename = f"group_images/image_{message.id}.jpg"
-                    try:
-                        await self.client.download_media(message.media, file=filename)
-                        print(f"Image saved: {filename}")
-                    except (TypeNotFoundError, AuthKeyError) as e:
-                        print(f"Media download error: {e}. Attempting to reconnect...")
-                        if not await self.reconnect():
-                            print("Reconnection failed, skipping media download.")
-                            continue
-                        # Retry downloading media after reconnection
-                        try:
-                            await self.client.download_media(message.media, file=filename)
-                            print(f"Image saved: {filename}")
-                        except Exception as e:
-                            print(f"Still unable to download media after reconnection: {e}")
-                            continue
-                    except Exception as e:
-                        print(f"Error downloading media: {e}")
-                        continue
-
-                    # Run the ImageProcessor on the downloaded image
-                    try:
-                        from temu_extractor_easyocr import ImageProcessor
-                        processor = ImageProcessor()
-
-                        # Extract store name from the image
-                        store_name = processor.process_image(filename)
-                        print(f"Store name extracted: {store_name}")
-
-                        # Check if store name matches any pending keywords
-                        if store_name and hasattr(self, 'pending_keywords'):
-                            matched_keyword = None
-                            for keyword in self.pending_keywords:
-                                if store_name.lower().startswith(keyword.lower()):
-                                    matched_keyword = keyword
-                                    break
-
-                            if matched_keyword:
-                                print(f"Store name '{store_name}' matches keyword '{matched_keyword}'")
-
-                                # Check if this keyword has already been sent
-                                if matched_keyword not in self.sent_keywords:
-                                    # Send the image to @imelda87541
-                                    await self.send_image_to_user(filename, store_name, matched_keyword)
-                                else:
-                                    print(f"Image for keyword '{matched_keyword}' already sent, skipping...")
-                    except ImportError as e:
-                        print(f"temu_extractor_easyocr module not found, skipping extraction: {e}")
-                    except Exception as e:
-                        print(f"Error running ImageProcessor: {e}")
-
-                # Print text messages to console
-                if message.text:
-                    print(f"New message: {message.text}")
-
-                    # Check for Temu share URLs that are at least 34 characters long
-                    temu_url_pattern = r'https://share\.temu\.com/\S+'
-                    temu_urls = re.findall(temu_url_pattern, message.text)
-
-                    if temu_urls:
-                        for url in temu_urls:
-                            # Ensure the URL is at least 34 characters long
-                            if len(url) >= 34:
-                                exact_url = url[:34]  # Take exactly first 34 characters
-                                print(f"Temu share URL detected (first 34 chars): {exact_url}")
-
-                                # Extract keyword from the exact 34-character URL
-                                try:
-                                    keyword = self.keyword_extractor.extract_first_keyword(exact_url)
-                                    if keyword:
-                                        print(f"Extracted keyword from URL: {keyword}")
-
-                                        # Add keyword to the list of keywords to match against store names
-                                        # Store this in a way that can be accessed by the image processing section
-                                        if not hasattr(self, 'pending_keywords'):
-                                            self.pending_keywords = set()
-                                        self.pending_keywords.add(keyword)
-                                    else:
-                                        print(f"No keyword found in URL: {exact_url}")
-                                except Exception as e:
-                                    print(f"Error extracting keyword from URL {exact_url}: {e}")
-                            else:
-                                print(f"Temu URL is shorter than 34 characters: {url} (length: {len(url)})")
+            # Matches from this cycle go out now rather than after the album window
+            await self.flush_deliveries()
+            self.save_caches()
+            self.save_state()
 
         except (TypeNotFoundError, AuthKeyError) as e:
-            print(f"Critical error in fetch_recent_messages: {e}. Attempting to reconnect...")
+            logger.error("Critical error in fetch_recent_messages: %s. Attempting to reconnect...", e)
             if not await self.reconnect():
-                print("Reconnection failed after critical error.")
+                logger.error("Reconnection failed after critical error.")
         except Exception as e:
-            print(f"Error fetching recent messages: {e}")
-    
-    async def send_image_to_user(self, image_path, store_name, keyword):
-        """Send an image to the target user without a caption."""
+            logger.error("Error fetching recent messages: %s", e)
+
+    async def process_message(self, message, send=True):
+        """
+        Run a single message through the download/OCR/match and keyword pipeline.
+
+        Args:
+            message: Telethon message
+            send: Whether matching images are forwarded to the target user
+        """
+        MESSAGES.inc()
+
+        with correlation_context(self.correlation_id(message)):
+            # Check if the message contains media (images)
+            if message.media:
+                await self.process_image_message(message, send=send)
+
+            # Log text messages
+            if message.text:
+                logger.info("New message: %s", message.text, extra={'rate_key': 'new_message'})
+                await self.process_text_message(message.text)
+
+    def correlation_id(self, message):
+        """ID tying together every log line produced for one message"""
+        return f"{self.target_group_chat_id}:{message.id}"
+
+    async def _traced(self, message, coro):
+        """Await ``coro`` with the message's correlation ID set"""
+        with correlation_context(self.correlation_id(message)):
+            return await coro
+
+    async def process_image_message(self, message, send=True):
+        """Download a message's image, extract the store name and forward it on a keyword match"""
+        filename = str(self.images_dir / f"image_{message.id}.jpg")
+
+        # Images already processed in an earlier run are neither downloaded nor OCR'd again
+        if filename in self.ocr_cache and os.path.exists(filename):
+            store_name = self.ocr_cache[filename]
+            CACHE_HITS.labels('ocr').inc()
+            logger.debug("Store name from cache: %s", store_name)
+        else:
+            parking = send and self.deferring() and not self.live_keywords()
+            if not parking:
+                # Unloaded OCR models load while the image downloads
+                self.prefetch_ocr()
+            if not await self.download_image(message, filename):
+                return
+            if parking:
+                # No keyword could match it yet; OCR it when one arrives or the CPU is idle
+                self.defer_image(filename)
+                return
+            if not self.image_processor_ready():
+                # Keep ingesting while the OCR engine loads; the image is processed once it is ready
+                logger.debug("OCR engine still loading, queueing %s", filename)
+                self._track(self._process_when_ready(filename, send))
+                return
+            store_name = await self.extract_store_name(filename)
+
+        if send:
+            await self.match_and_send(filename, store_name)
+
+    async def _process_when_ready(self, filename, send):
+        QUEUE_DEPTH.labels('ocr_startup').inc()
         try:
-            # Get the target user entity
+            await self.wait_for_image_processor()
+        except asyncio.CancelledError:
+            if self.deferred is not None:
+                # Shutting down before the engine loaded: saved with the parked images
+                self.deferred.put(filename, send)
+            raise
+        except Exception:
+            pass  # Reported by extract_store_name below
+        finally:
+            QUEUE_DEPTH.labels('ocr_startup').dec()
+        store_name = await self.extract_store_name(filename)
+        if send:
+            await self.match_and_send(filename, store_name)
+
+    def deferring(self):
+        """Whether images are parked instead of OCR'd while no keyword is live"""
+        return self._drain_task is not None and not self._drain_task.done()
+
+    def live_keywords(self):
+        """Keywords not sent yet that arrived within the deferral window, oldest first"""
+        cutoff = time.monotonic() - self.deferred.window
+        return [keyword for keyword, added in self.keyword_added_at.items()
+                if added > cutoff and keyword not in self.sent_keywords]
+
+    def defer_image(self, filename):
+        """Park a downloaded image until a keyword arrives or the CPU is idle"""
+        evicted = self.deferred.put(filename)
+        DEFERRED.labels('deferred').inc()
+        if evicted:
+            DEFERRED.labels('evicted').inc(len(evicted))
+            logger.warning("Deferred image queue full, dropped %s oldest image(s)", len(evicted))
+        QUEUE_DEPTH.labels('deferred').set(len(self.deferred))
+        logger.debug("No live keywords, deferring OCR of %s", filename)
+        self._deferred_wakeup.set()
+
+    async def drain_deferred_images(self):
+        """
+        OCR parked images while keywords are live, or ahead of time while the CPU is idle.
+
+        Images are OCR'd oldest first. An image stays parked after OCR until a
+        keyword matches it (or its store name is rejected) so a later keyword
+        can still match it, and is dropped when it expires.
+        """
+        while True:
             try:
-                target_user = await self.client.get_entity(self.target_username)
-            except (TypeNotFoundError, AuthKeyError) as e:
-                print(f"Entity error when getting target user: {e}. Attempting to reconnect...")
-                if not await self.reconnect():
-                    print("Reconnection failed, skipping image send.")
-                    return
-                # Retry getting the entity after reconnection
-                try:
-                    target_user = await self.client.get_entity(self.target_username)
-                except Exception as e:
-                    print(f"Still unable to get target user after reconnection: {e}")
-                    return
+                expired = self.deferred.expire()
+                if expired:
+                    DEFERRED.labels('expired').inc(len(expired))
+                    logger.debug("%s deferred image(s) expired", len(expired))
+                self._forget_old_keywords()
+                QUEUE_DEPTH.labels('deferred').set(len(self.deferred))
+
+                live = bool(self.live_keywords())
+                if live and self._keywords_changed:
+                    # Images OCR'd while idle match new keywords without more OCR
+                    self._keywords_changed = False
+                    for item in self.deferred.items():
+                        if item.ocr_done:
+                            await self._match_deferred(item)
 
-            # Send the image to the user without a caption
+                item = self.deferred.next_without_ocr()
+                if item is not None and (live or self._cpu_idle()):
+                    item.store_name = await self.extract_store_name(item.filename)
+                    item.ocr_done = True
+                    DEFERRED.labels('processed' if live else 'precomputed').inc()
+                    await self._match_deferred(item)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error processing deferred images: %s", e)
+
+            self._deferred_wakeup.clear()
             try:
-                await self.client.send_file(target_user, image_path)
-            except (TypeNotFoundError, AuthKeyError) as e:
-                print(f"Send file error: {e}. Attempting to reconnect...")
-                if not await self.reconnect():
-                    print("Reconnection failed, skipping image send.")
-                    return
-                # Retry sending the file after reconnection
-                try:
-                    await self.client.send_file(target_user, image_path)
-                except Exception as e:
-                    print(f"Still unable to send image after reconnection: {e}")
-                    return
+                await asyncio.wait_for(self._deferred_wakeup.wait(), DEFERRED_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _match_deferred(self, item):
+        """Forward a parked image on a match; drop it once it matched or was rejected"""
+        if self.coordinator is not None:
+            await self.coordinator.refresh_keywords()
+        if item.store_name is None or self.matching_keyword(item.store_name):
+            self.deferred.remove(item.filename)
+            QUEUE_DEPTH.labels('deferred').set(len(self.deferred))
+        if item.store_name and item.send:
+            await self.match_and_send(item.filename, item.store_name)
+
+    def _forget_old_keywords(self):
+        cutoff = time.monotonic() - self.deferred.window
+        for keyword in [keyword for keyword, added in self.keyword_added_at.items() if added <= cutoff]:
+            del self.keyword_added_at[keyword]
+        # No more arrival times than pending keywords, however busy the window
+        while len(self.keyword_added_at) > MAX_PENDING_KEYWORDS:
+            del self.keyword_added_at[next(iter(self.keyword_added_at))]
+
+    def _cpu_idle(self):
+        """Whether OCR can run ahead of time without competing for CPU"""
+        if not self.image_processor_ready() or self._ocr_lock.locked():
+            return False
+        if not getattr(self._image_processor, 'loaded', True):
+            return False  # Models unloaded while idle are not reloaded just to read ahead
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1) < IDLE_LOAD_PER_CPU
+        except (AttributeError, OSError):
+            return False  # No load average on this platform
 
-            # Add the keyword to the sent keywords set to prevent duplicate sends
-            self.sent_keywords.add(keyword)
+    def stop_draining(self):
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            self._drain_task = None
 
-            print(f"Image sent to {self.target_username} (Keyword: {keyword})")
+    def _track(self, coro):
+        """Run ``coro`` as a background task, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def download_image(self, message, filename):
+        """Download a message's media to ``filename``, returning True on success"""
+        try:
+            await self._download(message, filename)
+            IMAGES.inc()
+            logger.debug("Image saved: %s", filename)
+            return True
+        except (TypeNotFoundError, AuthKeyError) as e:
+            logger.error("Media download error: %s. Attempting to reconnect...", e)
+            if not await self.reconnect():
+                logger.warning("Reconnection failed, skipping media download.")
+                return False
+            # Retry downloading media after reconnection
+            try:
+                await self._download(message, filename)
+                IMAGES.inc()
+                logger.debug("Image saved: %s", filename)
+                return True
+            except Exception as e:
+                logger.error("Still unable to download media after reconnection: %s", e)
+                return False
         except Exception as e:
-            print(f"Error sending image to {self.target_username}: {e}")
+            logger.error("Error downloading media: %s", e)
+            return False
+
+    async def _download(self, message, filename):
+        """Download into a .part file that is renamed once complete, so an interrupted download never leaves a truncated image"""
+        partial = f"{filename}.part"
+        try:
+            with STAGE_SECONDS.labels('download_media').time():
+                await self.client.download_media(message.media, file=partial)
+            os.replace(partial, filename)
+        except BaseException:
+            try:
+                os.unlink(partial)
+            except OSError:
+                pass
+            raise
+
+    def _remove_partial_downloads(self):
+        """Delete downloads left unfinished by a crash; their messages are downloaded again"""
+        for partial in self.images_dir.glob('*.part'):
+            try:
+                partial.unlink()
+            except OSError as e:
+                logger.warning("Could not remove partial download %s: %s", partial, e)
+
+    def get_image_processor(self):
+        """Return the shared ImageProcessor, creating it on first use (thread-safe)"""
+        with self._image_processor_lock:
+            if self._image_processor is None and self.ocr_server:
+                from ocr_server import OCRClient
+                self._image_processor = OCRClient(self.ocr_server)
+                logger.info("Using OCR server at %s", self.ocr_server)
+            if self._image_processor is None:
+                with STARTUP.phase('ocr_import'):
+                    from temu_extractor_easyocr import ImageProcessor
+                    from roi_calibration import RegionCalibration
+                with STARTUP.phase('ocr_init'):
+                    # Learns where the store name sits per screen layout (roi_calibration.json)
+                    self._image_processor = ImageProcessor(calibration=RegionCalibration())
+                    if self.ocr_settings:
+                        self._image_processor.configure(self.ocr_settings)
+                logger.info("OCR engine ready")
+            return self._image_processor
+
+    def share_ocr_engine(self, other):
+        """
+        Use another monitor's OCR engine and OCR lock.
+
+        A sharded worker monitors several chats with one monitor each; sharing
+        keeps a single engine (and its 1-2 GB of models) per process.
+        """
+        self.get_image_processor = other.get_image_processor
+        self.image_processor_ready = other.image_processor_ready
+        self.preload_image_processor = other.preload_image_processor
+        self._ocr_lock = other._ocr_lock
+
+    def prefetch_ocr(self):
+        """Start reloading OCR models unloaded while idle, ahead of an expected screenshot"""
+        processor = self._image_processor
+        if processor is not None and hasattr(processor, 'prefetch'):
+            processor.prefetch()
+
+    def image_processor_ready(self):
+        return self._image_processor is not None
+
+    def preload_image_processor(self):
+        """Start loading the OCR engine in a worker thread; returns the loading task"""
+        if self._image_processor_task is None:
+            self._image_processor_task = asyncio.ensure_future(asyncio.to_thread(self.get_image_processor))
+            # A failed preload is retried on the next image rather than reported as unretrieved
+            self._image_processor_task.add_done_callback(self._preload_done)
+        return self._image_processor_task
+
+    def _preload_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error loading OCR engine: %s", task.exception())
+            self._image_processor_task = None
+
+    async def wait_for_image_processor(self):
+        """Wait for the OCR engine to finish loading, starting the load if needed"""
+        return await asyncio.shield(self.preload_image_processor())
+
+    async def wait_until_ready(self):
+        """Wait until the bot is ingesting messages and the OCR engine is loaded"""
+        await self.ingesting.wait()
+        await self.wait_for_image_processor()
+
+    async def extract_store_name(self, filename):
+        """
+        Run the ImageProcessor on a downloaded image off the event loop.
+
+        Returns:
+            The store name, or None if the image is not a valid store screenshot
+        """
+        signature = None
+        if self.near_duplicates is not None:
+            try:
+                signature = await asyncio.to_thread(timed_call, 'image_signature', image_signature, filename)
+            except Exception as e:
+                logger.debug("Could not compute image signature of %s: %s", filename, e)
+            if signature is not None:
+                found, store_name, distance = self.near_duplicates.find(signature)
+                if found:
+                    CACHE_HITS.labels('near_duplicate').inc()
+                    logger.debug("Near-duplicate of an earlier screenshot (distance %s): %s", distance, store_name)
+                    self.ocr_cache[filename] = store_name
+                    return store_name
+
+        try:
+            # OCR is CPU bound; one image at a time keeps the engine's threads saturated
+            # (a few at a time with an OCR server, which batches them)
+            QUEUE_DEPTH.labels('ocr').inc()
+            try:
+                await self._ocr_lock.acquire()
+            finally:
+                QUEUE_DEPTH.labels('ocr').dec()
+            try:
+                processor = await self.wait_for_image_processor()
+
+                # Extract store name from the image
+                store_name = await asyncio.to_thread(timed_call, 'process_image', processor.process_image, filename)
+            finally:
+                self._ocr_lock.release()
+            logger.debug("Store name extracted: %s", store_name)
+        except ImportError as e:
+            logger.warning("temu_extractor_easyocr module not found, skipping extraction: %s", e)
+            return None
+        except InvalidImageError as e:
+            # Not a store screenshot; remember that so it is not OCR'd again
+            OCR_REJECTS.inc()
+            logger.info("Image rejected by ImageProcessor: %s", e, extra={'rate_key': 'ocr_reject'})
+            store_name = None
+        except Exception as e:
+            logger.error("Error running ImageProcessor: %s", e)
+            return None
+
+        self.ocr_cache[filename] = store_name
+        if signature is not None:
+            self.near_duplicates.add(signature, store_name)
+        return store_name
+
+    async def match_and_send(self, filename, store_name):
+        """Forward the image if the store name matches any pending keyword"""
+        # Check if store name matches any pending keywords
+        if not store_name:
+            return
+
+        if self.coordinator is not None:
+            await self.coordinator.refresh_keywords()
+        matched_keyword = self.matching_keyword(store_name)
+        if matched_keyword:
+            MATCHES.inc()
+            logger.info("Store name '%s' matches keyword '%s'", store_name, matched_keyword)
+
+            # Check if this keyword has already been sent (by any worker when sharded)
+            if matched_keyword not in self.sent_keywords and (
+                    self.coordinator is None or await self.coordinator.claim_keyword(matched_keyword, filename)):
+                # Queue the image for its targets; matches close together go out as one album
+                self.deliver_image(filename, store_name, matched_keyword)
+            else:
+                logger.info("Image for keyword '%s' already sent, skipping...", matched_keyword)
+
+    def matching_keyword(self, store_name):
+        """
+        The pending keyword (from any worker when sharded) the store name starts with, or None
+
+        Other workers' keywords are those of the last ``coordinator.refresh_keywords()``.
+        """
+        keywords = self.pending_keywords
+        if self.coordinator is not None:
+            keywords = list(keywords) + self.coordinator.keywords()
+        name = store_name.lower()
+        for keyword in keywords:
+            if name.startswith(keyword.lower()):
+                return keyword
+        return None
+
+    async def process_text_message(self, text):
+        """Extract keywords from Temu share URLs (at least 34 characters long) in a message"""
+        temu_urls = re.findall(TEMU_URL_PATTERN, text)
+
+        if temu_urls:
+            # A screenshot usually follows its share link
+            self.prefetch_ocr()
+
+        for url in temu_urls:
+            # Ensure the URL is at least 34 characters long
+            if len(url) >= TEMU_URL_LENGTH:
+                exact_url = url[:TEMU_URL_LENGTH]  # Take exactly first 34 characters
+                logger.debug("Temu share URL detected (first 34 chars): %s", exact_url)
+                await self.extract_keyword(exact_url)
+            else:
+                logger.warning("Temu URL is shorter than 34 characters: %s (length: %s)", url, len(url))
+
+    async def extract_keyword(self, exact_url):
+        """Resolve a share URL to its keyword and add it to the pending keywords"""
+        # Extract keyword from the exact 34-character URL
+        try:
+            if exact_url in self.keyword_cache:
+                keyword = self.keyword_cache[exact_url]
+                CACHE_HITS.labels('keyword').inc()
+            else:
+                keyword = await asyncio.to_thread(
+                    timed_call, 'extract_first_keyword', self.keyword_extractor.extract_first_keyword, exact_url
+                )
+                self.keyword_cache[exact_url] = keyword
+
+            if keyword:
+                logger.info("Extracted keyword from URL: %s", keyword)
+
+                # Add keyword to the list of keywords to match against store names
+                self.pending_keywords.add(keyword)
+                if self.coordinator is not None:
+                    await self.coordinator.register_keyword(keyword)
+                if self.deferred is not None:
+                    # Wake the drain task to OCR the images parked for lack of a keyword
+                    self.keyword_added_at.pop(keyword, None)
+                    self.keyword_added_at[keyword] = time.monotonic()
+                    self._keywords_changed = True
+                    self._deferred_wakeup.set()
+            else:
+                logger.warning("No keyword found in URL: %s", exact_url)
+        except Exception as e:
+            logger.error("Error extracting keyword from URL %s: %s", exact_url, e)
+
+    def save_caches(self):
+        """Trim the keyword and OCR caches to their newest entries and persist them"""
+        self.keyword_cache = newest_entries(self.keyword_cache, MAX_CACHE_ENTRIES)
+        self.ocr_cache = newest_entries(self.ocr_cache, MAX_CACHE_ENTRIES)
+        # Calibration samples that did not change a learned region are saved once per cycle
+        calibration = getattr(self._image_processor, 'calibration', None)
+        if calibration is not None:
+            calibration.flush()
+        if not self.cache_file:
+            return
+        try:
+            save_json(self.cache_file, {'group': self.target_group_identifier,
+                                        'keywords': self.keyword_cache, 'ocr': self.ocr_cache})
+        except Exception as e:
+            logger.error("Error saving pipeline cache: %s", e)
+
+    def load_state(self):
+        """Restore seen messages, keywords and parked images saved by the last run"""
+        if not self.state_file:
+            return
+        state = load_json(self.state_file, default=None)
+        if not state:
+            return
+        if str(state.get('group')) == self.target_group_identifier:
+            # Message IDs are only unique within a chat
+            self.seen_message_ids.update(state.get('seen_message_ids', []))
+        self.sent_keywords.update(state.get('sent_keywords', []))
+        self.pending_keywords.update(state.get('pending_keywords', []))
+        if self.deferred is not None:
+            offset = time.time() - time.monotonic()
+            for keyword, added in state.get('keyword_added_at', {}).items():
+                self.keyword_added_at[keyword] = added - offset
+            self.deferred.restore([entry for entry in state.get('deferred', [])
+                                   if os.path.exists(entry['filename'])])
+            self._keywords_changed = bool(self.keyword_added_at)
+        logger.info("Restored state from %s: %s seen messages, %s pending and %s sent keywords, %s parked images",
+                    self.state_file, len(self.seen_message_ids), len(self.pending_keywords),
+                    len(self.sent_keywords), len(self.deferred) if self.deferred is not None else 0)
+
+    def save_state(self):
+        """Persist what a restart needs to continue without reprocessing or resending anything"""
+        if not self.state_file:
+            return
+        offset = time.time() - time.monotonic()
+        # Keywords whose delivery is still in flight are saved as unsent
+        delivering = set(self._deliveries.values())
+        state = {
+            'group': self.target_group_identifier,
+            'saved': datetime.now().isoformat(),
+            'seen_message_ids': sorted(self.seen_message_ids)[-MAX_SAVED_MESSAGE_IDS:],
+            # Oldest first, so the same keywords are forgotten first after a restart
+            'sent_keywords': [keyword for keyword in self.sent_keywords if keyword not in delivering],
+            'pending_keywords': list(self.pending_keywords),
+            'keyword_added_at': {keyword: added + offset for keyword, added in self.keyword_added_at.items()},
+            'deferred': self.deferred.snapshot() if self.deferred is not None else [],
+        }
+        try:
+            save_json(self.state_file, state)
+        except Exception as e:
+            logger.error("Error saving monitor state: %s", e)
+
+    async def backfill(self, from_date=None, from_id=None, page_size=500, concurrency=8,
+                       dry_run=False, checkpoint_file=BACKFILL_CHECKPOINT_FILE):
+        """
+        Stream the monitored group's history through the processing pipeline.
+
+        Messages are read oldest first with ``iter_messages`` and handled a page at
+        a time: keywords from the page's text messages are resolved first, then its
+        images are downloaded and OCR'd concurrently. After every page the highest
+        processed message ID is checkpointed, so an interrupted run resumes where it
+        stopped.
+
+        Args:
+            from_date: Only process messages sent after this datetime
+            from_id: Only process messages with an ID greater than this one
+                (default: resume from the checkpoint, if any)
+            page_size: Number of messages processed per page
+            concurrency: Maximum number of messages processed at the same time
+            dry_run: Only build the keyword and OCR caches, never send images
+            checkpoint_file: Path of the JSON file recording progress per group
+        """
+        self.preload_image_processor()
+        await self.connect_and_authorize()
+
+        target_entity = await self.resolve_target_entity()
+        if target_entity is None:
+            return
+        self.ingesting.set()
+
+        checkpoints = load_json(checkpoint_file, default={}) or {}
+        chat_key = str(self.target_group_chat_id)
+        if from_id is None and from_date is None:
+            from_id = checkpoints.get(chat_key, {}).get('last_message_id')
+            if from_id:
+                logger.info("Resuming backfill after message %s", from_id)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_limited(coro):
+            async with semaphore:
+                return await coro
+
+        async def process_page(page):
+            # Keywords first so images later in the page can match them
+            await asyncio.gather(*(
+                run_limited(self._traced(message, self.process_text_message(message.text)))
+                for message in page if message.text
+            ))
+            if any(message.media for message in page):
+                await self.wait_for_image_processor()
+            await asyncio.gather(*(
+                run_limited(self._traced(message, self.process_image_message(message, send=not dry_run)))
+                for message in page if message.media
+            ))
+
+            await self.flush_deliveries()
+            for message in page:
+                self.seen_message_ids.add(message.id)
+
+            checkpoints[chat_key] = {
+                'last_message_id': page[-1].id,
+                'updated': datetime.now().isoformat(),
+            }
+            save_json(checkpoint_file, checkpoints)
+            self.save_caches()
+            self.save_state()
+
+        mode = "dry run" if dry_run else "live"
+        logger.info("Starting %s backfill of group %s...", mode, self.target_group_chat_id)
+
+        processed = 0
+        started = time.time()
+        page = []
+        async for message in self.client.iter_messages(
+            target_entity,
+            reverse=True,  # Oldest first
+            offset_date=from_date,
+            min_id=from_id or 0,
+            wait_time=0
+        ):
+            if self.stopping.is_set():
+                logger.info("Backfill stopped after %s messages; the next run resumes from the checkpoint", processed)
+                return
+            page.append(message)
+            if len(page) >= page_size:
+                await process_page(page)
+                processed += len(page)
+                page = []
+                elapsed = time.time() - started
+                logger.info("Backfilled %s messages (%.1f msg/s)", processed, processed / elapsed)
+
+        if page and not self.stopping.is_set():
+            await process_page(page)
+            processed += len(page)
+
+        logger.info("Backfill finished: %s messages processed in %.1fs", processed, time.time() - started)
     
-    async def stop(self):
-        """Stop the Telegram client"""
+    def deliver_image(self, image_path, store_name, keyword):
+        """
+        Send an image without a caption to every target routed for its keyword.
+
+        The keyword counts as sent right away so later matches in the same cycle
+        are skipped; it is released again if no target received the image.
+
+        Returns:
+            The task reporting the delivery once every target has been tried
+        """
+        targets = self.delivery.targets_for(keyword)
+        self.sent_keywords.add(keyword)
+        results = [self.dispatcher.submit(target, image_path) for target in targets]
+        task = asyncio.create_task(self._report_delivery(targets, results, keyword))
+        self._deliveries[task] = keyword
+        task.add_done_callback(lambda done: self._deliveries.pop(done, None))
+        return task
+
+    async def _report_delivery(self, targets, results, keyword):
+        delivered = [target for target, ok in zip(targets, await asyncio.gather(*results)) if ok]
+        if delivered:
+            SENDS.inc(len(delivered))
+            logger.info("Image sent to %s (Keyword: %s)", ", ".join(map(str, delivered)), keyword)
+        else:
+            self.sent_keywords.discard(keyword)
+            if self.coordinator is not None:
+                await self.coordinator.release_keyword(keyword)
+
+    async def flush_deliveries(self):
+        """Send images still waiting to be grouped into albums and wait until all deliveries finished"""
+        await self.dispatcher.flush()
+        if self._deliveries:
+            await asyncio.wait(list(self._deliveries))
+
+    async def stop(self, timeout=None):
+        """
+        Shut down: stop ingesting, finish queued work, save the state and disconnect.
+
+        Args:
+            timeout: Seconds to wait for images queued for OCR and for deliveries in
+                flight (None waits for all of them); whatever is left is cancelled.
+                Parked images and undelivered keywords are saved and picked up after the restart.
+        """
+        self.request_stop()
+        self.stop_draining()
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        if self._background_tasks:
+            _, pending = await asyncio.wait(list(self._background_tasks), timeout=remaining())
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                logger.warning("Shutdown deadline reached, saved %s image(s) still waiting for OCR", len(pending))
+        try:
+            await asyncio.wait_for(self.flush_deliveries(), remaining())
+        except asyncio.TimeoutError:
+            logger.warning("Shutdown deadline reached with %s delivery(ies) in flight", len(self._deliveries))
+
+        self.save_caches()
+        self.save_state()
         if self.client.is_connected():
             await self.client.disconnect()
-        print("Client disconnected successfully.")
\ No newline at end of file
+        logger.info("Client disconnected successfully.")
\ No newline at end of file
@@ -2,12 +2,44 @@
 Image processor module for OCR and store name extraction.
 
 This module is pure logic with no network/Telegram dependencies for testability.
+The OCR engine is an ``ocr_backends`` backend (EasyOCR by default); EasyOCR
+(and with it torch) is imported when the first ImageProcessor using it is
+created, so importing this module stays cheap.
+
+Images are preprocessed in memory before OCR: the header is cropped, scaled so
+the store name lands near a target text height (phone screenshots are often
+1080-1440px wide, far more than the detector needs), converted to grayscale
+and contrast stretched with NumPy. If the reduced image yields a low-confidence
+result, it is read again at full resolution.
+
+With a ``RegionCalibration``, the processor learns where the store name sits
+for each screen layout and reads just that band, falling back to the wide
+top-percent crop when the tight crop fails validation.
+
+In two-phase mode text boxes are detected first and recognized tallest-first,
+together with the boxes where the "Following/Sold/Items" anchors usually sit,
+stopping once the store name and an anchor are confirmed; on busy headers most
+boxes never reach the recognizer.
+
+With an idle timeout or memory ceiling (see model_lifecycle.py), the OCR
+models are unloaded while unused and loaded again by the next image, or
+ahead of it by ``prefetch()``.
 """
+import logging
 import re
-from typing import List, Tuple, Optional
-import easyocr
+import sys
+import threading
+import time
+from typing import List, Tuple, Optional, Union
+import numpy as np
 from PIL import Image
 from exceptions import InvalidImageError, OCRError
+from ocr_backends import OCRBackend, create_backend, default_backend_name
+from roi_calibration import Region, RegionCalibration
+from metrics import OCR_MODEL_EVENTS
+from model_lifecycle import ModelWatcher, OCR_IDLE_TIMEOUT_ENV, OCR_MAX_RSS_ENV, env_float, release_memory
+
+logger = logging.getLogger(__name__)
 
 class ImageProcessor:
     """Handles OCR processing and store name extraction from screenshots."""
@@ -21,7 +53,40 @@ class ImageProcessor:
     # Crop to top N% of image to focus on header (where store name is)
     CROP_TOP_PERCENT = 25  # Only process top 25% of image
     
-    def __init__(self, languages: List[str] = None, gpu: bool = False, crop_top: bool = True):
+    # Store name height as a fraction of the screenshot width (Temu store header)
+    TEXT_HEIGHT_RATIO = 0.045
+    # Text height in pixels the adaptive downscale aims for; the detector and
+    # recognizer read text of this size reliably
+    TARGET_TEXT_HEIGHT = 32
+    # Never shrink images narrower than this
+    MIN_OCR_WIDTH = 480
+    # Store names read with less confidence than this are re-read at full resolution
+    MIN_CONFIDENCE = 0.5
+    
+    # Boxes recognized per round in two-phase mode
+    TOP_K = 3
+    # Anchors sit beside or up to this many store-name heights below the store name
+    ANCHOR_ZONE_HEIGHTS = 3
+    
+    # Settings configure() changes while the models stay loaded
+    LIVE_SETTINGS = ('crop_percent', 'downscale', 'grayscale', 'contrast', 'target_text_height',
+                     'min_confidence', 'two_phase', 'top_k')
+
+    # ITU-R BT.601 luma weights used for grayscale conversion
+    LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    
+    def __init__(self, languages: List[str] = None, gpu: bool = False, crop_top: bool = True,
+                 crop_percent: Optional[float] = None, downscale: Optional[float] = None,
+                 grayscale: bool = True, contrast: bool = True, batch_size: int = 1,
+                 target_text_height: int = TARGET_TEXT_HEIGHT,
+                 min_confidence: float = MIN_CONFIDENCE,
+                 calibration: Optional[RegionCalibration] = None,
+                 two_phase: bool = True, top_k: int = TOP_K,
+                 backend: Union[str, OCRBackend, None] = None,
+                 model_dir: Optional[str] = None, download_enabled: Optional[bool] = None,
+                 verify_checksums: bool = True, quantize: bool = True,
+                 threads: Optional[int] = None, idle_timeout: Optional[float] = None,
+                 max_rss_mb: Optional[float] = None):
         """
         Initialize the OCR reader.
         
@@ -29,45 +94,280 @@ class ImageProcessor:
             languages: List of language codes for OCR (default: ['en'])
             gpu: Whether to use GPU acceleration (default: False)
             crop_top: Whether to crop to top portion of image (default: True)
+            crop_percent: Percentage of the image height kept when cropping
+                (default: CROP_TOP_PERCENT)
+            downscale: Fixed scale factor applied before OCR, e.g. 0.5 halves both
+                dimensions (default: None, chosen per image from its width)
+            grayscale: Whether to convert the image to grayscale before OCR (default:
+                True; earlier versions read the RGB image, pass False to keep that)
+            contrast: Whether to stretch the image's contrast before OCR (default:
+                True; pass False to read the image without stretching, as before)
+            batch_size: Number of text boxes recognized per forward pass (default: 1)
+            target_text_height: Store name height in pixels the adaptive downscale
+                aims for (default: TARGET_TEXT_HEIGHT)
+            min_confidence: Re-read downscaled images at full resolution when the
+                store name confidence is below this; 0 disables the fallback
+                (default: MIN_CONFIDENCE)
+            calibration: Learned store name regions; when given, calibrated
+                layouts are read from a tight crop and every successful
+                extraction refines the calibration (default: None, always use
+                the wide crop)
+            two_phase: Detect boxes first and recognize only as many as needed to
+                confirm the store name and an anchor (default: True)
+            top_k: Boxes recognized per round in two-phase mode, at least 1
+                (default: TOP_K)
+            backend: OCR engine: 'easyocr', 'tesseract', 'cascade' (Tesseract,
+                escalating to EasyOCR when validation or confidence fails), an
+                OCRBackend instance or a function creating one (default:
+                $OCR_BACKEND or 'easyocr'). Only backends given by name or
+                function are unloaded while idle.
+            model_dir: Directory with pre-provisioned EasyOCR weights
+                (default: $EASYOCR_MODEL_DIR, or EasyOCR's ~/.EasyOCR when unset)
+            download_enabled: Whether missing EasyOCR weights may be downloaded (default:
+                only when no model_dir is configured or $EASYOCR_ALLOW_DOWNLOAD is set)
+            verify_checksums: Verify model_dir against its manifest before loading (default: True)
+            quantize: Run EasyOCR's recognizer int8-quantized on CPU (default: True)
+            threads: Torch intra-op threads for EasyOCR (default: $OCR_THREADS or torch's default)
+            idle_timeout: Unload the OCR models after this many seconds without
+                an image (default: $OCR_IDLE_TIMEOUT, or never)
+            max_rss_mb: Unload the OCR models whenever the process's resident
+                memory exceeds this many MB (default: $OCR_MAX_RSS_MB, or no ceiling)
         """
         if languages is None:
             languages = ['en']
+        self._check_top_k(top_k)
         
         self.crop_top = crop_top
+        self.crop_percent = crop_percent if crop_percent is not None else self.CROP_TOP_PERCENT
+        self.downscale = downscale
+        self.grayscale = grayscale
+        self.contrast = contrast
+        self.batch_size = batch_size
+        self.target_text_height = target_text_height
+        self.min_confidence = min_confidence
+        # Number of images re-read at full resolution by the confidence guard
+        self.fallbacks = 0
+        self.calibration = calibration
+        # Number of tight crops that failed and were re-read from the wide crop
+        self.roi_misses = 0
+        self.two_phase = two_phase
+        self.top_k = top_k
+        # Text boxes detected and sent to the recognizer (two-phase mode)
+        self.boxes_detected = 0
+        self.boxes_recognized = 0
         
-        try:
-            self.reader = easyocr.Reader(languages, gpu=gpu)
-        except Exception as e:
-            raise OCRError(f"Failed to initialize EasyOCR reader: {e}")
+        if backend is None:
+            backend = default_backend_name()
+        # Backends created by name can be unloaded and recreated; instances passed in stay loaded
+        self._backend_factory = None
+        self.threads = threads
+        if isinstance(backend, str):
+            name = backend
+            self._backend_factory = lambda: create_backend(
+                name, languages, accept=self._acceptable, gpu=gpu, model_dir=model_dir,
+                download_enabled=download_enabled, verify_checksums=verify_checksums,
+                quantize=quantize, threads=self.threads)
+            backend = self._backend_factory()
+        elif callable(backend) and not isinstance(backend, OCRBackend):
+            self._backend_factory = backend
+            backend = backend()
+        self._backend = backend
+
+        # Model lifecycle: images being read, last use and load/unload counts
+        self._lifecycle_lock = threading.Lock()
+        self._in_use = 0
+        self.last_used = time.monotonic()
+        self.loads = 1
+        self.unloads = 0
+        self._prefetching = None
+        if idle_timeout is None:
+            idle_timeout = env_float(OCR_IDLE_TIMEOUT_ENV)
+        if max_rss_mb is None:
+            max_rss_mb = env_float(OCR_MAX_RSS_ENV)
+        self.watcher = None
+        if self._backend_factory is not None and (idle_timeout or max_rss_mb):
+            self.watcher = ModelWatcher(self, idle_timeout=idle_timeout, max_rss_mb=max_rss_mb).start()
+        # Settings as created, restored by configure() for settings left out
+        self._initial_settings = None
+
+    @property
+    def backend(self) -> OCRBackend:
+        """The OCR engine, loaded again first if it was unloaded."""
+        backend = self._backend
+        if backend is None:
+            with self._lifecycle_lock:
+                if self._backend is None:
+                    started = time.perf_counter()
+                    self._backend = self._backend_factory()
+                    self.loads += 1
+                    OCR_MODEL_EVENTS.labels('load').inc()
+                    logger.info("Loaded OCR models in %.1fs", time.perf_counter() - started)
+                backend = self._backend
+        return backend
+
+    @property
+    def loaded(self) -> bool:
+        return self._backend is not None
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last image finished, 0 while one is being read"""
+        return 0.0 if self._in_use else time.monotonic() - self.last_used
+
+    def unload(self, reason: str = 'manual') -> bool:
+        """
+        Drop the OCR models and return their memory to the OS.
+
+        Returns:
+            False if nothing was unloaded: the backend cannot be recreated, is
+            not loaded or is reading an image
+        """
+        with self._lifecycle_lock:
+            if self._backend_factory is None or self._backend is None or self._in_use:
+                return False
+            self._backend = None
+            self.unloads += 1
+        release_memory()
+        OCR_MODEL_EVENTS.labels(f'unload_{reason}').inc()
+        logger.info("Unloaded OCR models (%s)", reason)
+        return True
+
+    def configure(self, settings: dict):
+        """
+        Apply reloaded settings (see runtime_config.py) without reloading the models.
+
+        ``settings`` may hold any of LIVE_SETTINGS plus ``threads`` (torch
+        intra-op threads), ``idle_timeout`` and ``max_rss_mb``. Settings left
+        out go back to the values the processor was created with.
+        """
+        if self._initial_settings is None:
+            self._initial_settings = {name: getattr(self, name) for name in self.LIVE_SETTINGS + ('threads',)}
+            self._initial_settings['idle_timeout'] = self.watcher.idle_timeout if self.watcher else None
+            self._initial_settings['max_rss_mb'] = self.watcher.max_rss_mb if self.watcher else None
+        settings = {**self._initial_settings, **settings}
+        self._check_top_k(settings['top_k'])
+        for name in self.LIVE_SETTINGS:
+            setattr(self, name, settings[name])
+
+        if settings['threads'] and settings['threads'] != self.threads:
+            self.threads = settings['threads']
+            torch = sys.modules.get('torch')
+            if torch is not None:
+                torch.set_num_threads(self.threads)
+
+        idle_timeout, max_rss_mb = settings['idle_timeout'], settings['max_rss_mb']
+        if self.watcher is not None:
+            self.watcher.set_limits(idle_timeout, max_rss_mb)
+        elif self._backend_factory is not None and (idle_timeout or max_rss_mb):
+            self.watcher = ModelWatcher(self, idle_timeout=idle_timeout, max_rss_mb=max_rss_mb).start()
+
+    @staticmethod
+    def _check_top_k(top_k: int):
+        # Two-phase rounds advance by top_k boxes; fewer than one would never finish
+        if top_k < 1:
+            raise ValueError(f"top_k must be at least 1, got {top_k}")
+
+    def prefetch(self):
+        """Start loading unloaded models in the background, e.g. when a share link suggests a screenshot is coming."""
+        if self.loaded or (self._prefetching is not None and self._prefetching.is_alive()):
+            return
+        self.last_used = time.monotonic()  # Not idle: keep the models once loaded
+        self._prefetching = threading.Thread(target=lambda: self.backend, name="ocr-prefetch", daemon=True)
+        self._prefetching.start()
+    
+    def choose_scale(self, width: int) -> float:
+        """
+        Pick the downscale factor for an image of the given width.
+        
+        The store name height is estimated from the width; the image is shrunk
+        so that text ends up around ``target_text_height`` pixels, but never
+        enlarged and never below ``MIN_OCR_WIDTH``.
+        
+        Args:
+            width: Image width in pixels
+            
+        Returns:
+            Scale factor in (0, 1]
+        """
+        if self.downscale is not None:
+            return self.downscale
+        estimated_text_height = width * self.TEXT_HEIGHT_RATIO
+        scale = min(1.0, self.target_text_height / estimated_text_height)
+        return max(scale, min(1.0, self.MIN_OCR_WIDTH / width))
+    
+    def wide_region(self) -> Region:
+        """The fixed crop: the top ``crop_percent`` of the image, or all of it."""
+        return (0.0, 0.0, 1.0, self.crop_percent / 100 if self.crop_top else 1.0)
     
-    def _crop_image(self, image_path: str) -> str:
+    def preprocess(self, image_path: str, scale: Optional[float] = None,
+                   region: Optional[Region] = None) -> Tuple[np.ndarray, float, Tuple[int, int]]:
         """
-        Crop image to top portion to focus on header/store name.
+        Crop, scale, convert and contrast-normalize an image for OCR.
         
         Args:
             image_path: Path to original image
+            scale: Scale factor to apply (default: chosen by ``choose_scale``)
+            region: Normalized (left, top, right, bottom) area to keep
+                (default: ``wide_region()``)
             
         Returns:
-            Path to cropped image (temporary file)
+            Tuple of (uint8 image array, scale applied, original (width, height)).
+            The array is 2-D when grayscale is enabled and RGB otherwise.
         """
         try:
             img = Image.open(image_path)
             width, height = img.size
+            if scale is None:
+                scale = self.choose_scale(width)
+            if region is None:
+                region = self.wide_region()
             
-            # Crop to top N% of image
-            crop_height = int(height * (self.CROP_TOP_PERCENT / 100))
-            cropped = img.crop((0, 0, width, crop_height))
+            left, top, right, bottom = region
+            box = (int(width * left), int(height * top), int(width * right), int(height * bottom))
+            target_size = (max(1, round((box[2] - box[0]) * scale)), max(1, round((box[3] - box[1]) * scale)))
             
-            # Save to temporary file
-            import tempfile
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            cropped.save(temp_file.name)
-            temp_file.close()
+            if scale < 1.0:
+                # Let the JPEG decoder skip detail we are about to throw away
+                img.draft('RGB', (max(1, round(width * scale)), max(1, round(height * scale))))
             
-            return temp_file.name
+            # Crop in the (possibly reduced) decoded coordinates
+            decoded_scale = img.size[0] / width
+            cropped = img.crop(tuple(int(value * decoded_scale) for value in box))
+            if cropped.mode != 'RGB':
+                cropped = cropped.convert('RGB')
+            if cropped.size != target_size:
+                cropped = cropped.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+            
+            pixels = np.asarray(cropped, dtype=np.uint8)
+            
+            if self.grayscale or self.contrast:
+                luma = pixels @ self.LUMA_WEIGHTS
+            if self.grayscale:
+                pixels = luma
+            if self.contrast:
+                pixels = self._stretch_contrast(pixels, luma)
+            
+            return np.ascontiguousarray(pixels, dtype=np.uint8), scale, (width, height)
             
         except Exception as e:
-            raise OCRError(f"Failed to crop image: {e}")
+            raise OCRError(f"Failed to preprocess image: {e}")
+    
+    @staticmethod
+    def _stretch_contrast(pixels: np.ndarray, luma: np.ndarray,
+                          low_percent: float = 1, high_percent: float = 99) -> np.ndarray:
+        """
+        Linearly stretch intensities so the given luma percentiles map to 0 and 255.
+        
+        Percentiles come from a 256-bin histogram, which is much cheaper than
+        sorting every pixel.
+        """
+        histogram = np.bincount(luma.astype(np.uint8).ravel(), minlength=256)
+        cumulative = np.cumsum(histogram) / luma.size
+        low = int(np.searchsorted(cumulative, low_percent / 100))
+        high = int(np.searchsorted(cumulative, high_percent / 100))
+        if high - low < 32:
+            return pixels  # Flat image, or already high contrast
+        stretched = (pixels.astype(np.float32) - low) * (255.0 / (high - low))
+        return np.clip(stretched, 0, 255)
     
     def validate_keywords(self, ocr_results: List[Tuple]) -> bool:
         """
@@ -115,6 +415,19 @@ class ImageProcessor:
         Raises:
             InvalidImageError: If no valid store name found
         """
+        candidates = self._store_name_candidates(ocr_results)
+        
+        # Return the largest text element
+        store_name = candidates[0]['text']
+        return self.normalize_text(store_name)
+    
+    def _store_name_candidates(self, ocr_results: List[Tuple]) -> List[dict]:
+        """
+        Non-UI text elements sorted by bounding box height, largest first.
+        
+        Raises:
+            InvalidImageError: If no valid store name candidate is found
+        """
         if not ocr_results:
             raise InvalidImageError("No text found in image")
         
@@ -135,6 +448,7 @@ class ImageProcessor:
             avg_height = sum(heights) / len(heights)
             
             candidates.append({
+                'bbox': bbox,
                 'text': text_clean,
                 'height': avg_height,
                 'confidence': confidence
@@ -145,10 +459,21 @@ class ImageProcessor:
         
         # Sort by height (descending) to get largest text
         candidates.sort(key=lambda x: x['height'], reverse=True)
-        
-        # Return the largest text element
-        store_name = candidates[0]['text']
-        return self.normalize_text(store_name)
+        return candidates
+    
+    def _acceptable(self, ocr_results: List[Tuple]) -> bool:
+        """
+        Whether a read is strong enough to trust: it validates and the store
+        name confidence reaches ``min_confidence``. Weak downscaled reads are
+        repeated at full resolution, and the cascade backend escalates weak
+        reads to the next engine.
+        """
+        try:
+            self.validate_keywords(ocr_results)
+            best = self._store_name_candidates(ocr_results)[0]
+        except InvalidImageError:
+            return False
+        return best['confidence'] >= self.min_confidence
     
     @staticmethod
     def normalize_text(text: str) -> str:
@@ -181,38 +506,159 @@ class ImageProcessor:
             InvalidImageError: If image is invalid or no keywords found
             OCRError: If OCR processing fails
         """
-        cropped_path = None
+        with self._lifecycle_lock:
+            self._in_use += 1
         try:
-            # Crop to top portion if enabled
-            if self.crop_top:
-                cropped_path = self._crop_image(image_path)
-                ocr_path = cropped_path
-            else:
-                ocr_path = image_path
-            
-            # Run OCR
-            ocr_results = self.reader.readtext(ocr_path)
+            if self.calibration is not None:
+                with Image.open(image_path) as img:
+                    region = self.calibration.region_for(*img.size)
+                if region is not None:
+                    try:
+                        return self._read_region(image_path, region)
+                    except InvalidImageError:
+                        # The layout moved or this is not a store screenshot: use the wide crop
+                        self.roi_misses += 1
             
-            if not ocr_results:
-                raise InvalidImageError("No text detected in image")
-            
-            # Validate keywords
-            self.validate_keywords(ocr_results)
+            return self._read_region(image_path, self.wide_region())
             
-            # Extract store name
-            store_name = self.extract_store_name(ocr_results)
-            
-            return store_name
-            
-        except InvalidImageError:
+        except (InvalidImageError, OCRError):
             raise
         except Exception as e:
             raise OCRError(f"OCR processing failed: {e}")
         finally:
-            # Cleanup temporary cropped file
-            if cropped_path:
-                try:
-                    import os
-                    os.unlink(cropped_path)
-                except:
-                    pass
+            with self._lifecycle_lock:
+                self._in_use -= 1
+                self.last_used = time.monotonic()
+    
+    def _read_region(self, image_path: str, region: Region) -> str:
+        """
+        OCR one region of an image and extract the store name.
+        
+        Successful reads are recorded in the calibration.
+        """
+        # Crop, scale and convert in memory
+        image, scale, size = self.preprocess(image_path, region=region)
+        
+        # Run OCR
+        ocr_results = self._ocr(image)
+        
+        # Confidence guard: retry weak downscaled reads at full resolution
+        if scale < 1.0 and self.min_confidence > 0 and not self._acceptable(ocr_results):
+            self.fallbacks += 1
+            image, scale, size = self.preprocess(image_path, scale=1.0, region=region)
+            ocr_results = self._ocr(image)
+        
+        if not ocr_results:
+            raise InvalidImageError("No text detected in image")
+        
+        # Validate keywords
+        self.validate_keywords(ocr_results)
+        
+        # Extract store name
+        candidates = self._store_name_candidates(ocr_results)
+        store_name = self.normalize_text(candidates[0]['text'])
+        
+        if self.calibration is not None:
+            anchors = [bbox for bbox, text, _ in ocr_results
+                       if any(kw.lower() in text.lower() for kw in self.VALIDATION_KEYWORDS)]
+            boxes = [self._normalize_box(bbox, region, scale, size)
+                     for bbox in [candidates[0]['bbox']] + anchors]
+            self.calibration.record(*size, boxes)
+        
+        return store_name
+    
+    def _ocr(self, image: np.ndarray) -> List[Tuple]:
+        """Run OCR on a preprocessed image, in one pass or two phases."""
+        if self.two_phase and self.backend.supports_two_phase:
+            return self._ocr_two_phase(image)
+        return self.backend.readtext(image, batch_size=self.batch_size)
+    
+    def _ocr_two_phase(self, image: np.ndarray) -> List[Tuple]:
+        """
+        Detect all text boxes, then recognize them tallest-first until confirmed.
+        
+        The store name is the tallest non-UI box, so once it is recognized and
+        every taller box has been read it cannot change. The first round also
+        reads the boxes in the anchor zone around the tallest box, where
+        "Following/Sold/Items" usually are. Later rounds read the next
+        ``top_k`` tallest boxes until both a store name and an anchor are
+        confirmed or every box has been read, so the results match those of
+        a full ``readtext`` whenever a store name is found.
+        
+        Returns:
+            OCR results for the recognized boxes, in ``readtext`` format
+        """
+        horizontal_list, free_list = self.backend.detect(image)
+        horizontal = horizontal_list[0] if horizontal_list else []
+        free = free_list[0] if free_list else []
+        count = len(horizontal) + len(free)
+        self.boxes_detected += count
+        if not count:
+            return []
+        
+        # Box tops, bottoms and heights (same height measure as extract_store_name)
+        tops = np.empty(count, dtype=np.float32)
+        bottoms = np.empty(count, dtype=np.float32)
+        heights = np.empty(count, dtype=np.float32)
+        if horizontal:
+            boxes = np.asarray(horizontal, dtype=np.float32)  # x_min, x_max, y_min, y_max
+            tops[:len(horizontal)] = boxes[:, 2]
+            bottoms[:len(horizontal)] = boxes[:, 3]
+            heights[:len(horizontal)] = boxes[:, 3] - boxes[:, 2]
+        if free:
+            points = np.asarray(free, dtype=np.float32)  # 4 corner points per box
+            tops[len(horizontal):] = points[:, :, 1].min(axis=1)
+            bottoms[len(horizontal):] = points[:, :, 1].max(axis=1)
+            heights[len(horizontal):] = ((points[:, 2, 1] - points[:, 0, 1]) +
+                                         (points[:, 3, 1] - points[:, 1, 1])) / 2
+        
+        order = np.argsort(-heights, kind='stable')
+        tallest = order[0]
+        in_zone = ((tops >= tops[tallest] - heights[tallest]) &
+                   (tops <= bottoms[tallest] + self.ANCHOR_ZONE_HEIGHTS * heights[tallest]))
+        
+        recognized = np.zeros(count, dtype=bool)
+        batch = np.zeros(count, dtype=bool)
+        batch[order[:self.top_k]] = True
+        batch |= in_zone
+        ocr_results = []
+        next_rank = self.top_k
+        while True:
+            indices = np.flatnonzero(batch & ~recognized)
+            ocr_results.extend(self._recognize(image, horizontal, free, indices))
+            recognized[indices] = True
+            
+            if recognized.all() or self._confirmed(ocr_results, heights[~recognized]):
+                return ocr_results
+            
+            batch = np.zeros(count, dtype=bool)
+            batch[order[next_rank:next_rank + self.top_k]] = True
+            next_rank += self.top_k
+    
+    def _recognize(self, image: np.ndarray, horizontal: list, free: list, indices: np.ndarray) -> List[Tuple]:
+        """Recognize the detected boxes at ``indices`` (horizontal boxes first, then free-form)."""
+        if not len(indices):
+            return []
+        split = len(horizontal)
+        horizontal_boxes = [horizontal[i] for i in indices if i < split]
+        free_boxes = [free[i - split] for i in indices if i >= split]
+        self.boxes_recognized += len(indices)
+        return self.backend.recognize(image, horizontal_boxes, free_boxes, batch_size=self.batch_size)
+    
+    def _confirmed(self, ocr_results: List[Tuple], unread_heights: np.ndarray) -> bool:
+        """Whether the results hold an anchor and a store name no unread box could outrank."""
+        try:
+            self.validate_keywords(ocr_results)
+            best = self._store_name_candidates(ocr_results)[0]
+        except InvalidImageError:
+            return False
+        return not len(unread_heights) or unread_heights.max() < best['height']
+    
+    @staticmethod
+    def _normalize_box(bbox, region: Region, scale: float, size: Tuple[int, int]) -> Region:
+        """Map an OCR box in preprocessed-crop pixels to (left, top, right, bottom) fractions of the original image."""
+        width, height = size
+        xs = [point[0] for point in bbox]
+        ys = [point[1] for point in bbox]
+        return (region[0] + min(xs) / (scale * width), region[1] + min(ys) / (scale * height),
+                region[0] + max(xs) / (scale * width), region[1] + max(ys) / (scale * height))
@@ -1,24 +1,48 @@
 """
-Module to extract the store name from Temu share URLs by parsing the href attribute of the a element.
+Module to extract the store name from Temu share URLs by reading the share_title parameter.
+
+The share link is resolved with as little reading as possible: redirect
+headers are checked first (with HEAD requests, following redirect hops
+manually), and only when no redirect carries ``share_title`` is the page body
+fetched. The body is streamed and scanned chunk by chunk for ``share_title=``,
+and the connection is closed as soon as it is found, without building a DOM.
 """
 
+import html
 import re
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, parse_qs, unquote
+from urllib.parse import urlparse, urljoin, unquote
 
 
 class TemuKeywordExtractor:
-    """Extracts the store name from the href attribute of the a element in Temu share URLs."""
+    """Extracts the store name from the share_title parameter behind Temu share URLs."""
+    
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    
+    # share_title value, terminated by a query, attribute or markup delimiter
+    SHARE_TITLE_PATTERN = re.compile(rb'share_title=([^&"\'\s<>#]*)([&"\'\s<>#])')
+    SHARE_TITLE_MARKER = b'share_title='
+    # Longest share_title value kept while waiting for its terminating delimiter
+    MAX_SHARE_TITLE_BYTES = 2048
     
-    def __init__(self, timeout=10):
+    def __init__(self, timeout=10, endpoint=None, max_redirects=5, chunk_size=8192,
+                 max_body_bytes=2 * 1024 * 1024):
         """
         Initialize the extractor.
         
         Args:
             timeout (int): Request timeout in seconds
+            endpoint (str): Base URL that share links are requested from instead of
+                https://share.temu.com (e.g. a local stub server for replays)
+            max_redirects (int): Redirect hops followed while looking for share_title
+            chunk_size (int): Bytes read per step when scanning a page body
+            max_body_bytes (int): Stop scanning a page body after this many bytes
         """
         self.timeout = timeout
+        self.endpoint = endpoint
+        self.max_redirects = max_redirects
+        self.chunk_size = chunk_size
+        self.max_body_bytes = max_body_bytes
         self.session = requests.Session()
         # Set a user agent to avoid being blocked
         self.session.headers.update({
@@ -44,103 +68,89 @@ class TemuKeywordExtractor:
         if 'share.temu.com' not in parsed.netloc:
             raise ValueError(f"Not a Temu share URL: {url}")
         
+        # Send the request to the configured endpoint, keeping the share code path
+        if self.endpoint:
+            url = self.endpoint.rstrip('/') + parsed.path
+
         try:
-            # Make HTTP request without following redirects to get the redirect URL
-            response = self.session.get(url, timeout=self.timeout, allow_redirects=False)
-            
-            # Check if there's a redirect
-            if response.status_code in [301, 302, 307, 308]:
-                redirect_url = response.headers.get('Location')
-                if redirect_url:
-                    # Extract the share_title from the redirect URL
-                    match = re.search(r'share_title=([^&]+)', redirect_url)
+            return self._resolve(url)
+        except requests.RequestException as e:
+            raise Exception(f"Error making request to {url}: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Error extracting keyword from {url}: {str(e)}")
+    
+    def _resolve(self, url):
+        """
+        Follow redirect headers to share_title, falling back to scanning the page body.
+        
+        Each hop is tried with HEAD, which transfers no body; a GET is only
+        issued for a page that does not redirect (or for servers rejecting HEAD).
+        """
+        method = 'HEAD'
+        hops = 0
+        while True:
+            request = self.session.head if method == 'HEAD' else self.session.get
+            response = request(url, timeout=self.timeout, allow_redirects=False, stream=True)
+            try:
+                if response.status_code in self.REDIRECT_CODES and response.headers.get('Location'):
+                    location = response.headers['Location']
+                    match = self.SHARE_TITLE_PATTERN.search(location.encode('utf-8') + b'&')
                     if match:
-                        share_title_encoded = match.group(1)
-                        
-                        # Decode URL encoding (e.g., %20 becomes space)
-                        share_title_decoded = unquote(share_title_encoded)
-                        
-                        # Get the first word, ignoring %20 and anything after
-                        # Split by spaces and take the first part
-                        first_word = share_title_decoded.split()[0] if share_title_decoded.split() else None
-                        
-                        return first_word
-                else:
-                    # If no redirect location, try to follow redirects and parse the final page
-                    response = self.session.get(url, timeout=self.timeout, allow_redirects=True)
-                    response.raise_for_status()
-                    
-                    # Parse the HTML
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    
-                    # Find the single a element in the response HTML
-                    a_element = soup.find('a')
-                    
-                    if not a_element:
+                        return self._first_word(match.group(1))
+                    hops += 1
+                    if hops > self.max_redirects:
                         return None
-                    
-                    # Get the href attribute
-                    href = a_element.get('href')
-                    if not href:
-                        return None
-                    
-                    # Extract the store name from share_title parameter using regex
-                    # Look for share_title= followed by URL-encoded text
-                    match = re.search(r'share_title=([^&]+)', href)
-                    if not match:
-                        return None
-                    
-                    # Get the share_title value
-                    share_title_encoded = match.group(1)
-                    
-                    # Decode URL encoding (e.g., %20 becomes space)
-                    share_title_decoded = unquote(share_title_encoded)
-                    
-                    # Get the first word, ignoring %20 and anything after
-                    # Split by spaces and take the first part
-                    first_word = share_title_decoded.split()[0] if share_title_decoded.split() else None
-                    
-                    return first_word
-            else:
-                # If no redirect, process the page normally
-                response.raise_for_status()
-                
-                # Parse the HTML
-                soup = BeautifulSoup(response.content, 'html.parser')
+                    url = urljoin(url, location)
+                    method = 'HEAD'
+                    continue
                 
-                # Find the single a element in the response HTML
-                a_element = soup.find('a')
+                if method == 'HEAD':
+                    # No redirect to read share_title from: fetch the page itself
+                    method = 'GET'
+                    continue
                 
-                if not a_element:
-                    return None
-                
-                # Get the href attribute
-                href = a_element.get('href')
-                if not href:
-                    return None
-                
-                # Extract the store name from share_title parameter using regex
-                # Look for share_title= followed by URL-encoded text
-                match = re.search(r'share_title=([^&]+)', href)
-                if not match:
-                    return None
-                
-                # Get the share_title value
-                share_title_encoded = match.group(1)
-                
-                # Decode URL encoding (e.g., %20 becomes space)
-                share_title_decoded = unquote(share_title_encoded)
-                
-                # Get the first word, ignoring %20 and anything after
-                # Split by spaces and take the first part
-                first_word = share_title_decoded.split()[0] if share_title_decoded.split() else None
-                
-                return first_word
+                response.raise_for_status()
+                return self._scan_body(response)
+            finally:
+                response.close()
+    
+    def _scan_body(self, response):
+        """
+        Read the body chunk by chunk until share_title is found.
         
-        except requests.RequestException as e:
-            raise Exception(f"Error making request to {url}: {str(e)}")
-        except Exception as e:
-            raise Exception(f"Error extracting keyword from {url}: {str(e)}")
+        Only the tail of the data read so far is kept, so memory stays bounded
+        however large the page is.
+        """
+        buffer = b''
+        read = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            read += len(chunk)
+            buffer += chunk
+            match = self.SHARE_TITLE_PATTERN.search(buffer)
+            if match:
+                return self._first_word(match.group(1))
+            if read >= self.max_body_bytes:
+                return None
+            # Keep a possibly unterminated share_title value, or enough bytes to
+            # catch a marker split across chunks
+            start = buffer.rfind(self.SHARE_TITLE_MARKER)
+            if start == -1 or len(buffer) - start > self.MAX_SHARE_TITLE_BYTES:
+                start = max(0, len(buffer) - len(self.SHARE_TITLE_MARKER))
+            buffer = buffer[start:]
+        
+        # The value may run to the very end of the body
+        match = self.SHARE_TITLE_PATTERN.search(buffer + b'&')
+        return self._first_word(match.group(1)) if match else None
+    
+    @staticmethod
+    def _first_word(share_title_encoded):
+        """Decode a share_title value and return its first word."""
+        # Decode HTML entities and URL encoding (e.g., %20 becomes space)
+        share_title_decoded = unquote(html.unescape(share_title_encoded.decode('utf-8', 'replace')))
+        
+        # Get the first word, ignoring %20 and anything after
+        words = share_title_decoded.split()
+        return words[0] if words else None
 
 
 def extract_first_keyword_from_url(url):
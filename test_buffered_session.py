@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test the buffered Telethon session: batched writes, immediate login writes and shared use of one file.
+"""
+
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from telethon import types
+from telethon.crypto import AuthKey
+from telethon.sessions import SQLiteSession
+
+from buffered_session import BufferedSession
+
+
+def entities(*ids):
+    return types.contacts.ResolvedPeer(None, [types.InputPeerUser(user_id, user_id * 10) for user_id in ids], [])
+
+
+def entity_ids(path):
+    with sqlite3.connect(path) as db:
+        return sorted(row[0] for row in db.execute("select id from entities"))
+
+
+def test_login_written_immediately_entities_batched():
+    with tempfile.TemporaryDirectory() as tmp:
+        name = os.path.join(tmp, "bot")
+        session = BufferedSession(name, flush_interval=3600)
+        session.set_dc(2, "149.154.167.51", 443)
+        session.auth_key = AuthKey(os.urandom(256))
+        session.save()
+        disk = SQLiteSession(name)
+        assert (disk.dc_id, disk.auth_key.key) == (2, session.auth_key.key)
+        disk.close()
+
+        # Entities and update states stay in memory until the interval passes or the client closes
+        session.process_entities(entities(1, 2))
+        session.set_update_state(0, types.updates.State(5, 0, datetime.datetime.now(datetime.timezone.utc), 1, 0))
+        session.save()
+        assert entity_ids(name + ".session") == []
+        assert session.get_input_entity(1).access_hash == 10
+        session.close()
+        assert entity_ids(name + ".session") == [1, 2]
+
+        reopened = BufferedSession(name)
+        assert reopened.auth_key.key == session.auth_key.key
+        assert reopened.get_input_entity(2).access_hash == 20
+        assert reopened.get_update_state(0).pts == 5
+    print("✓ Logins are written at once, entities and update states in batches")
+
+
+def test_periodic_flush_in_background():
+    with tempfile.TemporaryDirectory() as tmp:
+        name = os.path.join(tmp, "bot")
+        session = BufferedSession(name, flush_interval=0)
+        for user_id in range(1, 6):
+            session.process_entities(entities(user_id))
+        # Re-reading known entities does not make them dirty again
+        session.process_entities(entities(1, 2))
+        session.save()
+        deadline = time.monotonic() + 5
+        while session.flushes < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert entity_ids(name + ".session") == [1, 2, 3, 4, 5]
+        assert session.flushes == 1
+    print("✓ Changes are flushed in one batch from a background thread")
+
+
+def test_shared_session_file():
+    """The bot and a helper script flushing the same session keep each other's rows."""
+    with tempfile.TemporaryDirectory() as tmp:
+        name = os.path.join(tmp, "bot")
+        bot = BufferedSession(name, flush_interval=3600)
+        bot.auth_key = AuthKey(os.urandom(256))
+        bot.save()
+        helper = BufferedSession(name, flush_interval=3600)
+
+        def use(session, first):
+            for user_id in range(first, first + 50):
+                session.process_entities(entities(user_id))
+                session.flush()
+
+        threads = [threading.Thread(target=use, args=(bot, 1)), threading.Thread(target=use, args=(helper, 100))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert entity_ids(name + ".session") == list(range(1, 51)) + list(range(100, 150))
+        assert SQLiteSession(name).auth_key.key == bot.auth_key.key
+    print("✓ Concurrent users of one session file do not overwrite each other")
+
+
+if __name__ == "__main__":
+    print("Testing buffered session...")
+    test_login_written_immediately_entities_batched()
+    test_periodic_flush_in_background()
+    test_shared_session_file()
+    print("✓ Buffered session tests passed")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test demand-driven OCR: images are parked until a keyword could match them.
+"""
+
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from deferred_ocr import DeferredImages
+from replay import StubTemuServer, build_replay_monitor
+
+
+def test_queue_bounds_and_expiry():
+    queue = DeferredImages(max_items=2, window=60)
+    queue.put("a.jpg")
+    queue.put("b.jpg")
+    evicted = queue.put("c.jpg")
+    assert [item.filename for item in evicted] == ["a.jpg"]
+    assert [item.filename for item in queue.items()] == ["b.jpg", "c.jpg"]
+
+    queue.items()[0].ocr_done = True
+    assert queue.next_without_ocr().filename == "c.jpg"
+
+    queue.items()[0].added = time.monotonic() - 120
+    assert [item.filename for item in queue.expire()] == ["b.jpg"]
+    assert "c.jpg" in queue and len(queue) == 1
+    print("✓ Deferred queue is bounded and expires old images")
+
+
+async def replay_deferred(records):
+    with tempfile.TemporaryDirectory() as workdir:
+        image = Path(workdir) / "screenshot.jpg"
+        Image.new('RGB', (100, 200)).save(image)
+        for record in records:
+            if record.get('image'):
+                record['image'] = str(image)
+
+        with StubTemuServer() as server:
+            monitor, client, titles = build_replay_monitor(records, Path(workdir) / "images", server.url,
+                                                           ocr_stub=True)
+            server.titles.update(titles)
+            # Identical test images must not be answered from the near-duplicate index
+            monitor.near_duplicates = None
+            monitor._cpu_idle = lambda: False
+
+            calls = []
+            process_image = monitor._image_processor.process_image
+            monitor._image_processor.process_image = lambda path: calls.append(path) or process_image(path)
+
+            monitor._drain_task = asyncio.create_task(monitor.drain_deferred_images())
+            try:
+                while not client.exhausted:
+                    await monitor.fetch_recent_messages()
+                for _ in range(50):
+                    await asyncio.sleep(0.01)
+                await monitor.flush_deliveries()
+            finally:
+                monitor.stop_draining()
+        return monitor, client, calls
+
+
+def test_images_wait_for_keyword():
+    """Without a live keyword nothing is OCR'd; a later keyword OCRs and forwards the parked image."""
+    records = [
+        {'id': 1, 'image': True, 'store_name': "Crystal Shop"},
+        {'id': 2, 'image': True, 'store_name': None},
+    ]
+    monitor, client, calls = asyncio.run(replay_deferred(records))
+    assert calls == [] and len(monitor.deferred) == 2
+    print("✓ Images are parked while no keyword is live")
+
+    records.append({'id': 3, 'text': "https://share.temu.com/AbCdEfGhIjK", 'share_title': "Crystal Shop"})
+    monitor, client, calls = asyncio.run(replay_deferred(records))
+    print(f"OCR calls: {len(calls)}, sent: {client.sent}")
+    assert len(client.sent) == 1 and client.sent[0][1].endswith("image_1.jpg")
+    # Once the keyword is sent no keyword is live, so the other image is not OCR'd
+    assert len(calls) == 1
+    assert [item.filename for item in monitor.deferred.items()] == [str(monitor.images_dir / "image_2.jpg")]
+    print("✓ A keyword arriving after its screenshot still forwards it")
+
+
+if __name__ == "__main__":
+    print("Testing deferred OCR...")
+    test_queue_bounds_and_expiry()
+    test_images_wait_for_keyword()
+    print("✓ Deferred OCR tests passed")
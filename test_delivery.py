@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test delivery routing, concurrent fan-out and album coalescing.
+"""
+
+import asyncio
+import time
+
+from delivery import DeliveryConfig, DeliveryDispatcher, DeliveryRule
+
+
+class SlowClient:
+    """Records send_file calls, each taking ``delay`` seconds."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get_entity(self, target):
+        return target
+
+    async def send_file(self, entity, file, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        self.sent.append((entity, file))
+
+
+def test_routing_rules():
+    config = DeliveryConfig(['@default'], [
+        DeliveryRule(['crystal*'], ['@alice', '@bob']),
+        DeliveryRule(['*shop'], ['@bob', '-1001234']),
+    ])
+    assert config.targets_for("Crystal") == ['@alice', '@bob']
+    assert config.targets_for("crystalshop") == ['@alice', '@bob', '-1001234']
+    assert config.targets_for("Lumi") == ['@default']
+    print("✓ Keywords are routed to their rules' targets, others to the defaults")
+
+
+async def fan_out(targets, images, window):
+    client = SlowClient()
+    dispatcher = DeliveryDispatcher(client, max_in_flight=4, coalesce_window=window)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(dispatcher.deliver(target, image)
+                                     for image in images for target in targets))
+    return client, results, time.perf_counter() - started
+
+
+def test_albums_and_fan_out():
+    """Images for a target within the window form one album; targets are sent to concurrently."""
+    targets = ['@a', '@b', '@c', '@d']
+    client, results, elapsed = asyncio.run(fan_out(targets, ['1.jpg', '2.jpg', '3.jpg'], window=0.05))
+    print(f"{len(client.sent)} send_file calls in {elapsed:.2f}s, max {client.max_in_flight} in flight")
+    assert all(results)
+    assert sorted(client.sent) == [(target, ['1.jpg', '2.jpg', '3.jpg']) for target in targets]
+    assert client.max_in_flight == 4
+    # One window plus one (parallel) upload, not four sequential uploads
+    assert elapsed < 0.05 + 2 * client.delay
+    print("✓ One album per target, sent concurrently")
+
+
+def test_in_flight_bound_and_album_size():
+    async def run():
+        client = SlowClient(delay=0.01)
+        dispatcher = DeliveryDispatcher(client, max_in_flight=2, coalesce_window=10, max_album=2)
+        futures = [dispatcher.submit(f'@{n}', image) for n in range(4) for image in ('1.jpg', '2.jpg', '3.jpg')]
+        await dispatcher.flush()
+        return client, [future.result() for future in futures]
+
+    client, results = asyncio.run(run())
+    assert all(results) and client.max_in_flight == 2
+    # Full albums go out right away; flush sends the single leftovers
+    assert sorted(map(str, client.sent)) == sorted(map(str, [(f'@{n}', ['1.jpg', '2.jpg']) for n in range(4)]
+                                                       + [(f'@{n}', '3.jpg') for n in range(4)]))
+    print("✓ Albums are capped and at most max_in_flight sends run at once")
+
+
+if __name__ == "__main__":
+    print("Testing delivery...")
+    test_routing_rules()
+    test_albums_and_fan_out()
+    test_in_flight_bound_and_album_size()
+    print("✓ Delivery tests passed")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test near-duplicate screenshot detection: re-compressed copies match, other stores do not.
+"""
+
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from image_hash import PerceptualHashIndex, image_signature
+from synthetic_screenshots import render_screenshot
+
+
+def save(image, directory, name, quality=90):
+    path = Path(directory) / name
+    image.save(path, quality=quality)
+    return str(path)
+
+
+def test_near_duplicates_found():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = PerceptualHashIndex()
+        original = render_screenshot("Crystal Shop", (1080, 2340), random.Random(1))
+        index.add(image_signature(save(original, tmp, "original.jpg")), "Crystal Shop")
+
+        # Telegram re-compression at a lower resolution, and a copy with the bottom cut off
+        smaller = original.resize((720, 1560))
+        cropped = original.crop((0, 0, 1080, 2200))
+        for name, image in (("smaller.jpg", smaller), ("cropped.jpg", cropped)):
+            found, value, distance = index.find(image_signature(save(image, tmp, name, quality=60)))
+            print(f"{name}: found={found} value={value} distance={distance}")
+            assert found and value == "Crystal Shop"
+
+        # Same layout, different store
+        other = render_screenshot("Moonlight Outlet", (1080, 2340), random.Random(1))
+        found, value, _ = index.find(image_signature(save(other, tmp, "other.jpg")))
+        assert not found, f"Different store matched {value}"
+        print("✓ Near-duplicates reuse the earlier result; other stores do not match")
+
+
+def test_index_bounds():
+    index = PerceptualHashIndex(max_entries=2, ttl=0.05)
+    with tempfile.TemporaryDirectory() as tmp:
+        signatures = [
+            image_signature(save(render_screenshot(name, (1080, 2340), random.Random(i)), tmp, f"{i}.jpg"))
+            for i, name in enumerate(["Alpha Store", "Beta Market", "Gamma Goods"])
+        ]
+    for signature, value in zip(signatures, ["Alpha", "Beta", "Gamma"]):
+        index.add(signature, value)
+    assert len(index) == 2 and not index.find(signatures[0])[0]
+    print("✓ Oldest entry evicted beyond max_entries")
+
+    time.sleep(0.1)
+    assert not index.find(signatures[2])[0] and len(index) == 0
+    print("✓ Entries expire after the TTL")
+
+
+if __name__ == "__main__":
+    test_near_duplicates_found()
+    test_index_bounds()
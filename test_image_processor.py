@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Test ImageProcessor without EasyOCR: preprocessing, the low-confidence
+fallback and two-phase recognition against fake backends.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from ocr_backends import OCRBackend
+from temu_extractor_easyocr import ImageProcessor
+
+# (x_min, x_max, y_min, y_max) boxes and their text, as laid out in a store header
+HEADER = [
+    ((10, 300, 10, 50), "Crystal Shop"),
+    ((400, 480, 15, 45), "Follow"),
+    ((10, 120, 60, 80), "1.2K Sold"),
+    ((130, 250, 60, 80), "Following"),
+] + [((10, 300, 200 + 20 * i, 214 + 20 * i), f"Listing {i}") for i in range(10)]
+
+# The same header with the anchors far below the store name, outside the anchor zone
+DISTANT_ANCHORS = [
+    ((10, 300, 10, 50), "Crystal Shop"),
+] + [((10, 300, 200 + 20 * i, 216 + 20 * i), f"Listing {i}") for i in range(6)] + [
+    ((10, 120, 340, 352), "1.2K Sold"),
+    ((130, 250, 340, 352), "Following"),
+]
+
+
+class TwoPhaseBackend(OCRBackend):
+    """Reads text from a fixed layout, either all at once or box by box."""
+
+    supports_two_phase = True
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.texts = {box: text for box, text in layout}
+
+    @staticmethod
+    def result(box, text):
+        x_min, x_max, y_min, y_max = box
+        return ([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]], text, 0.9)
+
+    def readtext(self, image, batch_size=1):
+        return [self.result(box, text) for box, text in self.layout]
+
+    def detect(self, image):
+        return [[list(box) for box, _ in self.layout]], [[]]
+
+    def recognize(self, image, horizontal_list, free_list, batch_size=1):
+        return [self.result(tuple(box), self.texts[tuple(box)]) for box in horizontal_list]
+
+
+def screenshot(directory):
+    path = os.path.join(directory, "screenshot.png")
+    Image.new('RGB', (600, 1600), 'white').save(path)
+    return path
+
+
+def read(path, layout, two_phase):
+    processor = ImageProcessor(backend=TwoPhaseBackend(layout), two_phase=two_phase, downscale=1.0)
+    return processor.process_image(path), processor
+
+
+def test_two_phase_matches_readtext():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = screenshot(tmp)
+        for layout in (HEADER, DISTANT_ANCHORS):
+            full, _ = read(path, layout, two_phase=False)
+            store_name, processor = read(path, layout, two_phase=True)
+            assert store_name == full == "Crystal Shop"
+            assert processor.boxes_detected == len(layout)
+        print("✓ Two-phase OCR finds the same store name as a full read")
+
+
+def test_early_stop():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = screenshot(tmp)
+        _, processor = read(path, HEADER, two_phase=True)
+        # The top 3 boxes plus the anchor zone confirm the store name in one round
+        assert processor.boxes_recognized == 4 < processor.boxes_detected
+        print(f"✓ Confirmed anchors stop recognition early "
+              f"({processor.boxes_recognized}/{processor.boxes_detected} boxes)")
+
+        _, processor = read(path, DISTANT_ANCHORS, two_phase=True)
+        assert processor.boxes_recognized == len(DISTANT_ANCHORS)
+        print("✓ Distant anchors are found in later rounds")
+
+
+def test_top_k_must_be_positive():
+    backend = TwoPhaseBackend(HEADER)
+    for top_k in (0, -1):
+        try:
+            ImageProcessor(backend=backend, top_k=top_k)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"top_k={top_k} should be rejected")
+
+    processor = ImageProcessor(backend=backend, top_k=2)
+    try:
+        processor.configure({'top_k': 0, 'crop_percent': 50})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("configure() should reject top_k=0")
+    assert processor.top_k == 2 and processor.crop_percent == ImageProcessor.CROP_TOP_PERCENT
+    print("✓ top_k below 1 is rejected and the running settings kept")
+
+
+class ConfidenceBackend(OCRBackend):
+    """Reads the store name with low confidence from images narrower than ``sharp_width``."""
+
+    def __init__(self, sharp_width):
+        self.sharp_width = sharp_width
+        self.widths = []
+
+    def readtext(self, image, batch_size=1):
+        self.widths.append(image.shape[1])
+        confidence = 0.9 if image.shape[1] >= self.sharp_width else 0.3
+        return [([[10, 10], [300, 10], [300, 50], [10, 50]], "Crystal Shop", confidence),
+                ([[130, 60], [250, 60], [250, 80], [130, 80]], "Following", 0.9)]
+
+
+def gradient(directory, low=100, high=140):
+    """A dim, low-contrast RGB screenshot with a horizontal luma gradient."""
+    path = os.path.join(directory, "gradient.png")
+    row = np.linspace(low, high, 400).astype(np.uint8)
+    pixels = np.repeat(np.tile(row, (400, 1))[:, :, None], 3, axis=2)
+    pixels[:, :, 2] //= 2  # Tint it so grayscale differs from any channel
+    Image.fromarray(pixels).save(path)
+    return path
+
+
+def test_choose_scale():
+    processor = ImageProcessor(backend=ConfidenceBackend(0))
+    scale = processor.choose_scale(1440)
+    assert abs(1440 * processor.TEXT_HEIGHT_RATIO * scale - processor.target_text_height) < 1e-6
+    assert processor.choose_scale(600) == 1.0, "small images are never enlarged"
+
+    processor.target_text_height = 8
+    assert processor.choose_scale(1440) == processor.MIN_OCR_WIDTH / 1440, "never below MIN_OCR_WIDTH"
+    processor.downscale = 0.5
+    assert processor.choose_scale(1440) == 0.5
+    print(f"✓ A 1440px-wide screenshot is scaled by {scale:.2f} so its store name is 32px tall")
+
+
+def test_grayscale_and_contrast():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = gradient(tmp)
+        processor = ImageProcessor(backend=ConfidenceBackend(0), downscale=1.0, crop_top=False,
+                                   grayscale=False, contrast=False)
+        original, scale, size = processor.preprocess(path)
+        assert original.shape == (400, 400, 3) and scale == 1.0 and size == (400, 400)
+
+        processor.grayscale = True
+        gray, _, _ = processor.preprocess(path)
+        assert gray.ndim == 2 and gray.dtype == np.uint8
+        assert 50 <= gray.min() and gray.max() <= 140
+
+        processor.contrast = True
+        stretched, _, _ = processor.preprocess(path)
+        assert stretched.ndim == 2 and stretched.dtype == np.uint8
+        # Percentiles come from whole-number luma bins, so the darkest pixels land just above 0
+        assert stretched.min() <= 5 and stretched.max() == 255
+
+        processor.grayscale = False
+        color, _, _ = processor.preprocess(path)
+        assert color.shape == (400, 400, 3) and color.min() == 0 and color.max() == 255
+
+        # Flat or already high-contrast images are left alone
+        flat = np.full((10, 10), 128, dtype=np.float32)
+        assert ImageProcessor._stretch_contrast(flat, flat) is flat
+    print(f"✓ Grayscale gives one channel; contrast stretching widens "
+          f"{gray.min()}-{gray.max()} to {stretched.min()}-{stretched.max()}")
+
+
+def test_low_confidence_fallback():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "screenshot.png")
+        Image.new('RGB', (1440, 2560), 'white').save(path)
+
+        backend = ConfidenceBackend(sharp_width=1440)
+        processor = ImageProcessor(backend=backend)
+        assert processor.process_image(path) == "Crystal Shop"
+        assert backend.widths == [round(1440 * processor.choose_scale(1440)), 1440]
+        assert processor.fallbacks == 1
+        print("✓ A weak downscaled read is repeated at full resolution and counted")
+
+        backend = ConfidenceBackend(sharp_width=0)
+        processor = ImageProcessor(backend=backend)
+        processor.process_image(path)
+        assert len(backend.widths) == 1 and processor.fallbacks == 0
+
+        backend = ConfidenceBackend(sharp_width=1440)
+        processor = ImageProcessor(backend=backend, min_confidence=0)
+        processor.process_image(path)
+        assert len(backend.widths) == 1 and processor.fallbacks == 0
+        print("✓ Confident reads, and min_confidence 0, need no second read")
+
+
+if __name__ == "__main__":
+    print("Testing ImageProcessor...")
+    test_choose_scale()
+    test_grayscale_and_contrast()
+    test_low_confidence_fallback()
+    test_two_phase_matches_readtext()
+    test_early_stop()
+    test_top_k_must_be_positive()
+    print("✓ ImageProcessor tests passed")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Test the queue-based logging setup: JSON output, correlation IDs and rate limiting.
+"""
+
+import io
+import json
+import logging
+
+from log_setup import configure_logging, correlation_context, shutdown_logging
+
+
+def test_json_lines_with_correlation_and_rate_limit():
+    """Records are JSON lines tagged with the correlation ID; rate limited events are capped."""
+    stream = io.StringIO()
+    configure_logging(level='INFO', json_format=True, rate=0.001, burst=3, stream=stream)
+    logger = logging.getLogger('test_log_setup')
+    try:
+        with correlation_context('chat:42'):
+            logger.info("Image sent to %s", "@someone", extra={'keyword': 'Crystal'})
+        for i in range(10):
+            logger.info("New message: %s", i, extra={'rate_key': 'new_message'})
+        logger.debug("Filtered out by level")
+    finally:
+        shutdown_logging()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    print(f"Logged {len(lines)} lines")
+    assert lines[0]['msg'] == "Image sent to @someone"
+    assert lines[0]['correlation_id'] == 'chat:42'
+    assert lines[0]['keyword'] == 'Crystal'
+    assert len([line for line in lines if line['msg'].startswith("New message")]) == 3
+    assert not any(line['level'] == 'DEBUG' for line in lines)
+
+
+if __name__ == "__main__":
+    test_json_lines_with_correlation_and_rate_limit()
+    print("✓ Logging tests passed")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the metrics registry and its Prometheus text rendering.
+"""
+
+import urllib.request
+
+from metrics import Counter, Gauge, Histogram, MetricsServer, Registry
+
+
+def test_counter_gauge_histogram():
+    """Values are recorded per label set and rendered in the exposition format."""
+    registry = Registry()
+    sends = Counter('test_sends_total', 'Sends', registry=registry)
+    depth = Gauge('test_queue_depth', 'Depth', ['queue'], registry=registry)
+    latency = Histogram('test_stage_seconds', 'Latency', ['stage'], buckets=(0.1, 1.0), registry=registry)
+
+    sends.inc()
+    sends.inc(2)
+    depth.labels('ocr').inc()
+    depth.labels('ocr').dec()
+    depth.labels('fetched').set(5)
+    latency.labels('ocr').observe(0.05)
+    latency.labels('ocr').observe(0.5)
+    latency.labels('ocr').observe(3)
+
+    text = registry.render()
+    print(text)
+    assert 'test_sends_total 3' in text
+    assert 'test_queue_depth{queue="ocr"} 0' in text
+    assert 'test_queue_depth{queue="fetched"} 5' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="0.1"} 1' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="1.0"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="+Inf"} 3' in text
+    assert 'test_stage_seconds_count{stage="ocr"} 3' in text
+
+
+def test_metrics_server():
+    """The endpoint serves the registry over HTTP."""
+    registry = Registry()
+    Counter('test_served_total', 'Served', registry=registry).inc()
+    server = MetricsServer(0, registry=registry).start()
+    try:
+        body = urllib.request.urlopen(server.url, timeout=5).read().decode()
+    finally:
+        server.stop()
+    assert 'test_served_total 1' in body
+
+
+if __name__ == "__main__":
+    test_counter_gauge_histogram()
+    test_metrics_server()
+    print("✓ Metrics tests passed")
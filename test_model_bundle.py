@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test model bundle manifests: checksums are recorded and tampering is detected.
+"""
+
+import tempfile
+from pathlib import Path
+
+from exceptions import OCRError
+from model_bundle import verified_file, verify_manifest, write_manifest
+
+
+def test_manifest_round_trip_and_tampering():
+    with tempfile.TemporaryDirectory() as model_dir:
+        weights = Path(model_dir) / "craft_mlt_25k.pth"
+        weights.write_bytes(b"detector weights")
+        write_manifest(model_dir, ['en'])
+
+        manifest = verify_manifest(model_dir, ['en'])
+        print(f"Verified files: {list(manifest['files'])}")
+        assert list(manifest['files']) == ["craft_mlt_25k.pth"]
+
+        try:
+            verify_manifest(model_dir, ['en', 'th'])
+            raise AssertionError("Missing language was not detected")
+        except OCRError as e:
+            print(f"✓ Missing language detected: {e}")
+
+        weights.write_bytes(b"tampered weights")
+        try:
+            verify_manifest(model_dir, ['en'])
+            raise AssertionError("Checksum mismatch was not detected")
+        except OCRError as e:
+            print(f"✓ Tampering detected: {e}")
+
+
+def test_generated_files_must_be_in_the_manifest():
+    with tempfile.TemporaryDirectory() as model_dir:
+        cache = Path(model_dir) / "quantized" / "recognizer-int8-0123.pt"
+        cache.parent.mkdir()
+        cache.write_bytes(b"quantized module")
+
+        # Outside a bundle nothing vouches for the file: anyone who can write it could write a checksum too
+        assert not verified_file(model_dir, cache)
+        print("✓ Generated files outside a bundle are not trusted")
+
+        (Path(model_dir) / "craft_mlt_25k.pth").write_bytes(b"detector weights")
+        write_manifest(model_dir, ['en'])
+        assert verified_file(model_dir, cache)
+        cache.write_bytes(b"replaced module")
+        assert not verified_file(model_dir, cache)
+        (Path(model_dir) / "manifest.json").write_text('{"files": {}}')
+        cache.write_bytes(b"quantized module")
+        assert not verified_file(model_dir, cache)
+        print("✓ In a bundle, generated files must be listed in the manifest")
+
+
+if __name__ == "__main__":
+    test_manifest_round_trip_and_tampering()
+    test_generated_files_must_be_in_the_manifest()
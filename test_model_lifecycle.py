@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test unloading idle OCR models: idle timeout, memory ceiling, transparent reload and prefetch.
+"""
+
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from model_lifecycle import ModelWatcher, current_rss, release_memory
+from ocr_backends import OCRBackend
+from temu_extractor_easyocr import ImageProcessor
+
+HEADER = [
+    ([[10, 10], [300, 10], [300, 50], [10, 50]], "Crystal Shop", 0.95),
+    ([[10, 60], [120, 60], [120, 80], [10, 80]], "1.2K Sold", 0.9),
+    ([[130, 60], [250, 60], [250, 80], [130, 80]], "Following", 0.9),
+]
+
+
+class HeavyBackend(OCRBackend):
+    """Stands in for EasyOCR: holds a large buffer while loaded."""
+
+    def __init__(self):
+        self.weights = bytearray(64 * 1024 * 1024)
+
+    def readtext(self, image, batch_size=1):
+        return HEADER
+
+
+class Factory:
+    def __init__(self):
+        self.created = 0
+
+    def __call__(self):
+        self.created += 1
+        return HeavyBackend()
+
+
+def screenshot(directory):
+    path = os.path.join(directory, "screenshot.png")
+    Image.new('RGB', (600, 400), 'white').save(path)
+    return path
+
+
+def test_idle_unload_and_reload():
+    factory = Factory()
+    with tempfile.TemporaryDirectory() as tmp:
+        image = screenshot(tmp)
+        processor = ImageProcessor(backend=factory, idle_timeout=0.2, two_phase=False)
+        assert processor.process_image(image) == "Crystal Shop"
+
+        deadline = time.monotonic() + 5
+        while processor.loaded and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not processor.loaded and processor.unloads == 1
+
+        # The next image loads the models again
+        assert processor.process_image(image) == "Crystal Shop"
+        assert factory.created == 2 and processor.loads == 2
+        processor.watcher.stop()
+    print("✓ Idle models are unloaded and reloaded by the next image")
+
+
+def test_prefetch_and_busy_processor():
+    factory = Factory()
+    processor = ImageProcessor(backend=factory, two_phase=False)
+    watcher = ModelWatcher(processor, idle_timeout=0)
+    processor._in_use = 1  # Reading an image
+    assert watcher.check() is None and processor.loaded
+    processor._in_use = 0
+    assert watcher.check() == 'idle' and not processor.loaded
+
+    processor.prefetch()
+    processor._prefetching.join(5)
+    assert processor.loaded and factory.created == 2
+
+    # Backends passed as instances cannot be recreated, so they stay loaded
+    fixed = ImageProcessor(backend=HeavyBackend(), two_phase=False)
+    assert not fixed.unload() and fixed.loaded
+    print("✓ Busy or fixed backends stay loaded; prefetch reloads in the background")
+
+
+def test_rss_ceiling():
+    processor = ImageProcessor(backend=Factory(), two_phase=False)
+    rss = current_rss()
+    if rss is None:
+        print("- No /proc on this platform, skipping the memory ceiling check")
+        return
+    watcher = ModelWatcher(processor, max_rss_mb=rss / 1024 / 1024 / 2)
+    assert watcher.check() == 'rss' and not processor.loaded
+    release_memory()
+    watcher = ModelWatcher(processor, max_rss_mb=(current_rss() / 1024 / 1024) * 4)
+    processor.prefetch()
+    processor._prefetching.join(5)
+    assert watcher.check() is None and processor.loaded
+    print("✓ Models are unloaded above the memory ceiling")
+
+
+if __name__ == "__main__":
+    print("Testing OCR model lifecycle...")
+    test_idle_unload_and_reload()
+    test_prefetch_and_busy_processor()
+    test_rss_ceiling()
+    print("✓ OCR model lifecycle tests passed")
@@ -27,19 +27,29 @@ def test_meta_parsing():
         def __init__(self, content):
             self.content = content
             self.status_code = 200
+            self.headers = {}
         
         def raise_for_status(self):
             pass
+        
+        def iter_content(self, chunk_size=1):
+            for start in range(0, len(self.content), chunk_size):
+                yield self.content[start:start + chunk_size]
+        
+        def close(self):
+            pass
     
     # Create an instance of the extractor
     extractor = TemuKeywordExtractor()
     
-    # Patch the session.get method to return our mock HTML
+    # Patch the session.get and session.head methods to return our mock HTML
     original_get = extractor.session.get
+    original_head = extractor.session.head
     def mock_get(url, **kwargs):
         return MockResponse(html_content.encode('utf-8'))
     
     extractor.session.get = mock_get
+    extractor.session.head = mock_get
     
     # Test the extraction
     try:
@@ -52,8 +62,44 @@ def test_meta_parsing():
     except Exception as e:
         print(f"✗ Test failed with error: {e}")
     
-    # Restore original method
+    # Restore original methods
     extractor.session.get = original_get
+    extractor.session.head = original_head
+
+
+def test_streamed_share_title():
+    """Test that share_title is found in a streamed body without reading all of it."""
+    html_content = (b'<html><body>' + b' ' * 1000 +
+                    b'<a href="https://www.temu.com/mall.html?share_title=Crystal%20shop&amp;refer=1">Open</a>' +
+                    b'<p>filler</p>' * 100000 + b'</body></html>')
+    
+    class StreamingResponse:
+        def __init__(self, status_code=200, headers=None):
+            self.status_code = status_code
+            self.headers = headers or {}
+            self.bytes_read = 0
+        
+        def raise_for_status(self):
+            pass
+        
+        def iter_content(self, chunk_size=1):
+            for start in range(0, len(html_content), chunk_size):
+                self.bytes_read += chunk_size
+                yield html_content[start:start + chunk_size]
+        
+        def close(self):
+            pass
+    
+    extractor = TemuKeywordExtractor(chunk_size=256)
+    page = StreamingResponse()
+    extractor.session.head = lambda url, **kwargs: StreamingResponse(200)
+    extractor.session.get = lambda url, **kwargs: page
+    
+    result = extractor.extract_first_keyword("https://share.temu.com/test123")
+    print(f"Streamed result: {result} after {page.bytes_read} of {len(html_content)} bytes")
+    assert result == "Crystal"
+    assert page.bytes_read < 4096
+    print("✓ Streaming test passed: stopped reading once share_title was found")
 
 
 def test_invalid_url():
@@ -74,4 +120,6 @@ if __name__ == "__main__":
     print("Testing TemuKeywordExtractor module...")
     test_meta_parsing()
     print()
+    test_streamed_share_title()
+    print()
     test_invalid_url()
\ No newline at end of file
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test the OCR backend helpers that need no OCR engine: Tesseract TSV parsing and cascade escalation.
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+
+from ocr_backends import CascadeBackend, OCRBackend, TesseractBackend
+from ocr_benchmark import run_configuration, set_threads
+from temu_extractor_easyocr import ImageProcessor
+from test_model_lifecycle import HEADER
+
+TSV = (
+    "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+    "1\t1\t0\t0\t0\t0\t0\t0\t400\t200\t-1\t\n"
+    "5\t1\t1\t1\t1\t1\t10\t20\t50\t30\t96\tCrystal\n"
+    "5\t1\t1\t1\t1\t2\t65\t22\t40\t28\t90\tShop\n"
+    "5\t1\t2\t1\t1\t1\t10\t70\t40\t10\t80\tSold\n"
+    "5\t1\t2\t1\t1\t2\t60\t70\t10\t10\t-1\t \n"
+)
+
+
+class StaticBackend(OCRBackend):
+    def __init__(self, results):
+        self.results = results
+        self.calls = 0
+
+    def readtext(self, image, batch_size=1):
+        self.calls += 1
+        return self.results
+
+
+def test_parse_tsv_groups_words_into_lines():
+    results = TesseractBackend.parse_tsv(TSV)
+    print(f"Parsed: {results}")
+    assert [text for _, text, _ in results] == ["Crystal Shop", "Sold"]
+    bbox, _, confidence = results[0]
+    assert bbox == [[10, 20], [105, 20], [105, 50], [10, 50]]
+    assert abs(confidence - 0.93) < 1e-6
+    print("✓ Tesseract words grouped into readtext-style lines")
+
+
+def test_cascade_escalates_only_when_rejected():
+    fast = StaticBackend([([[0, 0], [1, 0], [1, 1], [0, 1]], "Sold", 0.9)])
+    created = []
+
+    def slow():
+        created.append(True)
+        return StaticBackend([([[0, 0], [1, 0], [1, 1], [0, 1]], "Following", 0.99)])
+
+    cascade = CascadeBackend([fast, slow], accept=lambda results: results[0][1] == "Sold")
+    assert cascade.readtext(None)[0][1] == "Sold"
+    assert not created, "Slow backend should not be loaded before it is needed"
+
+    cascade.accept = lambda results: results[0][1] == "Following"
+    assert cascade.readtext(None)[0][1] == "Following"
+    assert created and cascade.escalations == [0, 1]
+    print("✓ Cascade loads and escalates to the slow backend only on rejection")
+
+
+def test_benchmark_threads_only_for_torch_backends():
+    # Tesseract benchmarks run on installs without torch
+    assert set_threads('tesseract', 2) is False
+    try:
+        import torch  # noqa: F401
+    except ImportError:
+        assert set_threads('easyocr', 2) is False
+    print("✓ Torch threads are only set for backends running on torch")
+
+
+def test_benchmark_counts_escalations_per_backend():
+    cascade = CascadeBackend([StaticBackend([]), StaticBackend([]), StaticBackend(HEADER)])
+    processor = ImageProcessor(backend=cascade, two_phase=False)
+    config = {'backend': 'cascade', 'quantize': True, 'crop_percent': 25, 'downscale': 1.0, 'grayscale': True,
+              'contrast': True, 'two_phase': False, 'batch_size': 1, 'threads': 1}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "screenshot.png")
+        Image.new('RGB', (600, 400), 'white').save(path)
+        processor.process_image(path)  # Escalations before the run are not counted
+        result = run_configuration(processor, [(path, "Crystal Shop")], config, repeat=2)
+    assert result['exact_accuracy'] == 1.0
+    assert result['escalations'] == [2, 2]
+    print("✓ The benchmark reports the images escalated to each later backend")
+
+
+if __name__ == "__main__":
+    test_parse_tsv_groups_words_into_lines()
+    test_cascade_escalates_only_when_rejected()
+    test_benchmark_threads_only_for_torch_backends()
+    test_benchmark_counts_escalations_per_backend()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test the shared OCR server: both transports, shared memory, batching and errors.
+"""
+
+import os
+import signal
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from exceptions import InvalidImageError, OCRError
+from ocr_server import OCRClient, OCRServer, serve_until_signalled
+
+
+class FakeProcessor:
+    """Reads the store name from the image width; narrow images are not store screenshots."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def process_image(self, image):
+        self.calls += 1
+        time.sleep(self.delay)
+        with Image.open(image) as img:
+            width = img.size[0]
+        if width < 50:
+            raise InvalidImageError("No validation keywords found")
+        if width == 99:
+            raise RuntimeError("engine crashed")
+        return f"Store {width}"
+
+
+def save_image(directory, width):
+    path = Path(directory) / f"image_{width}.png"
+    Image.new('RGB', (width, 20)).save(path)
+    return str(path)
+
+
+def test_transports_and_errors():
+    with tempfile.TemporaryDirectory() as tmp:
+        server = OCRServer(FakeProcessor()).start_engine()
+        host, port = server.serve_http(0)[:2]
+        socket_path = os.path.join(tmp, "ocr.sock")
+        server.serve_unix(socket_path)
+        try:
+            for client in (OCRClient(f"http://{host}:{port}"), OCRClient(f"unix:{socket_path}"),
+                           OCRClient(f"unix:{socket_path}", shared_memory=True)):
+                assert client.process_image(save_image(tmp, 120)) == "Store 120"
+                try:
+                    client.process_image(save_image(tmp, 10))
+                    assert False, "expected InvalidImageError"
+                except InvalidImageError:
+                    pass
+                try:
+                    client.process_image(save_image(tmp, 99))
+                    assert False, "expected OCRError"
+                except OCRError:
+                    pass
+            assert client.health()['ready']
+        finally:
+            server.stop()
+    print("✓ HTTP, Unix socket and shared memory requests return store names and validation results")
+
+
+def test_requests_are_batched():
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = FakeProcessor(delay=0.01)
+        server = OCRServer(processor, max_batch=8, batch_window=0.1).start_engine()
+        socket_path = os.path.join(tmp, "ocr.sock")
+        server.serve_unix(socket_path)
+        paths = [save_image(tmp, 100 + n % 4) for n in range(8)]
+        results = [None] * len(paths)
+
+        def read(index):
+            results[index] = OCRClient(f"unix:{socket_path}").process_image(paths[index])
+
+        try:
+            threads = [threading.Thread(target=read, args=(index,)) for index in range(len(paths))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            server.stop()
+        print(f"{len(paths)} requests in {server.batches} batch(es), {processor.calls} OCR runs")
+        assert results == [f"Store {100 + n % 4}" for n in range(8)]
+        # Concurrent requests share a batch and identical images are read once
+        assert server.batches < len(paths)
+        assert processor.calls < len(paths)
+    print("✓ Concurrent requests from several clients are batched")
+
+
+class FakeCalibration:
+    def __init__(self):
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_sigterm_stops_server():
+    with tempfile.TemporaryDirectory() as tmp:
+        server = OCRServer(FakeProcessor()).start_engine()
+        host, port = server.serve_http(0)[:2]
+        client = OCRClient(f"http://{host}:{port}")
+        assert client.process_image(save_image(tmp, 120)) == "Store 120"
+
+        calibration = FakeCalibration()
+        handler = signal.getsignal(signal.SIGTERM)
+        threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        serve_until_signalled(server, calibration)
+        assert calibration.flushes == 1
+        assert signal.getsignal(signal.SIGTERM) is handler
+        try:
+            OCRClient(f"http://{host}:{port}", timeout=2).process_image(save_image(tmp, 120))
+            assert False, "the server should no longer accept requests"
+        except OCRError:
+            pass
+    print("✓ SIGTERM stops the server and saves the calibration")
+
+
+if __name__ == "__main__":
+    print("Testing OCR server...")
+    test_transports_and_errors()
+    test_requests_are_batched()
+    test_sigterm_stops_server()
+    print("✓ OCR server tests passed")
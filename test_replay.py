@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test the offline replay harness: fake client, stub Temu server and the real pipeline.
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+from replay import StubTemuServer, build_replay_monitor
+from temu_keyword_extractor import TemuKeywordExtractor
+
+
+def test_stub_server_redirect():
+    """The stub server should answer share links like share.temu.com does."""
+    with StubTemuServer({'AbCdEfGhIjK': 'Crystal Shop'}) as server:
+        extractor = TemuKeywordExtractor(endpoint=server.url)
+        keyword = extractor.extract_first_keyword("https://share.temu.com/AbCdEfGhIjK")
+        print(f"Keyword from stub server: {keyword}")
+        assert keyword == "Crystal"
+
+
+async def replay_matching_image():
+    with tempfile.TemporaryDirectory() as workdir:
+        image = Path(workdir) / "screenshot.jpg"
+        Image.new('RGB', (100, 200)).save(image)
+        records = [
+            {'id': 1, 'text': "https://share.temu.com/AbCdEfGhIjK", 'share_title': "Crystal Shop"},
+            {'id': 2, 'image': str(image), 'store_name': "Crystal Shop"},
+            {'id': 3, 'image': str(image), 'store_name': None},
+        ]
+        images_dir = Path(workdir) / "images"
+        with StubTemuServer() as server:
+            monitor, client, titles = build_replay_monitor(records, images_dir, server.url, ocr_stub=True)
+            server.titles.update(titles)
+            while not client.exhausted:
+                await monitor.fetch_recent_messages()
+        return monitor, client
+
+
+def test_replay_sends_matching_image():
+    """A screenshot whose store name matches an earlier share link is forwarded once."""
+    monitor, client = asyncio.run(replay_matching_image())
+    print(f"Pending keywords: {monitor.pending_keywords}, sent: {client.sent}")
+    assert monitor.pending_keywords == {"Crystal"}
+    assert len(client.sent) == 1
+    assert client.sent[0][1].endswith("image_2.jpg")
+
+
+async def replay_after_group_change(workdir):
+    image = Path(workdir) / "screenshot.jpg"
+    Image.new('RGB', (100, 200)).save(image)
+    images_dir = Path(workdir) / "images"
+    cache_file = Path(workdir) / "pipeline_cache.json"
+    with StubTemuServer() as server:
+        first_group = [
+            {'id': 1, 'text': "https://share.temu.com/AbCdEfGhIjK", 'share_title': "Crystal Shop"},
+            {'id': 2, 'image': str(image), 'store_name': "Crystal Shop"},
+        ]
+        monitor, client, titles = build_replay_monitor(first_group, images_dir, server.url, ocr_stub=True,
+                                                       cache_file=cache_file)
+        server.titles.update(titles)
+        while not client.exhausted:
+            await monitor.fetch_recent_messages()
+        monitor.save_caches()
+
+        monitor, _, _ = build_replay_monitor([], images_dir, server.url, cache_file=cache_file)
+        assert list(monitor.ocr_cache.values()) == ["Crystal Shop"]
+
+        # Another group reuses the message IDs, and so the image file names
+        second_group = [
+            {'id': 1, 'text': "https://share.temu.com/ZyXwVuTsRqP", 'share_title': "Garden Shop"},
+            {'id': 2, 'image': str(image), 'store_name': "Garden Shop"},
+        ]
+        monitor, client, titles = build_replay_monitor(second_group, images_dir, server.url, ocr_stub=True,
+                                                       group_id=2, cache_file=cache_file)
+        assert monitor.ocr_cache == {}
+        server.titles.update(titles)
+        while not client.exhausted:
+            await monitor.fetch_recent_messages()
+        return monitor, client
+
+
+def test_ocr_cache_is_per_group():
+    """A restart on another group re-reads images instead of using the old group's store names."""
+    with tempfile.TemporaryDirectory() as workdir:
+        monitor, client = asyncio.run(replay_after_group_change(workdir))
+    assert list(monitor.ocr_cache.values()) == ["Garden Shop"]
+    assert len(client.sent) == 1 and client.sent[0][1].endswith("image_2.jpg")
+    print("✓ Cached OCR results are only reused for the group they were read in")
+
+
+if __name__ == "__main__":
+    print("Testing replay harness...")
+    test_stub_server_redirect()
+    test_replay_sends_matching_image()
+    test_ocr_cache_is_per_group()
+    print("✓ Replay harness tests passed")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test learned store name regions: buckets, minimum samples and persistence.
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from roi_calibration import RegionCalibration
+
+
+def test_region_learned_after_min_samples():
+    calibration = RegionCalibration(None, min_samples=3, margin=0.02)
+    assert calibration.region_for(1080, 2340) is None
+
+    for top in (0.10, 0.11, 0.12):
+        calibration.record(1080, 2340, [(0.05, top, 0.5, top + 0.02), (0.05, 0.14, 0.4, 0.15)])
+
+    region = calibration.region_for(1080, 2340)
+    print(f"Learned region: {region}")
+    assert region[0] == 0.0 and region[2] == 1.0
+    assert abs(region[1] - 0.08) < 1e-6 and abs(region[3] - 0.17) < 1e-6
+
+    # A different layout is calibrated separately
+    assert calibration.region_for(1080, 1920) is None
+    print("✓ Region learned per aspect ratio bucket")
+
+
+def test_calibration_persists():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "roi_calibration.json"
+        calibration = RegionCalibration(path, min_samples=1)
+        calibration.record(1440, 3120, [(0.05, 0.1, 0.5, 0.12)])
+
+        reloaded = RegionCalibration(path, min_samples=1)
+        assert reloaded.region_for(1440, 3120) == calibration.region_for(1440, 3120)
+        print(f"✓ Calibration reloaded from {path.name}: {reloaded.buckets}")
+
+
+def test_saved_when_the_region_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "roi_calibration.json"
+        calibration = RegionCalibration(path, min_samples=2)
+        calibration.record(1080, 2340, [(0.05, 0.10, 0.5, 0.12)])
+        assert not path.exists()  # Not calibrated yet, nothing to save
+        calibration.record(1080, 2340, [(0.05, 0.11, 0.5, 0.13)])
+        assert len(json.loads(path.read_text())["2.15"]) == 2
+
+        # Inside the learned band: the region stays, so the file is not rewritten
+        calibration.record(1080, 2340, [(0.05, 0.11, 0.5, 0.12)])
+        assert len(json.loads(path.read_text())["2.15"]) == 2
+        calibration.flush()
+        assert len(json.loads(path.read_text())["2.15"]) == 3
+
+        # A wider band is saved right away
+        calibration.record(1080, 2340, [(0.05, 0.08, 0.5, 0.12)])
+        assert len(json.loads(path.read_text())["2.15"]) == 4
+    print("✓ Calibration is written when a region changes, other samples on flush")
+
+
+if __name__ == "__main__":
+    test_region_learned_after_min_samples()
+    test_calibration_persists()
+    test_saved_when_the_region_changes()
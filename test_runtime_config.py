@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Test reloading the runtime configuration and applying it without a restart.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import signal
+import tempfile
+import time
+from pathlib import Path
+
+import main
+
+from delivery import DeliveryConfig
+from exceptions import ConfigError
+from replay import build_replay_monitor
+from runtime_config import ConfigWatcher, ResizableSemaphore, RuntimeConfig
+from temu_extractor_easyocr import ImageProcessor
+from test_model_lifecycle import Factory
+
+
+def write(path, data):
+    Path(path).write_text(data if isinstance(data, str) else json.dumps(data))
+
+
+def test_load_and_validate():
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        config_file, targets_file, group_file = workdir / "runtime.json", workdir / "targets.json", workdir / "group.json"
+
+        config = RuntimeConfig.load(config_file, targets_file, group_file)
+        assert config.chats is None and config.monitored_chats == [] and config.poll_interval == 300
+        print("✓ Missing files give the defaults")
+
+        write(group_file, {'group_id': -1001})
+        write(targets_file, {'default_targets': ['@alice'], 'rules': [{'keywords': ['shoe*'], 'targets': ['@bob']}]})
+        write(config_file, {'poll_interval': 60, 'delivery_concurrency': 2, 'ocr': {'min_confidence': 0.7}})
+        config = RuntimeConfig.load(config_file, targets_file, group_file)
+        assert config.monitored_chats == ['-1001']
+        assert config.delivery.default_targets == ['@alice'] and config.delivery.targets_for('Shoe Shop') == ['@bob']
+        assert config.poll_interval == 60.0 and config.delivery_concurrency == 2
+        assert config.ocr == {'min_confidence': 0.7}
+
+        write(config_file, {'chats': [-1001, '-1002'], 'delivery': {'default_targets': ['@carol']}})
+        config = RuntimeConfig.load(config_file, targets_file, group_file)
+        assert config.monitored_chats == ['-1001', '-1002'] and config.delivery.default_targets == ['@carol']
+        print("✓ Chats and targets come from the runtime config when set there")
+
+        for invalid in ('{"poll_interval": ', {'poll_interval': 0}, {'delivery_concurrency': 1.5},
+                        {'chats': '-1001'}, {'ocr': {'downscale': -1}}, {'ocr': {'languages': ['en']}},
+                        {'ocr': {'grayscale': 1}}, ['not', 'an', 'object']):
+            write(config_file, invalid)
+            try:
+                RuntimeConfig.load(config_file, targets_file, group_file)
+            except ConfigError as e:
+                print(f"  rejected: {e}")
+            else:
+                raise AssertionError(f"{invalid!r} should be rejected")
+        print("✓ Invalid configurations are rejected")
+
+
+def test_ocr_setting_bounds():
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        config_file = workdir / "runtime.json"
+        load = lambda: RuntimeConfig.load(config_file, workdir / "targets.json", workdir / "group.json")
+
+        for valid in ({'min_confidence': 0}, {'min_confidence': 1}, {'downscale': 1}, {'downscale': 0.01},
+                      {'crop_percent': 100}, {'crop_percent': 0.5}, {'top_k': 1}, {'threads': 1}):
+            write(config_file, {'ocr': valid})
+            assert load().ocr == valid, valid
+        print("✓ Edge values are accepted, including min_confidence 0 to turn the fallback off")
+
+        for invalid in ({'min_confidence': -0.1}, {'min_confidence': 1.5}, {'downscale': 0}, {'downscale': 1.5},
+                        {'crop_percent': 0}, {'crop_percent': 101}, {'top_k': 0}, {'top_k': 1.5},
+                        {'threads': 0}, {'min_confidence': float('nan')}):
+            write(config_file, {'ocr': invalid})
+            try:
+                load()
+            except ConfigError as e:
+                print(f"  rejected: {e}")
+            else:
+                raise AssertionError(f"{invalid!r} should be rejected")
+        print("✓ OCR settings outside their range are rejected")
+
+
+async def watch_changes(workdir):
+    config_file, targets_file, group_file = workdir / "runtime.json", workdir / "targets.json", workdir / "group.json"
+    write(config_file, {'poll_interval': 60})
+    watcher = ConfigWatcher(config_file, interval=0.02, delivery_path=targets_file, selected_group_file=group_file)
+    applied = []
+
+    async def listener(config):
+        applied.append(config)
+
+    watcher.subscribe(listener)
+    watcher.start()
+    try:
+        write(config_file, {'poll_interval': 120})
+        await asyncio.sleep(0.2)
+        assert [config.poll_interval for config in applied] == [120.0] and watcher.reloads == 1
+        print("✓ A changed file is reloaded and passed to the listeners")
+
+        write(group_file, {'group_id': 42})
+        await asyncio.sleep(0.2)
+        assert applied[-1].monitored_chats == ['42']
+        print("✓ Selecting another group is picked up too")
+
+        write(config_file, '{"poll_interval": 30,')
+        await asyncio.sleep(0.2)
+        assert len(applied) == 2 and watcher.config.poll_interval == 120.0
+        assert await watcher.reload() is False
+        print("✓ A broken file is rejected and the running configuration kept")
+
+        write(config_file, {'poll_interval': 120})
+        assert await watcher.reload() is True and len(applied) == 2
+        print("✓ Reloads that change nothing do not notify the listeners")
+    finally:
+        watcher.stop()
+
+
+def test_watcher():
+    with tempfile.TemporaryDirectory() as workdir:
+        asyncio.run(watch_changes(Path(workdir)))
+
+
+async def resize_semaphore():
+    semaphore = ResizableSemaphore(2)
+    await semaphore.acquire()
+    await semaphore.acquire()
+    semaphore.resize(1)
+    semaphore.release()  # Retired, the remaining holder still has the only slot
+    assert semaphore.locked()
+    semaphore.release()
+    assert not semaphore.locked()
+
+    await semaphore.acquire()
+    waiter = asyncio.create_task(semaphore.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    semaphore.resize(2)
+    await asyncio.wait_for(waiter, 1)
+    semaphore.release()
+    semaphore.release()
+    assert semaphore._value == 2
+    print("✓ Semaphores grow right away and shrink as slots are released")
+
+
+def test_resizable_semaphore():
+    asyncio.run(resize_semaphore())
+
+
+async def apply_to_monitor(workdir):
+    monitor, client, _ = build_replay_monitor([], workdir / "images", "http://127.0.0.1:9", defer_ocr=True)
+    monitor.pending_keywords.add('kept shop')
+    get_entity = client.get_entity
+
+    async def entity(chat):
+        if str(chat) == '3':
+            raise ValueError("No such chat")
+        return await get_entity(chat)
+
+    client.get_entity = entity
+
+    config = RuntimeConfig(chats=['2'], poll_interval=0.5, delivery_concurrency=2, album_window=0.1,
+                           ocr_concurrency=3, deferred_window=60,
+                           delivery=DeliveryConfig.from_dict({'default_targets': ['@bob']}))
+    monitor.apply_config(config)
+    assert monitor.poll_interval == 0.5 and monitor.delivery.default_targets == ['@bob']
+    assert monitor.dispatcher._semaphore.size == 2 and monitor.dispatcher.coalesce_window == 0.1
+    assert monitor._ocr_lock.size == 3 and monitor.deferred.window == 60
+    assert monitor._next_group == '2' and monitor._reconfigured.is_set()
+    print("✓ Poll interval, targets and pool sizes apply in place")
+
+    monitor.seen_message_ids.add(7)
+    assert await monitor.switch_group('2')
+    assert monitor.target_group_chat_id == 2 and monitor._next_group is None
+    assert 7 not in monitor.seen_message_ids and 'kept shop' in monitor.pending_keywords
+    assert not await monitor.switch_group('3')
+    assert monitor.target_group_chat_id == 2
+    print("✓ Switching chats keeps pending keywords; an unknown chat is refused")
+
+
+def test_configure_image_processor():
+    factory = Factory()
+    processor = ImageProcessor(backend=factory, crop_percent=40, two_phase=False)
+    processor.configure({'crop_percent': 25, 'min_confidence': 0.8, 'idle_timeout': 60})
+    assert processor.crop_percent == 25 and processor.min_confidence == 0.8
+    assert processor.watcher is not None and processor.watcher.idle_timeout == 60
+    processor.configure({'idle_timeout': 30})
+    assert processor.crop_percent == 40 and processor.watcher.idle_timeout == 30
+    assert factory.created == 1 and processor.loads == 1
+    processor.watcher.stop()
+    print("✓ OCR settings change without reloading the models; removed settings revert")
+
+
+def test_forward_signal():
+    process = multiprocessing.get_context('spawn').Process(target=time.sleep, args=(30,))
+    process.start()
+    kill = main.os.kill
+    try:
+        # A worker that exits between listing and signalling is skipped
+        def exited(pid, sig):
+            raise ProcessLookupError(pid)
+
+        main.os.kill = exited
+        main.forward_signal(signal.SIGHUP)
+    finally:
+        main.os.kill = kill
+    main.forward_signal(signal.SIGTERM)
+    process.join(timeout=10)
+    assert process.exitcode == -signal.SIGTERM
+    print("✓ Signals are forwarded to the worker processes")
+
+
+def test_monitor_apply_config():
+    with tempfile.TemporaryDirectory() as workdir:
+        asyncio.run(apply_to_monitor(Path(workdir)))
+
+
+if __name__ == "__main__":
+    print("Testing the runtime configuration...")
+    test_load_and_validate()
+    test_ocr_setting_bounds()
+    test_watcher()
+    test_resizable_semaphore()
+    test_configure_image_processor()
+    test_forward_signal()
+    test_monitor_apply_config()
+    print("✓ Runtime configuration tests passed")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test group selection: dialog filtering, search, non-interactive queries and the dialog cache.
+"""
+
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+
+import select_group
+from select_group import fetch_groups, group_info, resolve_query, search_groups, select_target_group
+
+
+def dialog(name, id, kind='megagroup'):
+    entity = SimpleNamespace(id=abs(id) % 10 ** 10, megagroup=kind == 'megagroup')
+    return SimpleNamespace(name=name, id=id, entity=entity, is_group=kind in ('group', 'megagroup'),
+                           is_channel=kind in ('channel', 'megagroup'), is_user=kind == 'user')
+
+
+DIALOGS = [
+    dialog("Alice", 111, 'user'),
+    dialog("Temu Deals", -1001234567890),
+    dialog("Temu Deals Archive", -1009999999999),
+    dialog("Family", -4242, 'group'),
+    dialog("News", -1005555555555, 'channel'),
+]
+
+
+class FakeDialogClient:
+    def __init__(self, dialogs):
+        self.dialogs = dialogs
+        self.read = 0
+
+    async def iter_dialogs(self, **kwargs):
+        for item in self.dialogs:
+            self.read += 1
+            yield item
+
+
+def test_filter_and_search():
+    groups = [info for info in map(group_info, DIALOGS) if info]
+    assert [group['name'] for group in groups] == ["Temu Deals", "Temu Deals Archive", "Family", "News"]
+    assert groups[0]['full_id'] == -1001234567890 and 'full_id' not in groups[2]
+
+    assert [group['name'] for group in search_groups(groups, "deals")] == ["Temu Deals", "Temu Deals Archive"]
+    assert [group['name'] for group in search_groups(groups, "temu deals archive")] == ["Temu Deals Archive"]
+    assert [group['name'] for group in search_groups(groups, "4242")] == ["Family"]
+    print("✓ Only groups and channels are kept and searched by name or ID")
+
+
+def test_resolve_query():
+    groups = [info for info in map(group_info, DIALOGS) if info]
+    assert resolve_query(groups, "Temu Deals") == -1001234567890  # Exact name wins over the longer one
+    assert resolve_query(groups, "archive") == -1009999999999
+    assert resolve_query(groups, "temu") is None  # Ambiguous
+    assert resolve_query(groups, "nothing like it") is None
+    assert resolve_query(groups, "-1007777") == -1007777  # Unknown IDs are taken as entered
+    print("✓ Non-interactive queries select exactly one group")
+
+
+def test_streaming_stops_at_exact_id():
+    client = FakeDialogClient(DIALOGS)
+    groups, complete = asyncio.run(fetch_groups(client, exact="-1001234567890"))
+    assert not complete and client.read == 2 and groups[-1]['name'] == "Temu Deals"
+    client = FakeDialogClient(DIALOGS)
+    groups, complete = asyncio.run(fetch_groups(client))
+    assert complete and len(groups) == 4
+    print("✓ Dialogs are streamed and reading stops at an exact ID")
+
+
+def test_cached_selection():
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            groups = [info for info in map(group_info, DIALOGS) if info]
+            select_group.save_dialog_cache(groups, 'session_name')
+            # Answered from the cache without contacting Telegram
+            assert asyncio.run(select_target_group("news")) == -1005555555555
+            assert select_group.load_selected_group() == -1005555555555
+            assert select_group.load_dialog_cache('other_session') is None
+            assert select_group.load_dialog_cache('session_name', max_age=-1) is None
+        finally:
+            os.chdir(cwd)
+    print("✓ Repeat runs select from the dialog cache")
+
+
+if __name__ == "__main__":
+    print("Testing group selection...")
+    test_filter_and_search()
+    test_resolve_query()
+    test_streaming_stops_at_exact_id()
+    test_cached_selection()
+    print("✓ Group selection tests passed")
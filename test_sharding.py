@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Test sharded monitoring: consistent hashing, lease takeover and cross-process dedup
+with fake Telegram clients.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from PIL import Image
+
+from coordination import CoordinationStore, ShardCoordinator
+from replay import StubTemuServer, build_messages, build_replay_monitor
+from sharding import HashRing, ShardWorker, run_worker
+import telegram_client  # noqa: F401  (imported up front so slow first imports don't expire test leases)
+
+CHATS = [str(-1000 - n) for n in range(6)]
+
+
+def chat_records(chat, image):
+    """A share link, its screenshot, and a screenshot of the next chat's store."""
+    n = CHATS.index(chat)
+    return [
+        {'id': 1, 'text': f"https://share.temu.com/Shard{n}Code0", 'share_title': f"Store{n} Shop"},
+        {'id': 2, 'image': image, 'store_name': f"Store{n} Shop"},
+        {'id': 3, 'image': image, 'store_name': f"Store{(n + 1) % len(CHATS)} Shop"},
+    ]
+
+
+class FakeMonitorFactory:
+    """Replay monitors for the test chats; every send_file call is appended to ``sends_log``."""
+
+    def __init__(self, workdir, endpoint, latency=0.0):
+        self.workdir = Path(workdir)
+        self.endpoint = endpoint
+        self.latency = latency
+
+    def __call__(self, chat, coordinator):
+        records = chat_records(chat, str(self.workdir / "screenshot.jpg"))
+        images_dir = self.workdir / coordinator.worker_id / chat
+        images_dir.mkdir(parents=True, exist_ok=True)
+        monitor, client, _ = build_replay_monitor(
+            records, images_dir, self.endpoint, ocr_stub=True, latency=self.latency,
+            group_id=int(chat), coordinator=coordinator, dedupe_images=False, defer_ocr=False)
+        monitor.poll_interval = 0.05
+        send_file = client.send_file
+        sends_log = self.workdir / "sends.log"
+
+        async def logged_send_file(entity, file, **kwargs):
+            await send_file(entity, file, **kwargs)
+            with sends_log.open('a') as f:
+                for path in file if isinstance(file, list) else [file]:
+                    f.write(f"{coordinator.worker_id}\t{chat}\t{path}\n")
+
+        client.send_file = logged_send_file
+        return monitor
+
+
+def share_titles():
+    titles = {}
+    for chat in CHATS:
+        titles.update(build_messages(chat_records(chat, "unused.jpg"))[1])
+    return titles
+
+
+def read_sends(workdir):
+    log = Path(workdir) / "sends.log"
+    if not log.exists():
+        return []
+    return [line.split('\t') for line in log.read_text().splitlines()]
+
+
+def test_hash_ring_moves_few_keys():
+    keys = [str(n) for n in range(1000)]
+    three = HashRing(['w0', 'w1', 'w2'])
+    two = HashRing(['w0', 'w1'])
+    owners = [three.node_for(key) for key in keys]
+    assert all(owners.count(node) > 200 for node in ('w0', 'w1', 'w2'))
+    # Only the keys of the removed worker move
+    moved = [key for key in keys if three.node_for(key) != two.node_for(key)]
+    assert all(three.node_for(key) == 'w2' for key in moved)
+    print("✓ Consistent hashing balances chats and only moves the lost worker's")
+
+
+async def locked_store(workdir):
+    store_path = Path(workdir) / "coordination.db"
+    coordinator = ShardCoordinator(CoordinationStore(store_path), "w0")
+    # Another worker holds the write lock for half a second
+    other = sqlite3.connect(str(store_path), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    asyncio.get_running_loop().call_later(0.5, other.execute, "COMMIT")
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticking = asyncio.create_task(ticker())
+    claimed = await coordinator.claim_message(-1000, 1)
+    await coordinator.register_keyword("Store0")
+    await coordinator.refresh_keywords()
+    ticking.cancel()
+    other.close()
+    coordinator.store.close()
+    return claimed, coordinator.keywords(), ticks
+
+
+def test_store_calls_do_not_block_the_loop():
+    with tempfile.TemporaryDirectory() as workdir:
+        claimed, keywords, ticks = asyncio.run(locked_store(workdir))
+    print(f"Event loop ticked {ticks} times while waiting for the write lock")
+    assert claimed and keywords == ["Store0"]
+    assert ticks >= 20
+    print("✓ Waiting for another worker's write lock does not stall the event loop")
+
+
+def test_store_pruning():
+    with tempfile.TemporaryDirectory() as workdir:
+        store = CoordinationStore(Path(workdir) / "coordination.db")
+        store._execute("INSERT INTO keywords VALUES (?, ?)", ("Old", time.time() - 3600))
+        store.register_keyword("Newer")
+        store.register_keyword("Newest")
+        assert store.keywords(max_age=600) == ["Newer", "Newest"] and store.keywords(limit=1) == ["Newest"]
+
+        for message_id in range(1, 31):
+            store.claim_message(-1000, message_id, "w0")
+        for message_id in range(1, 6):
+            store.claim_message(-1001, message_id, "w0")
+        store.prune(600, messages_per_chat=10)
+        rows = store._execute("SELECT chat_id, message_id FROM messages").fetchall()
+        store_keywords = store.keywords()
+        store.close()
+    assert sorted(m for chat, m in rows if chat == "-1000") == list(range(21, 31))
+    assert sorted(m for chat, m in rows if chat == "-1001") == list(range(1, 6))
+    assert store_keywords == ["Newer", "Newest"]
+    print("✓ The shared store forgets expired keywords and each chat's oldest messages")
+
+
+async def takeover(workdir, endpoint):
+    store_path = Path(workdir) / "coordination.db"
+    factory = FakeMonitorFactory(workdir, endpoint)
+    workers = [ShardWorker(f"w{n}", CHATS, store_path, factory, heartbeat_interval=0.05, lease_ttl=0.3)
+               for n in range(2)]
+    for worker in workers:
+        worker.store.heartbeat(worker.worker_id)
+    for worker in workers:
+        await worker.rebalance()
+    owned = [set(worker.monitors) for worker in workers]
+    assert owned[0] | owned[1] == set(CHATS) and not owned[0] & owned[1]
+    await asyncio.sleep(0.3)
+
+    # w1 dies without releasing anything; w0 takes its chats once the leases expire
+    for monitor, task in workers[1].monitors.values():
+        task.cancel()
+    await asyncio.sleep(0.4)
+    await workers[0].rebalance()
+    assert set(workers[0].monitors) == set(CHATS)
+    await asyncio.sleep(0.3)
+    await workers[0].stop()
+
+
+def test_lease_takeover():
+    with tempfile.TemporaryDirectory() as workdir, StubTemuServer(share_titles()) as server:
+        Image.new('RGB', (100, 200)).save(Path(workdir) / "screenshot.jpg")
+        asyncio.run(takeover(workdir, server.url))
+        sent = [path for _, _, path in read_sends(workdir)]
+        print(f"{len(sent)} images sent after takeover")
+        # Every store went out exactly once although w0 replayed w1's chats
+        assert len(sent) == len(CHATS)
+    print("✓ A dead worker's chats are taken over without duplicate sends")
+
+
+class StubbornMonitor:
+    """A monitor whose fetch cycle ignores stop requests, like one stuck in a slow OCR batch."""
+
+    def __init__(self, chat, coordinator):
+        self.client = SimpleNamespace(is_connected=lambda: False)
+        self.ingesting = asyncio.Event()
+        self.saved = False
+
+    async def connect_and_authorize(self):
+        pass
+
+    async def resolve_target_entity(self):
+        return object()
+
+    async def fetch_recent_messages_periodically(self):
+        await asyncio.sleep(3600)
+
+    def request_stop(self):
+        pass
+
+    async def flush_deliveries(self):
+        pass
+
+    def save_caches(self):
+        pass
+
+    def save_state(self):
+        self.saved = True
+
+
+async def slow_handover(workdir):
+    worker = ShardWorker("w0", CHATS, Path(workdir) / "coordination.db", StubbornMonitor,
+                         heartbeat_interval=0.1, lease_ttl=1.0)
+    assert worker.stop_timeout == 0.45
+    await worker.rebalance()
+    assert set(worker.monitors) == set(CHATS)
+
+    # Handing a chat over does not hold up the heartbeat
+    worker.chats = CHATS[1:]
+    started = time.monotonic()
+    await worker.rebalance()
+    assert time.monotonic() - started < 0.2
+    assert CHATS[0] in worker._handovers and CHATS[0] not in worker.monitors
+    monitors = [monitor for monitor, _ in worker.monitors.values()]
+    await asyncio.sleep(0.6)
+    assert not worker._handovers and worker.store.lease_holder(CHATS[0]) is None
+
+    # All chats stop at once
+    started = time.monotonic()
+    await worker.stop()
+    elapsed = time.monotonic() - started
+    assert all(monitor.saved for monitor in monitors)
+    return elapsed
+
+
+def test_slow_handover():
+    with tempfile.TemporaryDirectory() as workdir:
+        elapsed = asyncio.run(slow_handover(workdir))
+    print(f"Stopped {len(CHATS) - 1} stuck chats in {elapsed:.2f}s")
+    assert elapsed < 1.0
+    print("✓ Stuck chats are stopped in the background, together and before their leases expire")
+
+
+def test_worker_processes():
+    """Three worker processes, one killed midway: each store is forwarded exactly once."""
+    with tempfile.TemporaryDirectory() as workdir, StubTemuServer(share_titles()) as server:
+        Image.new('RGB', (100, 200)).save(Path(workdir) / "screenshot.jpg")
+        store_path = Path(workdir) / "coordination.db"
+        factory = FakeMonitorFactory(workdir, server.url, latency=0.05)
+        context = multiprocessing.get_context('spawn')
+        processes = [
+            context.Process(target=run_worker, args=(f"w{n}", CHATS, str(store_path)),
+                            kwargs={'monitor_factory': factory, 'duration': 4, 'log_level': 'WARNING',
+                                    'heartbeat_interval': 0.1, 'lease_ttl': 0.5})
+            for n in range(3)
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(1.5)
+        os.kill(processes[2].pid, signal.SIGKILL)
+        for process in processes:
+            process.join(timeout=20)
+
+        sends = read_sends(workdir)
+        keywords = CoordinationStore(store_path).sent_keywords()
+        print(f"{len(sends)} sends by {sorted({worker for worker, _, _ in sends})}, keywords: {sorted(keywords)}")
+        assert sorted(keywords) == sorted(f"Store{n}" for n in range(len(CHATS)))
+        assert len(sends) == len(CHATS)
+    print("✓ Workers split the chats and never forward a store twice")
+
+
+if __name__ == "__main__":
+    print("Testing sharded monitoring...")
+    test_hash_ring_moves_few_keys()
+    test_store_calls_do_not_block_the_loop()
+    test_store_pruning()
+    test_lease_takeover()
+    test_slow_handover()
+    test_worker_processes()
+    print("✓ Sharding tests passed")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test graceful shutdown: signal handling, draining, partial downloads and resuming from saved state.
+"""
+
+import asyncio
+import os
+import signal
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from coordination import CoordinationStore
+from main import run_until_signalled
+from replay import StubTemuServer, build_messages, build_replay_monitor
+from sharding import run_shards
+from test_sharding import CHATS, FakeMonitorFactory, share_titles
+
+STORES = 12
+
+
+def records(image):
+    """A share link followed by its store's screenshot, for every store."""
+    result = []
+    for n in range(STORES):
+        result.append({'id': 2 * n + 1, 'text': f"https://share.temu.com/Stop{n:02d}Code0", 'share_title': f"Store{chr(65 + n)} Shop"})
+        result.append({'id': 2 * n + 2, 'image': image, 'store_name': f"Store{chr(65 + n)} Shop"})
+    return result
+
+
+def sent_files(client):
+    return [path for _, file in client.sent for path in (file if isinstance(file, list) else [file])]
+
+
+def build_monitor(workdir, endpoint, state_file):
+    monitor, client, _ = build_replay_monitor(
+        records(str(Path(workdir) / "screenshot.jpg")), Path(workdir) / "images", endpoint,
+        ocr_stub=True, latency=0.05, state_file=state_file, dedupe_images=False)
+    monitor.poll_interval = 0.05
+    return monitor, client
+
+
+async def stop_and_resume(workdir, endpoint):
+    state_file = Path(workdir) / "monitor_state.json"
+
+    # First run: SIGTERM arrives while the first fetch cycle is still being processed
+    monitor, client = build_monitor(workdir, endpoint, state_file)
+    asyncio.get_running_loop().call_later(0.3, os.kill, os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(run_until_signalled(monitor, monitor.start(), shutdown_timeout=5), 10)
+    first_sent = sent_files(client)
+    first_seen = set(monitor.seen_message_ids)
+    assert not client.is_connected()
+    assert state_file.exists()
+    assert 0 < len(first_seen) < 2 * STORES, "the signal should interrupt the fetch cycle"
+
+    # Second run resumes from the saved state and only handles the rest
+    monitor, client = build_monitor(workdir, endpoint, state_file)
+    assert monitor.seen_message_ids == first_seen
+    processed = []
+    process_message = monitor.process_message
+
+    async def recording_process_message(message, send=True):
+        processed.append(message.id)
+        await process_message(message, send)
+
+    monitor.process_message = recording_process_message
+    await monitor.connect_and_authorize()
+    while not client.exhausted:
+        await monitor.fetch_recent_messages()
+    await monitor.stop(timeout=5)
+    second_sent = sent_files(client)
+    return first_seen, first_sent, processed, second_sent
+
+
+def test_stop_and_resume():
+    with tempfile.TemporaryDirectory() as workdir:
+        Image.new('RGB', (100, 200)).save(Path(workdir) / "screenshot.jpg")
+        titles = build_messages(records("unused.jpg"))[1]
+        with StubTemuServer(titles) as server:
+            first_seen, first_sent, processed, second_sent = asyncio.run(stop_and_resume(workdir, server.url))
+        print(f"First run handled {len(first_seen)} messages and sent {len(first_sent)} images; "
+              f"second run handled {len(processed)} and sent {len(second_sent)}")
+        # No message handled twice, none lost, and every store forwarded exactly once
+        assert not first_seen & set(processed)
+        assert first_seen | set(processed) == set(range(1, 2 * STORES + 1))
+        sent = first_sent + second_sent
+        assert sorted(sent) == sorted([str(Path(workdir) / "images" / f"image_{2 * n + 2}.jpg") for n in range(STORES)])
+    print("✓ SIGTERM stops ingestion at a message boundary and a restart resumes without reprocessing")
+
+
+class StalledDownloadClient:
+    """Writes part of the file, then never finishes."""
+
+    async def download_media(self, media, file=None):
+        Path(file).write_bytes(b"partial")
+        await asyncio.sleep(3600)
+
+
+async def interrupted_download(workdir):
+    images_dir = Path(workdir) / "images"
+    monitor, _, _ = build_replay_monitor([], images_dir, "http://127.0.0.1:9", state_file=None)
+    monitor.client = StalledDownloadClient()
+    message = type("Message", (), {'id': 7, 'media': object()})()
+    task = asyncio.create_task(monitor.download_image(message, str(images_dir / "image_7.jpg")))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return images_dir
+
+
+def test_interrupted_download_leaves_no_file():
+    with tempfile.TemporaryDirectory() as workdir:
+        images_dir = asyncio.run(interrupted_download(workdir))
+        assert list(images_dir.iterdir()) == []
+
+        # Partial files left by a crash are removed on startup
+        (images_dir / "image_8.jpg.part").write_bytes(b"partial")
+        build_replay_monitor([], images_dir, "http://127.0.0.1:9", state_file=None)
+        assert list(images_dir.iterdir()) == []
+    print("✓ Interrupted downloads leave no truncated images behind")
+
+
+def test_sharded_shutdown():
+    """Stopping run_shards sends SIGTERM to the workers, which release their chats and exit."""
+    with tempfile.TemporaryDirectory() as workdir, StubTemuServer(share_titles()) as server:
+        Image.new('RGB', (100, 200)).save(Path(workdir) / "screenshot.jpg")
+        store_path = str(Path(workdir) / "coordination.db")
+        stopping = threading.Event()
+        thread = threading.Thread(target=run_shards, args=(CHATS, ['s0', 's1'], store_path), kwargs={
+            'restart_delay': 0.1, 'stopping': stopping, 'stop_timeout': 20,
+            'monitor_factory': FakeMonitorFactory(workdir, server.url), 'log_level': 'WARNING',
+            'heartbeat_interval': 0.1, 'lease_ttl': 2.0})
+        thread.start()
+
+        store = CoordinationStore(store_path)
+        deadline = time.monotonic() + 30
+        while not all(store.lease_holder(chat) for chat in CHATS) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert all(store.lease_holder(chat) for chat in CHATS), "the workers should claim every chat"
+
+        started = time.monotonic()
+        stopping.set()
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+        print(f"Workers stopped in {time.monotonic() - started:.1f}s")
+        # Released on the way out rather than left to expire: the workers ran their stop()
+        assert store.live_workers(60) == []
+        assert not any(store.lease_holder(chat) for chat in CHATS)
+        store.close()
+    print("✓ Sharded workers stop gracefully on SIGTERM and hand their chats back")
+
+
+if __name__ == "__main__":
+    print("Testing graceful shutdown...")
+    test_stop_and_resume()
+    test_interrupted_download_leaves_no_file()
+    test_sharded_shutdown()
+    print("✓ Shutdown tests passed")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test the soak harness and the bounds on the monitor's long-lived state.
+"""
+
+import asyncio
+import tempfile
+
+import telegram_client
+from soak import evaluate, load_pool, run_soak
+from state_store import BoundedSet, newest_entries
+
+
+def fake_samples(rss, p95):
+    return [{'messages': (n + 1) * 10_000, 'rss_mb': rss(n), 'traced_mb': None,
+             'latency': {'p95_ms': p95(n)}, 'cycle': {'p95_ms': 100.0}} for n in range(20)]
+
+
+def test_evaluate_trends():
+    trends, failures = evaluate(fake_samples(lambda n: 100 + (n % 2) * 0.5, lambda n: 5.0))
+    print(f"Steady: {trends}")
+    assert not failures
+
+    trends, failures = evaluate(fake_samples(lambda n: 100 + n, lambda n: 5.0 + n))
+    print(f"Leaking: {failures}")
+    assert trends['rss_mb_per_100k'] == 10.0
+    assert any(failure.startswith('rss_mb') for failure in failures)
+    assert any(failure.startswith('latency') for failure in failures)
+    print("✓ Memory growth and latency drift fail the soak, noise does not")
+
+
+def test_bounded_state():
+    seen = BoundedSet(3, [1, 2, 3])
+    seen.add(1)  # Re-adding makes it the most recent
+    seen.add(4)
+    assert list(seen) == [3, 1, 4] and 2 not in seen
+    assert seen - {4} == {3, 1} and isinstance(seen - {4}, set)
+    assert newest_entries({'a': 1, 'b': 2, 'c': 3}, 2) == {'b': 2, 'c': 3}
+    print("✓ Bounded sets and caches forget their oldest entries")
+
+
+def test_short_soak():
+    limits = {'MAX_SAVED_MESSAGE_IDS': 500, 'MAX_PENDING_KEYWORDS': 100, 'MAX_CACHE_ENTRIES': 200}
+    saved = {name: getattr(telegram_client, name) for name in limits}
+    for name, value in limits.items():
+        setattr(telegram_client, name, value)
+    try:
+        with tempfile.TemporaryDirectory() as corpus:
+            images = load_pool(corpus, 4, seed=1)
+            results = asyncio.run(run_soak(images, 1500, sample_every=250))
+    finally:
+        for name, value in saved.items():
+            setattr(telegram_client, name, value)
+
+    samples = results['samples']
+    last = samples[-1]
+    print(f"{results['messages']} messages, {results['images_sent']} images sent, last sample: {last['sizes']}")
+    assert results['messages'] == 1500 and len(samples) == 6
+    assert results['images_sent'] > 0
+    assert last['latency']['count'] == 250 and last['traced_mb'] is not None and last['top_allocators']
+    assert last['sizes']['seen_message_ids'] == 500
+    assert last['sizes']['pending_keywords'] <= 100
+    assert last['sizes']['keyword_cache'] <= 200 and last['sizes']['ocr_cache'] <= 200
+    print("✓ The soak samples memory, latency and state sizes, and the state stays bounded")
+
+
+if __name__ == "__main__":
+    print("Testing the soak harness...")
+    test_evaluate_trends()
+    test_bounded_state()
+    test_short_soak()
+    print("✓ Soak tests passed")